@@ -4,8 +4,23 @@ from flask import Blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 # Import API routes
-from . import auth, users, groups, documents
+from . import metrics, compression, auth, users, groups, documents, uploads, bulk, search, autocomplete, pages, previews, storage, db
+from . import qrcodes, workers
 
 # Register API routes
 def init_app(app):
+    metrics.init_app(app)
+    db.init_app(app)
+    storage.init_app(app)
     app.register_blueprint(api_bp)
+
+# Reinitialize per-process state in a freshly forked worker process (see
+# serve.py): pooled database connections, storage clients, the background
+# task pool, in-memory caches and metric values must not be shared with
+# the parent
+def reset_after_fork():
+    db.reset_pool()
+    storage.reset()
+    workers.reset()
+    qrcodes.reset_caches()
+    metrics.reset()
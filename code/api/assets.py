@@ -0,0 +1,62 @@
+import os
+import mimetypes
+from flask import request, jsonify, send_from_directory
+from werkzeug.security import safe_join
+from .files import send_stored_file
+
+# Directory under static/ that build_assets.py writes bundles, fingerprinted
+# assets and rewritten pages to
+ASSET_DIST_DIR = 'dist'
+
+# Pages served from their built version (referencing the bundles) when one
+# exists; otherwise the source page is served
+ASSET_PAGES = ('index.html', 'mobile-viewer.html')
+
+# Precompressed variants written next to built files, in order of
+# preference: (Content-Encoding, file suffix)
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Fingerprinted files never change, pages must be revalidated
+ASSET_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ASSET_PAGE_CACHE_CONTROL = 'no-cache'
+
+
+# Best precompressed variant of path the client accepts.
+# Returns (path, Content-Encoding or None).
+def negotiate_encoding(path):
+    for encoding, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+# Send a built file in the encoding the client prefers
+def send_built_file(path, mimetype, cache_control):
+    file_path, encoding = negotiate_encoding(path)
+    response = send_stored_file(file_path, None, mimetype, cache_control=cache_control)
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
+# Send a file under the static directory: built pages and fingerprinted
+# assets with long-lived caching and precompressed variants, anything else
+# as is
+def send_asset(static_dir, path):
+    dist_dir = os.path.join(static_dir, ASSET_DIST_DIR)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if path in ASSET_PAGES:
+        built_path = os.path.join(dist_dir, path)
+        if os.path.isfile(built_path):
+            return send_built_file(built_path, mimetype, ASSET_PAGE_CACHE_CONTROL)
+    elif path.startswith(ASSET_DIST_DIR + '/'):
+        built_path = safe_join(static_dir, path)
+        if built_path is None or not os.path.isfile(built_path):
+            return jsonify({'error': 'File not found'}), 404
+        cache_control = 'public, max-age={}, immutable'.format(ASSET_IMMUTABLE_MAX_AGE)
+        return send_built_file(built_path, mimetype, cache_control)
+
+    return send_from_directory(static_dir, path)
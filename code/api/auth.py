@@ -1,9 +1,15 @@
 import jwt
+import time
+import hashlib
 import datetime
-import sqlite3
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify, current_app, g
 from . import api_bp
+from .db import get_db
+from .compression import compress
+from . import metrics
 
 # JWT Secret Key
 JWT_SECRET = 'your_jwt_secret_key'  # Change this to a random secret key in production
@@ -11,107 +17,120 @@ JWT_SECRET = 'your_jwt_secret_key'  # Change this to a random secret key in prod
 # Default admin credentials
 DEFAULT_USERNAME = 'admin'
 
-# Database path
-DB_PATH = 'static/documents.db'
-
 # Token expiration time (in minutes)
 TOKEN_EXPIRATION = 30
 
-# Connect to database
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(DB_PATH)
-        g.db.row_factory = sqlite3.Row
-        
-        # Check if tables exist, if not create them
-        cursor = g.db.cursor()
-        
-        # Check if users table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        if not cursor.fetchone():
-            # Create users table
-            cursor.execute('''
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    group_id INTEGER,
-                    role TEXT DEFAULT 'user',
-                    created_by TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create default admin user
-            cursor.execute(
-                'INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                (DEFAULT_USERNAME, 'admin', 'admin')
-            )
-        
-        # Check if user_groups table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_groups'")
-        if not cursor.fetchone():
-            # Create user_groups table
-            cursor.execute('''
-                CREATE TABLE user_groups (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_name TEXT UNIQUE NOT NULL,
-                    description TEXT,
-                    created_by TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-        
-        # Check if documents table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='documents'")
-        if not cursor.fetchone():
-            # Create documents table
-            cursor.execute('''
-                CREATE TABLE documents (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_number TEXT NOT NULL,
-                    filename TEXT NOT NULL,
-                    original_filename TEXT NOT NULL,
-                    inspection_date TEXT NOT NULL,
-                    group_id INTEGER,
-                    uploaded_by INTEGER,
-                    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_visible INTEGER DEFAULT 1
-                )
-            ''')
-            
-        # Commit changes
-        g.db.commit()
-        
-    return g.db
+# Maximum number of verified tokens kept in the decoded-token cache
+TOKEN_CACHE_SIZE = 4096
+
+# LRU of sha256(token) -> verified payload, entries expire with the token
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Bump a user's membership version (call before committing the change)
+def bump_membership_version(cursor, user_id):
+    cursor.execute('UPDATE users SET membership_version = membership_version + 1 WHERE id = ?', (user_id,))
+
+# Build the current user from a verified token payload. The user's
+# membership version is read on every request (one primary key lookup,
+# which also returns the current claims), so changes to a user's group or
+# role, or their deletion, apply immediately in every worker process.
+def load_current_user(payload):
+    cursor = get_db().cursor()
+    cursor.execute('SELECT username, group_id, role, membership_version FROM users WHERE id = ?',
+                   (payload['user_id'],))
+    user = cursor.fetchone()
+    if not user:
+        return None
 
-# Close database connection
-def close_db(e=None):
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    if payload.get('membership_version') == user['membership_version']:
+        # Claims are current
+        return {
+            'id': payload['user_id'],
+            'username': payload['username'],
+            'is_admin': payload['is_admin'],
+            'role': payload['role'],
+            'group_id': payload.get('group_id')
+        }
+
+    # Claims are stale (or from an older token), use the stored ones
+    return {
+        'id': payload['user_id'],
+        'username': user['username'],
+        'is_admin': user['username'] == DEFAULT_USERNAME,
+        'role': user['role'] or 'user',
+        'group_id': user['group_id']
+    }
 
 # Generate JWT token
-def generate_token(user_id, username, is_admin, role):
+def generate_token(user_id, username, is_admin, role, group_id=None, membership_version=0):
     payload = {
         'user_id': user_id,
         'username': username,
         'is_admin': is_admin,
         'role': role,
+        'group_id': group_id,
+        'membership_version': membership_version,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=TOKEN_EXPIRATION)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
 # Verify JWT token
 def verify_token(token):
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    now = time.time()
+
+    # Warm path: token was already verified and has not expired
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+        if payload is not None:
+            if payload['exp'] > now:
+                _token_cache.move_to_end(key)
+                _token_cache_stats['hits'] += 1
+                return payload
+            del _token_cache[key]
+        _token_cache_stats['misses'] += 1
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    # Only verified tokens with an expiry are cached, so entries can never
+    # outlive the token itself
+    if isinstance(payload.get('exp'), (int, float)):
+        with _token_cache_lock:
+            _token_cache[key] = payload
+            _token_cache.move_to_end(key)
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+                _token_cache_stats['evictions'] += 1
+
+    return payload
+
+# Get decoded-token cache counters
+def get_token_cache_stats():
+    with _token_cache_lock:
+        stats = dict(_token_cache_stats)
+        stats['size'] = len(_token_cache)
+    return stats
+
+# Decoded-token cache counters for the metrics endpoint
+def token_cache_metrics():
+    stats = get_token_cache_stats()
+    return [('docnest_jwt_cache_requests_total', (('result', result),), stats[key])
+            for key, result in (('hits', 'hit'), ('misses', 'miss'))]
+
+metrics.register_collector(token_cache_metrics)
+
+# Clear the decoded-token cache (e.g. after rotating JWT_SECRET)
+def clear_token_cache():
+    with _token_cache_lock:
+        _token_cache.clear()
+
 # Token required decorator
 def token_required(f):
     @wraps(f)
@@ -127,17 +146,17 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         # Verify token
+        started = time.perf_counter()
         payload = verify_token(token)
+        metrics.observe('docnest_jwt_verify_seconds', (), time.perf_counter() - started)
         if not payload:
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
-        # Set current user
-        g.current_user = {
-            'id': payload['user_id'],
-            'username': payload['username'],
-            'is_admin': payload['is_admin'],
-            'role': payload['role']
-        }
+        # Set current user from the token claims
+        current_user = load_current_user(payload)
+        if not current_user:
+            return jsonify({'error': 'Token is invalid or expired'}), 401
+        g.current_user = current_user
         
         return f(*args, **kwargs)
     
@@ -165,8 +184,10 @@ def group_admin_required(f):
     
     return decorated
 
-# Login route
+# Login route (not compressed: the body carries the token next to the
+# username sent by the client, see BREACH)
 @api_bp.route('/auth/login', methods=['POST'])
+@compress(enabled=False)
 def login():
     data = request.get_json()
     
@@ -194,7 +215,8 @@ def login():
     role = user['role'] if 'role' in user.keys() else 'user'
     
     # Generate token
-    token = generate_token(user['id'], username, is_admin, role)
+    token = generate_token(user['id'], username, is_admin, role,
+                           user['group_id'], user['membership_version'])
     
     # Return token and user info
     return jsonify({
@@ -214,7 +236,8 @@ def logout():
     # JWT tokens are stateless, so we don't need to do anything server-side
     return jsonify({'message': 'Logout successful'})
 
-# Verify token route
+# Verify token route (returns the user's current claims, which differ from
+# the token's once their membership changed)
 @api_bp.route('/auth/verify', methods=['GET'])
 def verify():
     # Get token from Authorization header
@@ -229,14 +252,19 @@ def verify():
     if not payload:
         return jsonify({'valid': False}), 200
     
+    current_user = load_current_user(payload)
+    if not current_user:
+        return jsonify({'valid': False}), 200
+    g.current_user = current_user
+    
     # Return user info
     return jsonify({
         'valid': True,
         'user': {
-            'id': payload['user_id'],
-            'username': payload['username'],
-            'is_admin': payload['is_admin'],
-            'role': payload['role']
+            'id': current_user['id'],
+            'username': current_user['username'],
+            'is_admin': current_user['is_admin'],
+            'role': current_user['role']
         }
     })
 
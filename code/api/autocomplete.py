@@ -0,0 +1,94 @@
+import re
+from flask import request, jsonify, current_app
+from . import api_bp
+from .db import get_read_db
+from .documents import prefix_upper_bound
+from .throttle import RateLimiter, client_address, retry_after
+
+# Suggestions returned per request
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+# Shortest and longest prefix looked up
+AUTOCOMPLETE_MIN_PREFIX = 2
+AUTOCOMPLETE_MAX_PREFIX = 64
+
+# Inspection dates returned per file number (newest first)
+AUTOCOMPLETE_MAX_DATES = 20
+
+# Per-IP throttling: requests per second after a burst (typing produces a
+# few requests per second; enumeration gets slowed down)
+AUTOCOMPLETE_RATE = 5
+AUTOCOMPLETE_BURST = 20
+
+# Browsers reuse suggestions for a prefix typed again (e.g. after backspace)
+AUTOCOMPLETE_MAX_AGE = 10
+
+_limiter = RateLimiter(AUTOCOMPLETE_RATE, AUTOCOMPLETE_BURST)
+
+
+# Visible file numbers starting with prefix. A range scan over
+# idx_documents_lookup (file_number, inspection_date, is_visible), answered
+# from the index alone.
+def find_file_numbers(cursor, prefix, limit):
+    cursor.execute('''
+        SELECT DISTINCT file_number FROM documents
+        WHERE file_number >= ? AND file_number < ? AND is_visible = 1
+        ORDER BY file_number
+        LIMIT ?
+    ''', (prefix, prefix_upper_bound(prefix), limit))
+    return [row[0] for row in cursor.fetchall()]
+
+# Visible inspection dates of file numbers, newest first
+def find_inspection_dates(cursor, file_numbers):
+    dates = {file_number: [] for file_number in file_numbers}
+    if not file_numbers:
+        return dates
+
+    cursor.execute('''
+        SELECT DISTINCT file_number, inspection_date FROM documents
+        WHERE file_number IN ({}) AND is_visible = 1
+        ORDER BY file_number, inspection_date DESC
+    '''.format(','.join('?' * len(file_numbers))), file_numbers)
+    for file_number, inspection_date in cursor.fetchall():
+        if len(dates[file_number]) < AUTOCOMPLETE_MAX_DATES:
+            dates[file_number].append(inspection_date)
+    return dates
+
+# File number autocomplete route (public, used by the query pages)
+# Query parameters: prefix, limit
+@api_bp.route('/documents/autocomplete', methods=['GET'])
+def autocomplete_file_numbers():
+    wait = _limiter.acquire(client_address())
+    if wait:
+        response = jsonify({'error': 'Too many requests'})
+        response.headers['Retry-After'] = retry_after(wait)
+        return response, 429
+
+    prefix = request.args.get('prefix', '').strip()
+    try:
+        limit = int(request.args.get('limit', AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+    suggestions = []
+    if (AUTOCOMPLETE_MIN_PREFIX <= len(prefix) <= AUTOCOMPLETE_MAX_PREFIX
+            and re.fullmatch(r"[a-zA-Z0-9\-_+]+", prefix)):
+        cursor = get_read_db().cursor()
+
+        # File numbers are matched as stored; try upper case too when the
+        # prefix as typed has no matches
+        file_numbers = find_file_numbers(cursor, prefix, limit)
+        if not file_numbers and prefix != prefix.upper():
+            file_numbers = find_file_numbers(cursor, prefix.upper(), limit)
+
+        if current_app.config.get('AUTOCOMPLETE_DATES', True):
+            dates = find_inspection_dates(cursor, file_numbers)
+            suggestions = [{'file_number': number, 'inspection_dates': dates[number]} for number in file_numbers]
+        else:
+            suggestions = [{'file_number': number} for number in file_numbers]
+
+    response = jsonify({'suggestions': suggestions})
+    response.headers['Cache-Control'] = 'public, max-age={}'.format(AUTOCOMPLETE_MAX_AGE)
+    return response
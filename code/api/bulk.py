@@ -0,0 +1,523 @@
+import io
+import os
+import csv
+import zlib
+import zipfile
+from flask import request, jsonify, g, current_app
+from . import api_bp
+from .auth import token_required
+from .db import get_db, get_thread_db
+from .files import UPLOAD_STAGING_DIR, save_stream
+from .storage import content_filename, get_storage
+from .documents import (DOCUMENT_INSERT, SQL_IN_CHUNK_SIZE, allowed_file, validate_document_fields,
+                        existing_file_numbers, store_content, document_url_templates, document_filter,
+                        qr_base_url)
+from .qrcodes import generate_documents_qr, legacy_qr_path, remove_qr
+from .previews import generate_documents_preview
+from .texts import generate_documents_text
+from .pages import remove_page_cache
+from . import workers
+
+# Most documents accepted per bulk upload
+BULK_MAX_ITEMS = 500
+
+# Largest total uncompressed size of the PDFs in a ZIP archive
+BULK_MAX_ARCHIVE_SIZE = 2 * 1024 * 1024 * 1024
+
+# Manifest columns, and the manifest file name looked for inside a ZIP
+# archive when no separate manifest is sent
+BULK_MANIFEST_COLUMNS = ('filename', 'file_number', 'inspection_date')
+BULK_MANIFEST_NAME = 'manifest.csv'
+
+# Manifest encodings tried in order (Excel in Chinese locales saves GBK)
+BULK_MANIFEST_ENCODINGS = ('utf-8-sig', 'gb18030')
+
+# Documents per background QR code / preview task
+BULK_TASK_SIZE = 50
+
+# ZIP flag bit marking UTF-8 entry names
+ZIP_UTF8_FLAG = 0x800
+
+# Most ids accepted by the bulk delete and visibility routes
+BULK_MAX_IDS = 10000
+
+
+# Parse a CSV manifest into a list of {filename, file_number, inspection_date}
+def read_manifest(data):
+    for encoding in BULK_MANIFEST_ENCODINGS:
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError('Manifest must be UTF-8 or GBK encoded')
+
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None:
+        raise ValueError('Manifest is empty')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+
+    missing = [column for column in BULK_MANIFEST_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ValueError('Manifest is missing columns: {}'.format(', '.join(missing)))
+
+    return [{column: (row.get(column) or '').strip() for column in BULK_MANIFEST_COLUMNS} for row in reader]
+
+# Name of a ZIP entry. Archives made on Windows store names in the local
+# code page without the UTF-8 flag, which Python decodes as CP437.
+def zip_entry_name(info):
+    name = info.filename
+    if not info.flag_bits & ZIP_UTF8_FLAG:
+        try:
+            name = name.encode('cp437').decode('gb18030')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return name
+
+# Find the source of a manifest row by its path, or by its base name when
+# that is unambiguous
+def find_source(sources, filename):
+    if filename in sources:
+        return sources[filename]
+
+    matches = [source for name, source in sources.items() if os.path.basename(name) == os.path.basename(filename)]
+    return matches[0] if len(matches) == 1 else None
+
+# Collect the documents of a bulk upload from the request. Each item has
+# the manifest fields and an open_stream callable (None if the file is
+# missing). Raises ValueError for bad requests and OverflowError for
+# uploads over the limits.
+def read_bulk_request():
+    archive = request.files.get('archive')
+    files = [file for file in request.files.getlist('files') if file.filename]
+    manifest = request.files.get('manifest')
+    rows = None
+
+    if manifest and manifest.filename:
+        rows = read_manifest(manifest.read())
+
+    if archive and archive.filename:
+        try:
+            zf = zipfile.ZipFile(archive.stream)
+        except zipfile.BadZipFile:
+            raise ValueError('Archive is not a valid ZIP file')
+
+        sources = {}
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            name = zip_entry_name(info)
+            if rows is None and os.path.basename(name).lower() == BULK_MANIFEST_NAME:
+                rows = read_manifest(zf.read(info))
+            elif allowed_file(name):
+                sources[name] = (info, lambda info=info: zf.open(info))
+
+        if rows is None:
+            raise ValueError('A manifest is required (manifest part or {} in the archive)'.format(BULK_MANIFEST_NAME))
+
+        # Declared sizes are enforced by zipfile while reading
+        if sum(info.file_size for info, _ in sources.values()) > BULK_MAX_ARCHIVE_SIZE:
+            raise OverflowError('Archive is too large')
+        sources = {name: open_stream for name, (_, open_stream) in sources.items()}
+    elif files:
+        sources = {file.filename: (lambda file=file: file.stream) for file in files}
+
+        # Without a manifest, file_number and inspection_date are repeated
+        # form fields in the same order as the files
+        if rows is None:
+            file_numbers = request.form.getlist('file_number')
+            inspection_dates = request.form.getlist('inspection_date')
+            if len(file_numbers) != len(files) or len(inspection_dates) != len(files):
+                raise ValueError('Send a manifest, or one file_number and inspection_date per file')
+            rows = [
+                {'filename': file.filename, 'file_number': file_number.strip(), 'inspection_date': date.strip()}
+                for file, file_number, date in zip(files, file_numbers, inspection_dates)
+            ]
+    else:
+        raise ValueError('No files')
+
+    if not rows:
+        raise ValueError('Manifest has no documents')
+
+    if len(rows) > BULK_MAX_ITEMS:
+        raise OverflowError('At most {} documents per bulk upload'.format(BULK_MAX_ITEMS))
+
+    return [dict(row, index=index, open_stream=find_source(sources, row['filename']))
+            for index, row in enumerate(rows)]
+
+# Set item errors for invalid fields, missing files and file numbers that
+# repeat within the upload or already exist
+def validate_items(cursor, items):
+    seen = set()
+    for item in items:
+        error = validate_document_fields(item['file_number'], item['inspection_date'])
+        if not error and not allowed_file(item['filename']):
+            error = 'Only PDF files are allowed'
+        if not error and item['open_stream'] is None:
+            error = 'File not found in upload'
+        if not error and item['file_number'] in seen:
+            error = 'File number is repeated in this upload'
+        if error:
+            item['error'] = error
+        seen.add(item['file_number'])
+
+    mark_existing(cursor, items)
+
+# Set item errors for file numbers that already exist in the user's group
+def mark_existing(cursor, items):
+    pending = [item for item in items if not item.get('error')]
+    existing = existing_file_numbers(cursor, [item['file_number'] for item in pending])
+    for item in pending:
+        if item['file_number'] in existing:
+            item['error'] = 'File number already exists in your group'
+
+# Copy the files of valid items to the staging directory, hashing them on
+# the way. A file listed by several items is read once (an uploaded part
+# can't be read again) and its staged copy shared.
+def stage_items(items, staging_dir):
+    staged = {}
+    for item in items:
+        if item.get('error'):
+            continue
+
+        source = item['open_stream']
+        if source not in staged:
+            try:
+                with source() as stream:
+                    staged[source] = save_stream(stream, staging_dir)
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError, ValueError) as e:
+                staged[source] = 'Unable to read file: {}'.format(e)
+
+        if isinstance(staged[source], str):
+            item['error'] = staged[source]
+        else:
+            item['staged_path'], item['digest'] = staged[source]
+
+# Remove the staged files of items
+def remove_staged(items):
+    for item in items:
+        path = item.pop('staged_path', None)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+# Remove content files added by a bulk upload that was rolled back
+def remove_created_content(digests):
+    store = get_storage('uploads')
+    for digest in digests:
+        try:
+            store.delete(content_filename(digest))
+        except Exception as e:
+            print(f"Failed to remove content {digest} of a failed bulk upload: {e}")
+
+# Per-item result as returned to clients
+def item_result(item, view_url, qrcode_url):
+    result = {
+        'index': item['index'],
+        'filename': item['filename'],
+        'file_number': item['file_number'],
+        'inspection_date': item['inspection_date'],
+    }
+    if item.get('document_id'):
+        result['status'] = 'created'
+        result['document'] = {
+            'id': item['document_id'],
+            'view_url': view_url.format(item['document_id']),
+            'qrcode_url': qrcode_url.format(item['document_id'])
+        }
+    else:
+        result['status'] = 'failed'
+        result['error'] = item.get('error') or 'Not uploaded'
+    return result
+
+# Bulk upload route
+# Multipart body, either:
+#   archive  - ZIP of PDFs, with manifest.csv inside or a separate manifest part
+#   files    - several PDF parts, with a manifest part or one file_number and
+#              inspection_date field per file (in the same order)
+# The manifest is CSV with columns filename, file_number, inspection_date.
+# Query parameters: atomic=1 to upload nothing unless every item is valid
+# Returns a per-item report; valid items are uploaded even if others fail.
+@api_bp.route('/documents/bulk', methods=['POST'])
+@token_required
+def bulk_upload_documents():
+    atomic = request.args.get('atomic') in ('1', 'true')
+
+    try:
+        items = read_bulk_request()
+    except OverflowError as e:
+        return jsonify({'error': str(e)}), 413
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db()
+    cursor = conn.cursor()
+    view_url, qrcode_url, _ = document_url_templates()
+
+    # Validate everything before storing anything
+    validate_items(cursor, items)
+
+    def report(status=None):
+        results = [item_result(item, view_url, qrcode_url) for item in items]
+        created = sum(1 for result in results if result['status'] == 'created')
+        if status is None:
+            status = 201 if created == len(results) else 207 if created else 400
+        return jsonify({'created': created, 'failed': len(results) - created, 'results': results}), status
+
+    if atomic and any(item.get('error') for item in items):
+        return report(400)
+
+    staging_dir = os.path.join(current_app.root_path, UPLOAD_STAGING_DIR)
+    try:
+        stage_items(items, staging_dir)
+
+        valid = [item for item in items if not item.get('error')]
+        if atomic and len(valid) < len(items):
+            return report(400)
+
+        created = []
+        try:
+            # Take the write lock before checking file numbers again, so a
+            # concurrent upload can't take one in between
+            conn.execute('BEGIN IMMEDIATE')
+            mark_existing(cursor, valid)
+            valid = [item for item in valid if not item.get('error')]
+            if atomic and len(valid) < len(items):
+                conn.rollback()
+                return report(400)
+
+            group_id = g.current_user['group_id']
+            user_id = g.current_user['id']
+            # One INSERT per row, in the same transaction, to get each id
+            for item in valid:
+                cursor.execute(DOCUMENT_INSERT, (
+                    item['file_number'], content_filename(item['digest']), os.path.basename(item['filename']),
+                    item['inspection_date'], group_id, user_id, item['digest']))
+                item['document_id'] = cursor.lastrowid
+
+            # Items listing the same file share its staged copy. Content new
+            # to the store is remembered, to be removed again on failure.
+            stored = set()
+            for item in valid:
+                path = item['staged_path']
+                if path not in stored:
+                    stored.add(path)
+                    if store_content(path, item['digest']):
+                        created.append(item['digest'])
+            conn.commit()
+        except Exception as e:
+            # Remove the content this request added (never content other
+            # documents already shared) while the write lock still keeps
+            # other uploads from starting to reference it
+            remove_created_content(created)
+            conn.rollback()
+            for item in valid:
+                item.pop('document_id', None)
+                item['error'] = str(e)
+            return report(500)
+    finally:
+        # Files of items that weren't recorded
+        remove_staged(items)
+
+    # Generate QR codes, previews and search text in batches on the
+    # background pool; missing QR codes and thumbnails are generated on
+    # demand, previews and text by the backfill commands
+    document_ids = [item['document_id'] for item in valid]
+    for start in range(0, len(document_ids), BULK_TASK_SIZE):
+        batch = document_ids[start:start + BULK_TASK_SIZE]
+        workers.submit(generate_documents_qr, current_app.root_path, qr_base_url(), batch)
+        workers.submit(generate_documents_preview, current_app.root_path, batch)
+        workers.submit(generate_documents_text, batch)
+
+    return report()
+
+# Parse the target of a bulk delete/visibility request: {"ids": [...]} or
+# {"filter": {file_number, date_from, date_to, group_id, uploaded_by,
+# is_visible}}. Returns (ids, where, params) with ids None for a filter.
+def parse_bulk_target(data):
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids must be a list of integers')
+        if not ids:
+            raise ValueError('ids is empty')
+        if len(ids) > BULK_MAX_IDS:
+            raise OverflowError('At most {} ids per request'.format(BULK_MAX_IDS))
+        return list(dict.fromkeys(ids)), [], []
+
+    conditions = data.get('filter')
+    if not isinstance(conditions, dict):
+        raise ValueError('ids or filter is required')
+    where, params = document_filter(conditions)
+    if not where:
+        # Never act on every document by accident
+        raise ValueError('filter needs at least one condition')
+    return None, where, params
+
+# Select the documents targeted by a bulk request, checking permissions for
+# the whole set at once: admins manage every document, group admins the
+# documents of their group. Returns (documents, ids not found); raises
+# PermissionError if any targeted document is out of scope.
+def select_bulk_targets(cursor, target):
+    ids, where, params = target
+    columns = 'd.id, d.group_id, d.filename, d.content_hash, d.qr_hash'
+
+    group_id = None
+    if not g.current_user['is_admin']:
+        if g.current_user['role'] != 'group_admin':
+            raise PermissionError('Only administrators can manage documents')
+        group_id = g.current_user['group_id']
+        if not group_id:
+            raise PermissionError('You do not have permission to manage these documents')
+
+    if ids is None:
+        # A filter only ever matches documents in scope
+        if group_id:
+            where = where + ['d.group_id = ?']
+            params = params + [group_id]
+        cursor.execute('SELECT {} FROM documents d WHERE {}'.format(columns, ' AND '.join(where)), params)
+        return cursor.fetchall(), []
+
+    documents = []
+    for start in range(0, len(ids), SQL_IN_CHUNK_SIZE):
+        chunk = ids[start:start + SQL_IN_CHUNK_SIZE]
+        cursor.execute('SELECT {} FROM documents d WHERE d.id IN ({})'.format(columns, ','.join('?' * len(chunk))),
+                       chunk)
+        documents.extend(cursor.fetchall())
+
+    if group_id and any(document['group_id'] != group_id for document in documents):
+        raise PermissionError('You do not have permission to manage these documents')
+
+    found = {document['id'] for document in documents}
+    return documents, [document_id for document_id in ids if document_id not in found]
+
+# Error response for a bulk request that was rejected
+def bulk_error(error):
+    if isinstance(error, PermissionError):
+        return jsonify({'error': str(error)}), 403
+    if isinstance(error, OverflowError):
+        return jsonify({'error': str(error)}), 413
+    return jsonify({'error': str(error)}), 400
+
+# Background task: remove the stored files, cached pages and QR codes of
+# deleted documents. A file body is only removed if no document references
+# it any more; that check and the removal run under the database write lock
+# so an upload of the same content can't start sharing the file in between.
+def remove_document_files(root_path, documents):
+    conn = get_thread_db()
+    store = get_storage('uploads')
+
+    for start in range(0, len(documents), SQL_IN_CHUNK_SIZE):
+        chunk = documents[start:start + SQL_IN_CHUNK_SIZE]
+        hashes = list({document['content_hash'] for document in chunk if document['content_hash']})
+
+        removed = set()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            referenced = set()
+            if hashes:
+                referenced = {row[0] for row in conn.execute(
+                    'SELECT DISTINCT content_hash FROM documents WHERE content_hash IN ({})'.format(
+                        ','.join('?' * len(hashes))), hashes)}
+
+            for document in chunk:
+                # Files uploaded before deduplication are never shared
+                if document['content_hash'] in referenced or document['filename'] in removed:
+                    continue
+                store.delete(document['filename'])
+                removed.add(document['filename'])
+        finally:
+            # Nothing was written; just release the lock
+            conn.rollback()
+
+        for filename in removed:
+            remove_page_cache(root_path, filename)
+
+        for document in chunk:
+            if document['qr_hash']:
+                remove_qr(document['qr_hash'])
+            legacy_path = legacy_qr_path(root_path, document['filename'])
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+# Bulk delete route
+# JSON body: ids (list of document ids) or filter (file_number prefix,
+# date_from, date_to, group_id, uploaded_by, is_visible)
+@api_bp.route('/documents/bulk/delete', methods=['POST'])
+@token_required
+def bulk_delete_documents():
+    data = request.get_json(silent=True) or {}
+    try:
+        target = parse_bulk_target(data)
+    except (ValueError, OverflowError) as e:
+        return bulk_error(e)
+
+    # Connect to database
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Select, check and delete in one write transaction
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        documents, not_found = select_bulk_targets(cursor, target)
+        cursor.executemany('DELETE FROM documents WHERE id = ?', [(document['id'],) for document in documents])
+        conn.commit()
+    except PermissionError as e:
+        conn.rollback()
+        return bulk_error(e)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    # Files and QR codes are removed after the response; if the queue is
+    # full, remove them now
+    documents = [dict(document) for document in documents]
+    if documents and not workers.submit(remove_document_files, current_app.root_path, documents):
+        remove_document_files(current_app.root_path, documents)
+
+    return jsonify({
+        'message': 'Documents deleted successfully',
+        'deleted': len(documents),
+        'ids': [document['id'] for document in documents],
+        'not_found': not_found
+    })
+
+# Bulk visibility route
+# JSON body: is_visible (0 or 1), and ids or filter as for bulk delete
+@api_bp.route('/documents/bulk/visibility', methods=['PUT'])
+@token_required
+def bulk_set_visibility():
+    data = request.get_json(silent=True) or {}
+    is_visible = data.get('is_visible')
+    if not isinstance(is_visible, int) or is_visible not in (0, 1):
+        return jsonify({'error': 'is_visible must be 0 or 1'}), 400
+
+    try:
+        target = parse_bulk_target(data)
+    except (ValueError, OverflowError) as e:
+        return bulk_error(e)
+
+    # Connect to database
+    conn = get_db()
+    cursor = conn.cursor()
+
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        documents, not_found = select_bulk_targets(cursor, target)
+        cursor.executemany('UPDATE documents SET is_visible = ? WHERE id = ?',
+                           [(int(is_visible), document['id']) for document in documents])
+        conn.commit()
+    except PermissionError as e:
+        conn.rollback()
+        return bulk_error(e)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'message': 'Document visibility updated successfully',
+        'updated': len(documents),
+        'is_visible': int(is_visible),
+        'ids': [document['id'] for document in documents],
+        'not_found': not_found
+    })
@@ -0,0 +1,168 @@
+import gzip
+import zlib
+from flask import request, current_app
+from . import api_bp
+
+try:
+    import brotli
+except ImportError:  # optional, responses are only gzip compressed without it
+    brotli = None
+
+# Defaults of the app.config settings (see app.py):
+#   COMPRESS_MIN_SIZE       - smaller bodies are sent as is (the saving is
+#                             eaten by headers and CPU time)
+#   COMPRESS_GZIP_LEVEL     - 1 (fastest) .. 9 (smallest)
+#   COMPRESS_BROTLI_QUALITY - 0 (fastest) .. 11 (smallest); low qualities
+#                             beat gzip on both size and speed for JSON
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+
+# Content types worth compressing; anything else (PDFs, PNGs, WebP, ...)
+# is already compressed
+COMPRESS_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'image/svg+xml',
+    'text/csv',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+}
+
+# Streamed responses: input bytes compressed before the output is flushed
+# to the client, so rows arrive in batches instead of waiting for the end
+COMPRESS_STREAM_FLUSH_SIZE = 64 * 1024
+
+
+# Per-route override of the compression settings, applied below the route
+# decorator:
+#
+#     @api_bp.route('/auth/login', methods=['POST'])
+#     @compress(enabled=False)
+#     def login(): ...
+#
+# Settings not given fall back to the app config.
+def compress(enabled=True, min_size=None, gzip_level=None, brotli_quality=None):
+    def decorator(f):
+        f.compression = {
+            'enabled': enabled,
+            'min_size': min_size,
+            'gzip_level': gzip_level,
+            'brotli_quality': brotli_quality,
+        }
+        return f
+    return decorator
+
+# Compression settings of the current request's route
+def compression_settings():
+    config = current_app.config
+    settings = {
+        'enabled': True,
+        'min_size': config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE),
+        'gzip_level': config.get('COMPRESS_GZIP_LEVEL', COMPRESS_GZIP_LEVEL),
+        'brotli_quality': config.get('COMPRESS_BROTLI_QUALITY', COMPRESS_BROTLI_QUALITY),
+    }
+    view = current_app.view_functions.get(request.endpoint)
+    for name, value in getattr(view, 'compression', {}).items():
+        if value is not None:
+            settings[name] = value
+    return settings
+
+# Encoding to use for the client: the one with the highest quality in
+# Accept-Encoding, brotli winning ties. None if it accepts neither.
+def choose_encoding():
+    accepted = request.accept_encodings
+    candidates = [('br', accepted['br'])] if brotli is not None else []
+    candidates.append(('gzip', accepted['gzip']))
+    encoding, quality = max(candidates, key=lambda candidate: candidate[1])
+    return encoding if quality > 0 else None
+
+# Compressor with the zlib-style interface (compress, flush) for encoding
+class BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def make_compressor(encoding, settings):
+    if encoding == 'br':
+        return BrotliCompressor(settings['brotli_quality'])
+    # wbits 31: gzip container
+    return zlib.compressobj(settings['gzip_level'], zlib.DEFLATED, 31)
+
+# Compress a complete body
+def compress_body(data, encoding, settings):
+    if encoding == 'br':
+        return brotli.compress(data, quality=settings['brotli_quality'])
+    return gzip.compress(data, compresslevel=settings['gzip_level'], mtime=0)
+
+# Compress a streamed body chunk by chunk, flushing every
+# COMPRESS_STREAM_FLUSH_SIZE input bytes
+def compress_stream(chunks, compressor):
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            output = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= COMPRESS_STREAM_FLUSH_SIZE:
+                output += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if output:
+                yield output
+        yield compressor.flush(zlib.Z_FINISH)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+# Check whether a response can be compressed at all (independent of the
+# client), i.e. whether its representation varies with Accept-Encoding
+def is_compressible(response):
+    return (response.mimetype in COMPRESS_MIMETYPES
+            and response.status_code not in (204, 206, 304)
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and 'no-transform' not in response.headers.get('Cache-Control', ''))
+
+# Compress API responses the client accepts compressed
+@api_bp.after_request
+def compress_response(response):
+    if request.method == 'HEAD' or not is_compressible(response):
+        return response
+
+    settings = compression_settings()
+    if not settings['enabled']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Size unknown up front: compress as the body is produced
+        response.response = compress_stream(response.response, make_compressor(encoding, settings))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < settings['min_size']:
+            return response
+        response.set_data(compress_body(data, encoding, settings))
+
+    response.content_encoding = encoding
+
+    # The compressed bytes differ from the original: a strong validator
+    # becomes weak (If-None-Match comparisons are weak)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
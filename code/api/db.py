@@ -0,0 +1,240 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from urllib.request import pathname2url
+from flask import g, has_request_context
+from .migrations import run_migrations
+from .metrics import record_query
+
+# Database path
+DB_PATH = 'static/documents.db'
+
+# Default admin credentials
+DEFAULT_USERNAME = 'admin'
+
+# Connection tuning, applied to every pooled connection
+SQLITE_BUSY_TIMEOUT = 5000          # milliseconds
+SQLITE_SYNCHRONOUS = 'NORMAL'       # safe with WAL, avoids an fsync per commit
+SQLITE_CACHE_SIZE = -16000          # negative means KiB, i.e. ~16 MB page cache
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+# Idle connections kept per process and mode (read-write, read-only). A
+# request takes one from the pool and returns it at teardown, so threads
+# that live for one request (the Werkzeug dev server) reuse connections
+# too; connections returned to a full pool are closed.
+DB_POOL_SIZE = 8
+
+_pools = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Connection held by a background task thread until the task ends
+_thread_db = threading.local()
+
+
+# Create tables if they don't exist and apply pending migrations (runs once at startup)
+def bootstrap_schema(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        # WAL is persistent in the database file, so set it once here
+        conn.execute('PRAGMA journal_mode=WAL')
+
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                group_id INTEGER,
+                role TEXT DEFAULT 'user',
+                created_by TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_groups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                created_by TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_number TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                original_filename TEXT NOT NULL,
+                inspection_date TEXT NOT NULL,
+                group_id INTEGER,
+                uploaded_by INTEGER,
+                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_visible INTEGER DEFAULT 1
+            )
+        ''')
+
+        # Create default admin user on a fresh database
+        cursor.execute('SELECT COUNT(*) FROM users')
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(
+                'INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                (DEFAULT_USERNAME, 'admin', 'admin')
+            )
+
+        conn.commit()
+
+        # Migrations manage their own transactions
+        conn.isolation_level = None
+        for version, description in run_migrations(conn):
+            print(f"Applied schema migration {version}: {description}")
+    finally:
+        conn.close()
+
+# Apply per-connection pragmas
+def _configure(conn, read_only=False):
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA busy_timeout = {}'.format(SQLITE_BUSY_TIMEOUT))
+    conn.execute('PRAGMA synchronous = {}'.format(SQLITE_SYNCHRONOUS))
+    conn.execute('PRAGMA cache_size = {}'.format(SQLITE_CACHE_SIZE))
+    conn.execute('PRAGMA mmap_size = {}'.format(SQLITE_MMAP_SIZE))
+    conn.execute('PRAGMA temp_store = MEMORY')
+    if read_only:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+# Cursor recording each statement and the time spent in SQLite for the
+# metrics (see api/metrics.py); rows fetched by iterating the cursor are
+# not timed
+class InstrumentedCursor(sqlite3.Cursor):
+    def _timed(self, method, args, count):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            record_query(time.perf_counter() - started, count)
+
+    def execute(self, *args):
+        return self._timed(super().execute, args, 1)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, args, 1)
+
+    def executescript(self, *args):
+        return self._timed(super().executescript, args, 1)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, (), 0)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, args, 0)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, (), 0)
+
+# Connection whose cursors (including those of conn.execute) are instrumented
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+# Open a new connection
+def connect(read_only=False):
+    if read_only:
+        uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(DB_PATH)))
+        conn = sqlite3.connect(uri, uri=True, factory=InstrumentedConnection, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection, check_same_thread=False)
+    return _configure(conn, read_only)
+
+# Get the idle connection pools of this process
+def _get_pools():
+    global _pools, _pool_pid
+    with _pool_lock:
+        # Connections must never cross a fork; start fresh pools in the child
+        if _pools is None or _pool_pid != os.getpid():
+            _pools = {False: queue.LifoQueue(DB_POOL_SIZE), True: queue.LifoQueue(DB_POOL_SIZE)}
+            _pool_pid = os.getpid()
+        return _pools
+
+# Take a connection from the pool, opening one if none is idle
+def acquire(read_only=False):
+    try:
+        return _get_pools()[read_only].get_nowait()
+    except queue.Empty:
+        return connect(read_only)
+
+# Return a connection to the pool, or close it when the pool is full
+def release(conn, read_only=False):
+    if conn.in_transaction:
+        # Don't leak an open transaction into the next user
+        conn.rollback()
+    try:
+        _get_pools()[read_only].put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+# Close all pooled connections of this process; in a freshly forked child
+# the inherited ones are only dropped
+def reset_pool():
+    global _pools, _pool_pid, _thread_db
+    with _pool_lock:
+        pools, pid = _pools, _pool_pid
+        _pools = None
+        _thread_db = threading.local()
+    if pools is not None and pid == os.getpid():
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+# Connect to database
+def get_db():
+    if 'db' not in g:
+        g.db = acquire(False)
+    return g.db
+
+# Connect to database for read-only public endpoints
+def get_read_db():
+    if 'read_db' not in g:
+        g.read_db = acquire(True)
+    return g.read_db
+
+# Connect to database outside of a request (background tasks, see
+# api/workers.py, which releases it when the task ends); inside a request
+# this is the request's connection
+def get_thread_db():
+    if has_request_context():
+        return get_db()
+    conn = getattr(_thread_db, 'conn', None)
+    if conn is None:
+        conn = _thread_db.conn = acquire(False)
+    return conn
+
+# Return the connection of this background task thread to the pool
+def release_thread_db():
+    conn = getattr(_thread_db, 'conn', None)
+    if conn is not None:
+        _thread_db.conn = None
+        release(conn)
+
+# Return the request's database connections to the pool
+def close_db(e=None):
+    for key, read_only in (('db', False), ('read_db', True)):
+        db = g.pop(key, None)
+        if db is not None:
+            release(db, read_only)
+
+# Set up the database for the app
+def init_app(app):
+    bootstrap_schema()
+    app.teardown_appcontext(close_db)
@@ -5,106 +5,334 @@ import string
 import sqlite3
 import qrcode
 import io
-from flask import request, jsonify, g, send_from_directory, current_app, url_for, send_file
+import json
+import base64
+from flask import request, jsonify, g, send_from_directory, current_app, url_for, send_file, redirect
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from . import api_bp
-from .auth import token_required, admin_required, get_db
+from .auth import token_required, admin_required
+from .db import get_db, get_read_db
+from .streaming import requested_stream_format, stream_rows
+from .qrcodes import (QR_FORMATS, QR_ERROR_CORRECTION, legacy_qr_path, load_document_qr,
+                      remove_qr, generate_document_qr, render_qr_cached)
+from .files import UPLOAD_STAGING_DIR, save_stream, send_stored_file, send_stored_object
+from .storage import content_filename, get_storage
+from .pages import remove_page_cache
+from .previews import generate_document_preview, thumbnail_version
+from .texts import generate_document_text
+from . import workers
 
-# Database path
-DB_PATH = 'static/documents.db'
+# Cache lifetime for versioned (content-addressed) QR code URLs
+QR_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
-# Upload directory
-UPLOAD_DIR = 'static/uploads'
-
-# QR code directory
-QRCODE_DIR = 'static/qrcodes'
+# Limits and cache lifetime for the ad-hoc QR code generator
+QR_MAX_BOX_SIZE = 50
+QR_MAX_BORDER = 20
+QR_RENDER_MAX_AGE = 24 * 3600
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Document list page sizes
+DOCUMENTS_PAGE_SIZE = 50
+DOCUMENTS_MAX_PAGE_SIZE = 500
+
+# Bound parameters per IN (...) list
+SQL_IN_CHUNK_SIZE = 500
+
+# Records a new document (file_number, filename, original_filename,
+# inspection_date, group_id, uploaded_by, content_hash)
+DOCUMENT_INSERT = ('INSERT INTO documents (file_number, filename, original_filename, inspection_date, group_id, '
+                   'uploaded_by, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)')
+
+
+# Base URL encoded in new QR codes: the configured PUBLIC_URL, or the
+# address of the (authenticated) upload request when none is configured
+def qr_base_url():
+    return current_app.config.get('PUBLIC_URL') or request.url_root
+
+# QR code of a document for the public read routes (never changes the
+# recorded QR code), returns (qr_hash, PNG bytes)
+def document_qr_code(document):
+    return load_document_qr(document, qr_base_url())
+
+# Check if file extension is allowed
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Generate QR code for a document
-def generate_qr_code(document_id, filename):
-    # Create QR code with the mobile viewer URL instead of direct view URL
-    base_url = request.url_root.rstrip('/')
-    mobile_viewer_url = f"{base_url}/mobile-viewer.html?id={document_id}"
+# Validate the fields of a new document, returns an error message or None
+def validate_document_fields(file_number, inspection_date):
+    if not file_number:
+        return 'File number is required'
+    
+    if not inspection_date:
+        return 'Inspection date is required'
+    
+    # Validate file number (only letters and numbers allowed)
+    if not re.fullmatch(r"[a-zA-Z0-9\-_+]+", file_number):
+        return 'File number can only contain letters, numbers, and -_+ symbols'
     
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+    return None
+
+# Check if the file number already exists in the current user's group
+def file_number_exists(cursor, file_number):
+    group_id = g.current_user['group_id']
+    if group_id:
+        # If user belongs to a group, check if the same file number exists in the group
+        cursor.execute('SELECT COUNT(*) FROM documents WHERE file_number = ? AND group_id = ?', (file_number, group_id))
+    else:
+        # If user doesn't belong to any group, check if the same file number exists for this user
+        cursor.execute('SELECT COUNT(*) FROM documents WHERE file_number = ? AND uploaded_by = ? AND group_id IS NULL', 
+                      (file_number, g.current_user['id']))
+    return cursor.fetchone()[0] > 0
+
+# Get which of file_numbers already exist in the current user's group (same
+# scope as file_number_exists), with one query per SQL_IN_CHUNK_SIZE numbers
+def existing_file_numbers(cursor, file_numbers):
+    group_id = g.current_user['group_id']
+    if group_id:
+        scope, params = 'group_id = ?', [group_id]
+    else:
+        scope, params = 'uploaded_by = ? AND group_id IS NULL', [g.current_user['id']]
+
+    file_numbers = list(file_numbers)
+    existing = set()
+    for start in range(0, len(file_numbers), SQL_IN_CHUNK_SIZE):
+        chunk = file_numbers[start:start + SQL_IN_CHUNK_SIZE]
+        cursor.execute(
+            'SELECT file_number FROM documents WHERE {} AND file_number IN ({})'.format(scope, ','.join('?' * len(chunk))),
+            params + chunk
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+# Move an uploaded file (source_path, with SHA-256 digest) into
+# content-addressed storage. Must be called while the transaction recording
+# the document holds the database write lock, so a concurrent delete of the
+# last document with the same content can't remove it in between. Identical
+# content is only stored once; returns True if the content was new to the
+# store.
+def store_content(source_path, digest):
+    store = get_storage('uploads')
+    if store.exists(content_filename(digest)):
+        os.remove(source_path)
+        return False
+    store.put_file(content_filename(digest), source_path)
+    return True
+
+# Record an uploaded file (source_path, with SHA-256 digest) as a new
+# document of the current user, move it into content-addressed storage and
+# queue its derived artifacts. Returns the document id.
+def insert_document(conn, file_number, source_path, digest, original_filename, inspection_date):
+    cursor = conn.cursor()
+    cursor.execute(
+        DOCUMENT_INSERT,
+        (file_number, content_filename(digest), original_filename, inspection_date, g.current_user['group_id'],
+         g.current_user['id'], digest)
     )
-    qr.add_data(mobile_viewer_url)
-    qr.make(fit=True)
     
-    # Ensure QR code directory exists
-    qrcode_dir = os.path.join(current_app.root_path, QRCODE_DIR)
-    os.makedirs(qrcode_dir, exist_ok=True)
+    document_id = cursor.lastrowid
+    
+    # The file is placed while the INSERT holds the database write lock
+    store_content(source_path, digest)
+    conn.commit()
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    qr_filename = "{}.png".format(filename.split('.')[0])
-    qr_path = os.path.join(current_app.root_path, QRCODE_DIR, qr_filename)
-    img.save(qr_path)
-    return qr_path
+    # Generate QR code in the background; get_qrcode renders it on
+    # demand until it is recorded (regenerate_qrcodes.py records it if the
+    # queue was full)
+    workers.submit(generate_document_qr, current_app.root_path, qr_base_url(), document_id)
+    
+    # Extract page count, PDF metadata and thumbnails in the background
+    workers.submit(generate_document_preview, current_app.root_path, document_id)
+    
+    # Index the text for full-text search in the background
+    workers.submit(generate_document_text, document_id)
+    
+    return document_id
 
-# Check if file extension is allowed
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Get a document as returned by the upload endpoints
+def load_document_dict(cursor, document_id):
+    cursor.execute('''
+        SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
+               d.group_id, d.uploaded_by, u.username as uploader, g.group_name, d.is_visible, d.qr_hash, d.qr_status,
+               d.page_count, d.pdf_title, d.pdf_producer, d.preview_status
+        FROM documents d
+        LEFT JOIN users u ON d.uploaded_by = u.id
+        LEFT JOIN user_groups g ON d.group_id = g.id
+        WHERE d.id = ?
+    ''', (document_id,))
+    
+    document = cursor.fetchone()
+    
+    view_url, qrcode_url, thumbnail_url = document_url_templates()
+    
+    return {
+        'id': document['id'],
+        'file_number': document['file_number'],
+        'original_filename': document['original_filename'],
+        'filename': document['filename'],
+        'inspection_date': document['inspection_date'],
+        'upload_date': document['upload_date'],
+        'group_id': document['group_id'],
+        'group_name': document['group_name'],
+        'uploaded_by': document['uploaded_by'],
+        'uploader': document['uploader'],
+        'view_url': view_url.format(document['id']),
+        'qrcode_url': versioned_qrcode_url(qrcode_url, document['id'], document['qr_hash']),
+        'thumbnail_url': versioned_thumbnail_url(thumbnail_url, document['id'], document['filename']),
+        'is_visible': document['is_visible'],
+        'qr_status': document['qr_status'],
+        'page_count': document['page_count'],
+        'pdf_title': document['pdf_title'],
+        'pdf_producer': document['pdf_producer'],
+        'preview_status': document['preview_status']
+    }
+
+# Encode a keyset cursor (upload_date, id) as an opaque URL-safe token
+def encode_cursor(upload_date, document_id):
+    raw = json.dumps([upload_date, document_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+# Decode a keyset cursor, returns None if it is malformed
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        upload_date, document_id = json.loads(raw.decode('utf-8'))
+        return str(upload_date), int(document_id)
+    except (ValueError, TypeError):
+        return None
+
+# Smallest string greater than every string starting with prefix
+def prefix_upper_bound(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+# WHERE conditions (on documents aliased d) limiting the current user to the
+# documents they can see: all for admins, otherwise their own and their
+# group's. Returns (where, params).
+def document_access_scope():
+    if g.current_user['is_admin']:
+        return [], []
+
+    group_id = g.current_user['group_id']
+    if group_id:
+        # User belongs to a group
+        return ['(d.group_id = ? OR d.uploaded_by = ?)'], [group_id, g.current_user['id']]
+
+    # User doesn't belong to any group
+    return ['d.uploaded_by = ?'], [g.current_user['id']]
+
+# WHERE conditions (on documents aliased d) for the document filters in args:
+# file_number (prefix), date_from, date_to, group_id, uploaded_by,
+# is_visible. Returns (where, params); raises ValueError for invalid values.
+def document_filter(args):
+    where = []
+    params = []
+
+    file_number = str(args.get('file_number') or '')
+    if file_number:
+        # Prefix match as a range so it can use the file_number index
+        where.append('d.file_number >= ? AND d.file_number < ?')
+        params.extend([file_number, prefix_upper_bound(file_number)])
+
+    if args.get('date_from'):
+        where.append('d.inspection_date >= ?')
+        params.append(str(args.get('date_from')))
+
+    if args.get('date_to'):
+        where.append('d.inspection_date <= ?')
+        params.append(str(args.get('date_to')))
+
+    for name in ('group_id', 'uploaded_by', 'is_visible'):
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            params.append(int(value))
+        except (ValueError, TypeError):
+            raise ValueError('{} must be an integer'.format(name))
+        where.append('d.{} = ?'.format(name))
+
+    return where, params
+
+# Build the view/qrcode/thumbnail URL format strings once per request
+# instead of calling url_for for every row
+def document_url_templates():
+    view_url = url_for('api.view_document', document_id=0, _external=True)
+    qrcode_url = url_for('api.get_qrcode', document_id=0, _external=True)
+    thumbnail_url = url_for('api.get_thumbnail', document_id=0, _external=True)
+    return (view_url.replace('/documents/0/', '/documents/{}/'),
+            qrcode_url.replace('/documents/0/', '/documents/{}/'),
+            thumbnail_url.replace('/documents/0/', '/documents/{}/'))
+
+# QR code URL for a document, versioned by its QR hash when known so the
+# response can be cached forever
+def versioned_qrcode_url(template, document_id, hash_value):
+    url = template.format(document_id)
+    return url + '?v=' + hash_value if hash_value else url
+
+# Thumbnail URL for a document, versioned by its stored file name
+def versioned_thumbnail_url(template, document_id, filename):
+    return template.format(document_id) + '?v=' + thumbnail_version(filename)
 
 # Get documents route
 @api_bp.route('/documents', methods=['GET'])
 @token_required
 def get_documents():
+    args = request.args
+
+    # Page size
+    try:
+        limit = int(args.get('limit', DOCUMENTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, DOCUMENTS_MAX_PAGE_SIZE))
+
+    # Sort direction (keyset on upload_date, id)
+    order = args.get('order', 'desc').lower()
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': 'order must be asc or desc'}), 400
+
+    # Streaming mode returns every matching row without paging
+    stream_format = requested_stream_format()
+
     # Connect to database
     conn = get_db()
     cursor = conn.cursor()
-    
-    # Check if user is admin
-    if g.current_user['is_admin']:
-        # Admin can see all documents
-        cursor.execute('''
-            SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
-                   u.username as uploader, g.group_name, d.is_visible
-            FROM documents d
-            LEFT JOIN users u ON d.uploaded_by = u.id
-            LEFT JOIN user_groups g ON d.group_id = g.id
-            ORDER BY d.upload_date DESC
-        ''')
-    else:
-        # Non-admin can only see documents in their group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        group_id = cursor.fetchone()['group_id']
-        
-        if group_id:
-            # User belongs to a group
-            cursor.execute('''
-                SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
-                       u.username as uploader, g.group_name, d.is_visible
-                FROM documents d
-                LEFT JOIN users u ON d.uploaded_by = u.id
-                LEFT JOIN user_groups g ON d.group_id = g.id
-                WHERE d.group_id = ? OR d.uploaded_by = ?
-                ORDER BY d.upload_date DESC
-            ''', (group_id, g.current_user['id']))
-        else:
-            # User doesn't belong to any group
-            cursor.execute('''
-                SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
-                       u.username as uploader, g.group_name, d.is_visible
-                FROM documents d
-                LEFT JOIN users u ON d.uploaded_by = u.id
-                LEFT JOIN user_groups g ON d.group_id = g.id
-                WHERE d.uploaded_by = ?
-                ORDER BY d.upload_date DESC
-            ''', (g.current_user['id'],))
-    
-    documents = cursor.fetchall()
-    
-    # Convert to list of dictionaries
-    documents_list = []
-    for doc in documents:
-        documents_list.append({
+
+    # Restrict non-admin users to their own and their group's documents
+    where, params = document_access_scope()
+
+    # Filters
+    try:
+        filter_where, filter_params = document_filter(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    where.extend(filter_where)
+    params.extend(filter_params)
+
+    # Total count is only computed when asked for (usually on the first page)
+    total = None
+    if args.get('include_total') in ('1', 'true'):
+        cursor.execute(
+            'SELECT COUNT(*) FROM documents d {}'.format('WHERE ' + ' AND '.join(where) if where else ''),
+            params
+        )
+        total = cursor.fetchone()[0]
+
+    # Continue after the last row of the previous page
+    if args.get('cursor'):
+        position = decode_cursor(args.get('cursor'))
+        if position is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        where.append('(d.upload_date, d.id) {} (?, ?)'.format('<' if order == 'desc' else '>'))
+        params.extend(position)
+
+    view_url, qrcode_url, thumbnail_url = document_url_templates()
+
+    # Convert a row to a dictionary
+    def to_dict(doc):
+        return {
             'id': doc['id'],
             'file_number': doc['file_number'],
             'original_filename': doc['original_filename'],
@@ -112,12 +340,50 @@ def get_documents():
             'upload_date': doc['upload_date'],
             'uploader': doc['uploader'],
             'group_name': doc['group_name'],
-            'view_url': url_for('api.view_document', document_id=doc['id'], _external=True),
-            'qrcode_url': url_for('api.get_qrcode', document_id=doc['id'], _external=True),
-            'is_visible': doc['is_visible']
-        })
-    
-    return jsonify({'documents': documents_list})
+            'view_url': view_url.format(doc['id']),
+            'qrcode_url': versioned_qrcode_url(qrcode_url, doc['id'], doc['qr_hash']),
+            'thumbnail_url': versioned_thumbnail_url(thumbnail_url, doc['id'], doc['filename']),
+            'is_visible': doc['is_visible'],
+            'qr_status': doc['qr_status'],
+            'page_count': doc['page_count'],
+            'preview_status': doc['preview_status']
+        }
+
+    query = '''
+        SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
+               u.username as uploader, g.group_name, d.is_visible, d.qr_hash, d.qr_status,
+               d.page_count, d.preview_status
+        FROM documents d
+        LEFT JOIN users u ON d.uploaded_by = u.id
+        LEFT JOIN user_groups g ON d.group_id = g.id
+        {}
+        ORDER BY d.upload_date {order}, d.id {order}
+    '''.format('WHERE ' + ' AND '.join(where) if where else '', order=order.upper())
+
+    if stream_format:
+        cursor.execute(query, params)
+        extra = {'total': total} if total is not None else None
+        return stream_rows(cursor, 'documents', to_dict, stream_format, extra)
+
+    # Fetch one extra row to know whether there is a next page
+    cursor.execute(query + ' LIMIT ?', params + [limit + 1])
+
+    documents = cursor.fetchall()
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last['upload_date'], last['id'])
+
+    result = {
+        'documents': [to_dict(doc) for doc in documents],
+        'next_cursor': next_cursor
+    }
+    if total is not None:
+        result['total'] = total
+
+    return jsonify(result)
 
 # Get document route
 @api_bp.route('/documents/<int:document_id>', methods=['GET'])
@@ -130,7 +396,8 @@ def get_document(document_id):
     # Get document
     cursor.execute('''
         SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
-               d.group_id, d.uploaded_by, u.username as uploader, g.group_name, d.is_visible
+               d.group_id, d.uploaded_by, u.username as uploader, g.group_name, d.is_visible, d.qr_hash, d.qr_status,
+               d.page_count, d.pdf_title, d.pdf_producer, d.preview_status
         FROM documents d
         LEFT JOIN users u ON d.uploaded_by = u.id
         LEFT JOIN user_groups g ON d.group_id = g.id
@@ -147,12 +414,13 @@ def get_document(document_id):
         # Check if user is the uploader
         if document['uploaded_by'] != g.current_user['id']:
             # Check if user is in the same group
-            cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-            user_group_id = cursor.fetchone()['group_id']
+            user_group_id = g.current_user['group_id']
             
             if not user_group_id or document['group_id'] != user_group_id:
                 return jsonify({'error': 'You do not have permission to view this document'}), 403
     
+    view_url, qrcode_url, thumbnail_url = document_url_templates()
+    
     # Convert to dictionary
     document_dict = {
         'id': document['id'],
@@ -165,9 +433,15 @@ def get_document(document_id):
         'group_name': document['group_name'],
         'uploaded_by': document['uploaded_by'],
         'uploader': document['uploader'],
-        'view_url': url_for('api.view_document', document_id=document['id'], _external=True),
-        'qrcode_url': url_for('api.get_qrcode', document_id=document['id'], _external=True),
-        'is_visible': document['is_visible']
+        'view_url': view_url.format(document['id']),
+        'qrcode_url': versioned_qrcode_url(qrcode_url, document['id'], document['qr_hash']),
+        'thumbnail_url': versioned_thumbnail_url(thumbnail_url, document['id'], document['filename']),
+        'is_visible': document['is_visible'],
+        'qr_status': document['qr_status'],
+        'page_count': document['page_count'],
+        'pdf_title': document['pdf_title'],
+        'pdf_producer': document['pdf_producer'],
+        'preview_status': document['preview_status']
     }
     
     return jsonify({'document': document_dict})
@@ -187,51 +461,24 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    if not file_number:
-        return jsonify({'error': 'File number is required'}), 400
-    
-    if not inspection_date:
-        return jsonify({'error': 'Inspection date is required'}), 400
-    
-    # Validate file number (only letters and numbers allowed)
-    if not re.fullmatch(r"[a-zA-Z0-9\-_+]+", file_number):
-        return jsonify({'error': 'File number can only contain letters, numbers, and -_+ symbols'}), 400
+    error = validate_document_fields(file_number, inspection_date)
+    if error:
+        return jsonify({'error': error}), 400
     
     if file and allowed_file(file.filename):
-        # Get absolute path to upload directory
-        upload_dir = os.path.join(current_app.root_path, UPLOAD_DIR)
-        
-        # Ensure upload directory exists
-        os.makedirs(upload_dir, exist_ok=True)
-        
         # Preserve the original filename with Chinese characters
         original_filename = file.filename
-        # Generate a secure filename for storage
-        secure_name = secure_filename(file.filename)
-        filename = "{}_{}".format(random.randint(10000, 99999), secure_name)
-        file_path = os.path.join(upload_dir, filename)
         
-        # Save the file
-        file.save(file_path)
+        # Save the file to the staging directory, hashing it on the way; it
+        # is stored under its hash once the document is recorded
+        file_path, digest = save_stream(file.stream, os.path.join(current_app.root_path, UPLOAD_STAGING_DIR))
         
         # Connect to database
         conn = get_db()
         cursor = conn.cursor()
         
-        # Get user's group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        group_id = cursor.fetchone()['group_id']
-        
         # Check if file number already exists in the same group
-        if group_id:
-            # If user belongs to a group, check if the same file number exists in the group
-            cursor.execute('SELECT COUNT(*) FROM documents WHERE file_number = ? AND group_id = ?', (file_number, group_id))
-        else:
-            # If user doesn't belong to any group, check if the same file number exists for this user
-            cursor.execute('SELECT COUNT(*) FROM documents WHERE file_number = ? AND uploaded_by = ? AND group_id IS NULL', 
-                          (file_number, g.current_user['id']))
-        
-        if cursor.fetchone()[0] > 0:
+        if file_number_exists(cursor, file_number):
             # Remove the uploaded file
             if os.path.exists(file_path):
                 os.remove(file_path)
@@ -239,49 +486,11 @@ def upload_document():
         
         try:
             # Insert document record
-            cursor.execute(
-                'INSERT INTO documents (file_number, filename, original_filename, inspection_date, group_id, uploaded_by) VALUES (?, ?, ?, ?, ?, ?)',
-                (file_number, filename, original_filename, inspection_date, group_id, g.current_user['id'])
-            )
-            
-            document_id = cursor.lastrowid
-            conn.commit()
-            
-            # Generate QR code
-            qr_path = generate_qr_code(document_id, filename)
-            
-            # Get document details
-            cursor.execute('''
-                SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, 
-                       d.group_id, d.uploaded_by, u.username as uploader, g.group_name, d.is_visible
-                FROM documents d
-                LEFT JOIN users u ON d.uploaded_by = u.id
-                LEFT JOIN user_groups g ON d.group_id = g.id
-                WHERE d.id = ?
-            ''', (document_id,))
-            
-            document = cursor.fetchone()
-            
-            # Convert to dictionary
-            document_dict = {
-                'id': document['id'],
-                'file_number': document['file_number'],
-                'original_filename': document['original_filename'],
-                'filename': document['filename'],
-                'inspection_date': document['inspection_date'],
-                'upload_date': document['upload_date'],
-                'group_id': document['group_id'],
-                'group_name': document['group_name'],
-                'uploaded_by': document['uploaded_by'],
-                'uploader': document['uploader'],
-                'view_url': url_for('api.view_document', document_id=document['id'], _external=True),
-                'qrcode_url': url_for('api.get_qrcode', document_id=document['id'], _external=True),
-                'is_visible': document['is_visible']
-            }
+            document_id = insert_document(conn, file_number, file_path, digest, original_filename, inspection_date)
             
             return jsonify({
                 'message': 'Document uploaded successfully',
-                'document': document_dict
+                'document': load_document_dict(cursor, document_id)
             }), 201
         except Exception as e:
             conn.rollback()
@@ -312,10 +521,8 @@ def delete_document(document_id):
     # Check if user has permission to delete document
     if not g.current_user['is_admin']:
         # Check if user is a group admin
-        cursor.execute('SELECT role, group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        user = cursor.fetchone()
-        user_role = user['role'] if 'role' in user.keys() else 'user'
-        user_group_id = user['group_id']
+        user_role = g.current_user['role']
+        user_group_id = g.current_user['group_id']
         
         # Only admin and group_admin can delete documents
         if user_role != 'group_admin':
@@ -327,19 +534,33 @@ def delete_document(document_id):
     
     # Delete document
     try:
-        # Delete file
-        file_path = os.path.join(current_app.root_path, UPLOAD_DIR, document['filename'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Delete database record
+        cursor.execute('DELETE FROM documents WHERE id = ?', (document_id,))
+        
+        # The file body may be shared with other documents; it is only
+        # removed with the last reference. The write lock taken by the DELETE
+        # keeps uploads of the same content out until the commit.
+        if document['content_hash']:
+            cursor.execute('SELECT COUNT(*) FROM documents WHERE content_hash = ?', (document['content_hash'],))
+            last_reference = cursor.fetchone()[0] == 0
+        else:
+            # Files uploaded before deduplication are never shared
+            last_reference = True
+        
+        if last_reference:
+            # Delete file
+            get_storage('uploads').delete(document['filename'])
+            
+            # Delete cached pages
+            remove_page_cache(current_app.root_path, document['filename'])
         
         # Delete QR code
-        qr_filename = "{}.png".format(document['filename'].split('.')[0])
-        qr_path = os.path.join(current_app.root_path, QRCODE_DIR, qr_filename)
-        if os.path.exists(qr_path):
-            os.remove(qr_path)
+        if document['qr_hash']:
+            remove_qr(document['qr_hash'])
+        legacy_path = legacy_qr_path(current_app.root_path, document['filename'])
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
         
-        # Delete database record
-        cursor.execute('DELETE FROM documents WHERE id = ?', (document_id,))
         conn.commit()
         
         return jsonify({'message': 'Document deleted successfully'})
@@ -365,10 +586,8 @@ def toggle_document_visibility(document_id):
     # Check if user has permission to toggle visibility
     if not g.current_user['is_admin']:
         # Check if user is a group admin
-        cursor.execute('SELECT role, group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        user = cursor.fetchone()
-        user_role = user['role'] if 'role' in user.keys() else 'user'
-        user_group_id = user['group_id']
+        user_role = g.current_user['role']
+        user_group_id = g.current_user['group_id']
         
         # Only admin and group_admin can toggle visibility
         if user_role != 'group_admin':
@@ -404,12 +623,13 @@ def query_document():
     inspection_date = data.get('inspection_date')
     
     # Connect to database
-    conn = get_db()
+    conn = get_read_db()
     cursor = conn.cursor()
     
     # Get document
     cursor.execute('''
-        SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date
+        SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date, d.qr_hash,
+               d.qr_url, d.page_count
         FROM documents d
         WHERE d.file_number = ? AND d.inspection_date = ? AND d.is_visible = 1
     ''', (file_number, inspection_date))
@@ -419,12 +639,10 @@ def query_document():
     if not document:
         return jsonify({'error': 'Invalid file number or inspection date'}), 404
     
-    # Ensure QR code is valid
-    qr_filename = "{}.png".format(document['filename'].split('.')[0])
-    qr_path = os.path.join(current_app.root_path, QRCODE_DIR, qr_filename)
+    # Current QR code (its hash versions the QR URL)
+    hash_value, _ = document_qr_code(document)
     
-    if should_regenerate_qr_code(document['id'], qr_path):
-        generate_qr_code(document['id'], document['filename'])
+    view_url, qrcode_url, thumbnail_url = document_url_templates()
     
     # Convert to dictionary
     document_dict = {
@@ -433,8 +651,10 @@ def query_document():
         'original_filename': document['original_filename'],
         'inspection_date': document['inspection_date'],
         'upload_date': document['upload_date'],
-        'view_url': url_for('api.view_document', document_id=document['id'], _external=True),
-        'qrcode_url': url_for('api.get_qrcode', document_id=document['id'], _external=True)
+        'view_url': view_url.format(document['id']),
+        'qrcode_url': versioned_qrcode_url(qrcode_url, document['id'], hash_value),
+        'thumbnail_url': versioned_thumbnail_url(thumbnail_url, document['id'], document['filename']),
+        'page_count': document['page_count']
     }
     
     return jsonify({'document': document_dict})
@@ -443,7 +663,7 @@ def query_document():
 @api_bp.route('/documents/<int:document_id>/view')
 def view_document(document_id):
     # Connect to database
-    conn = get_db()
+    conn = get_read_db()
     cursor = conn.cursor()
     
     # Get document
@@ -453,91 +673,100 @@ def view_document(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    # Serve PDF file with inline content disposition
-    response = send_from_directory(os.path.join(current_app.root_path, UPLOAD_DIR), document['filename'], as_attachment=False)
-    response.headers['Content-Disposition'] = 'inline; filename="{}"'.format(document['filename'])
-    response.headers['Content-Type'] = 'application/pdf'
+    store = get_storage('uploads')
+    disposition = 'inline; filename="{}"'.format(os.path.basename(document['filename']))
+    
+    # Object storage: redirect to a short-lived presigned URL so the client
+    # downloads straight from the bucket
+    url = store.url(document['filename'], 'application/pdf', disposition)
+    if url:
+        response = redirect(url)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    # Serve PDF file with inline content disposition (offloaded to the
+    # front-end server when FILE_OFFLOAD_MODE is set)
+    try:
+        file_path = store.path(document['filename'])
+    except ValueError:
+        return jsonify({'error': 'Document file not found'}), 404
+    
+    if file_path:
+        response = send_stored_file(file_path, document['filename'], 'application/pdf', disposition)
+    else:
+        response = send_stored_object(store, document['filename'], 'application/pdf', disposition)
+    
+    if response is None:
+        return jsonify({'error': 'Document file not found'}), 404
+    
     return response
 
 # Get QR code route
 @api_bp.route('/documents/<int:document_id>/qrcode')
 def get_qrcode(document_id):
     # Connect to database
-    conn = get_db()
+    conn = get_read_db()
     cursor = conn.cursor()
     
     # Get document
-    cursor.execute('SELECT filename FROM documents WHERE id = ?', (document_id,))
+    cursor.execute('SELECT id, filename, qr_hash, qr_url FROM documents WHERE id = ?', (document_id,))
     document = cursor.fetchone()
     
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    # Generate QR code if it doesn't exist or needs to be regenerated
-    qr_filename = "{}.png".format(document['filename'].split('.')[0])
-    qr_path = os.path.join(current_app.root_path, QRCODE_DIR, qr_filename)
-    
-    if should_regenerate_qr_code(document_id, qr_path):
-        generate_qr_code(document_id, document['filename'])
-    
-    # Ensure QR code directory exists
-    qrcode_dir = os.path.join(current_app.root_path, QRCODE_DIR)
-    os.makedirs(qrcode_dir, exist_ok=True)
-    
-    # Serve QR code
-    return send_from_directory(os.path.join(current_app.root_path, QRCODE_DIR), qr_filename)
-
-def should_regenerate_qr_code(document_id, qr_path):
-    # Check if QR code file exists
-    if not os.path.exists(qr_path):
-        return True
+    # Recorded QR code, rendered on demand if it isn't ready yet
+    hash_value, data = document_qr_code(document)
     
-    # Check if QR code is valid by reading its content
-    try:
-        qr = qrcode.QRCode()
-        qr.add_data(f"{request.url_root.rstrip('/')}/mobile-viewer.html?id={document_id}")
-        qr.make(fit=True)
-        
-        # Read existing QR code
-        existing_qr = qrcode.QRCode()
-        img = qrcode.image.pil.PilImage.open(qr_path)
-        existing_qr.add_data(img.getdata())
-        existing_qr.make(fit=True)
-        
-        # Compare the data
-        return qr.data != existing_qr.data
-    except Exception:
-        return True
+    # Serve QR code; the hash is a strong ETag since files are content-addressed
+    response = current_app.response_class(data, mimetype='image/png')
+    response.set_etag(hash_value)
+    if request.args.get('v') == hash_value:
+        response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(QR_IMMUTABLE_MAX_AGE)
+    else:
+        # Unversioned URL, clients must revalidate with the ETag
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 # Generate QR code route
-@api_bp.route('/qrcode', methods=['POST'])
+# Parameters (JSON body for POST, query string for GET): text, format
+# (png, png-compact or svg), box_size, border, error_correction (L/M/Q/H)
+@api_bp.route('/qrcode', methods=['GET', 'POST'])
 def generate_qrcode():
-    data = request.get_json()
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args
     if not data or 'text' not in data:
         return jsonify({'error': 'Text is required'}), 400
     
-    text = data['text']
+    text = str(data['text'])
+    fmt = str(data.get('format', 'png')).lower()
+    error_correction = str(data.get('error_correction', 'L')).upper()
     
-    # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(text)
-    qr.make(fit=True)
+    if fmt not in QR_FORMATS:
+        return jsonify({'error': 'Format must be one of: {}'.format(', '.join(QR_FORMATS))}), 400
     
-    # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
+    if error_correction not in QR_ERROR_CORRECTION:
+        return jsonify({'error': 'Error correction must be one of: L, M, Q, H'}), 400
     
-    # Convert to bytes
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    try:
+        box_size = int(data.get('box_size', 10))
+        border = int(data.get('border', 4))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'box_size and border must be integers'}), 400
     
-    # Return image
-    return send_file(
-        io.BytesIO(img_byte_arr),
-        mimetype='image/png'
-    )
+    if not 1 <= box_size <= QR_MAX_BOX_SIZE or not 0 <= border <= QR_MAX_BORDER:
+        return jsonify({'error': 'box_size must be 1-{} and border 0-{}'.format(QR_MAX_BOX_SIZE, QR_MAX_BORDER)}), 400
+    
+    # Identical requests are served from the render cache
+    try:
+        etag, image = render_qr_cached(text, box_size, border, error_correction, fmt)
+    except (qrcode.exceptions.DataOverflowError, ValueError):
+        return jsonify({'error': 'Text is too long for a QR code'}), 400
+    
+    # Let clients revalidate with If-None-Match
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(image, mimetype=QR_FORMATS[fmt])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age={}'.format(QR_RENDER_MAX_AGE)
+    return response
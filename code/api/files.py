@@ -0,0 +1,197 @@
+import os
+import hashlib
+import datetime
+import tempfile
+from urllib.parse import quote
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+from werkzeug.datastructures import ContentRange
+from werkzeug.wsgi import wrap_file
+
+# Upload directory
+UPLOAD_DIR = 'static/uploads'
+
+# Staging directory for files being uploaded, inside the upload directory so
+# moving a finished upload into place is a rename on the same filesystem
+UPLOAD_STAGING_DIR = os.path.join(UPLOAD_DIR, '.staging')
+
+# Block size for copying and hashing uploaded files
+COPY_BLOCK_SIZE = 256 * 1024
+
+# File delivery offload modes (app.config['FILE_OFFLOAD_MODE']):
+#   None               - stream from Python (sendfile via wsgi.file_wrapper when the server supports it)
+#   'x-accel-redirect' - nginx serves the file from an internal location
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd serve the file
+OFFLOAD_MODES = (None, 'x-accel-redirect', 'x-sendfile')
+
+
+
+# Write data to path atomically (readers never see a partial file)
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Save a stream to a new file in directory, hashing it on the way.
+# Returns (path, sha256 hex digest).
+def save_stream(stream, directory):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    hasher = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                block = stream.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, hasher.hexdigest()
+
+# The length bytes of a file from its current position, for
+# wsgi.file_wrapper: servers using sendfile send Content-Length bytes from
+# the file's offset, others read through the limit
+class FileRange:
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+# Check whether the If-Range precondition (if any) allows a partial response
+def _if_range_matches(etag, last_modified):
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return last_modified <= if_range.date
+    return True
+
+# Start a file response with validators and caching headers
+def _file_response(etag, last_modified, mimetype, disposition, cache_control):
+    response = current_app.response_class(mimetype=mimetype, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control
+    if disposition:
+        response.headers['Content-Disposition'] = disposition
+    return response
+
+# Apply the request's Range header to response.
+# Returns (start, length) to send, or None if the range is unsatisfiable.
+# Multiple ranges (multipart/byteranges) aren't supported; the whole file
+# is sent instead, as for other units.
+def _apply_range(response, etag, last_modified, size):
+    byte_range = request.range
+    if (not byte_range or byte_range.units != 'bytes' or len(byte_range.ranges) != 1
+            or not _if_range_matches(etag, last_modified)):
+        return 0, size
+
+    byte_range = byte_range.range_for_length(size)
+    if byte_range is None:
+        # Unsatisfiable range
+        response.status_code = 416
+        response.content_range = ContentRange('bytes', None, None, size)
+        return None
+
+    start, end = byte_range
+    response.status_code = 206
+    response.content_range = ContentRange('bytes', start, end, size)
+    return start, end - start
+
+# Send a file with validated conditional (ETag / Last-Modified) and byte-range
+# support, offloading the transfer to the front-end server when configured.
+# offload_path is the file's path relative to the offload root (None to
+# always send from Python).
+def send_stored_file(path, offload_path, mimetype, disposition=None, cache_control='no-cache'):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    size = stat.st_size
+    etag = '{:x}-{:x}'.format(stat.st_mtime_ns, size)
+    last_modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc)
+
+    response = _file_response(etag, last_modified, mimetype, disposition, cache_control)
+
+    # Conditional request: nothing to send
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    # Offload: the front-end server handles the transfer, including ranges
+    mode = current_app.config.get('FILE_OFFLOAD_MODE') if offload_path is not None else None
+    if mode == 'x-accel-redirect':
+        prefix = current_app.config.get('FILE_OFFLOAD_PREFIX', '/protected/')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(offload_path)
+        return response
+    if mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+    byte_range = _apply_range(response, etag, last_modified, size)
+    if byte_range is None:
+        return response
+    start, length = byte_range
+
+    # The WSGI server may use os.sendfile via wsgi.file_wrapper, for ranges
+    # too (from the file's offset, for Content-Length bytes)
+    f = open(path, 'rb')
+    if length == size:
+        response.response = wrap_file(request.environ, f)
+    else:
+        f.seek(start)
+        response.response = wrap_file(request.environ, FileRange(f, length))
+    response.content_length = length
+    return response
+
+# Send an object from a storage backend that has no local path (see
+# api/storage.py), with the same conditional and byte-range handling
+def send_stored_object(store, key, mimetype, disposition=None, cache_control='no-cache'):
+    stat = store.stat(key)
+    if stat is None:
+        return None
+
+    size, etag, last_modified = stat
+    response = _file_response(etag, last_modified, mimetype, disposition, cache_control)
+
+    # Conditional request: nothing to send
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    byte_range = _apply_range(response, etag, last_modified, size)
+    if byte_range is None:
+        return response
+    start, length = byte_range
+
+    if length == size:
+        response.response = store.stream(key)
+    else:
+        response.response = [store.range(key, start, length)]
+    response.content_length = length
+    return response
@@ -1,7 +1,9 @@
 import sqlite3
 from flask import request, jsonify, g
 from . import api_bp
-from .auth import token_required, admin_required, get_db
+from .auth import token_required, admin_required
+from .db import get_db
+from .streaming import requested_stream_format, stream_rows
 
 # Get groups route
 @api_bp.route('/groups', methods=['GET'])
@@ -17,8 +19,7 @@ def get_groups():
         cursor.execute('SELECT * FROM user_groups ORDER BY created_at DESC')
     elif g.current_user['role'] == 'group_admin':
         # Group admin can only see their own group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        group_id = cursor.fetchone()['group_id']
+        group_id = g.current_user['group_id']
         
         if not group_id:
             # User doesn't belong to any group
@@ -54,10 +55,8 @@ def get_group(group_id):
     
     # Check if user is admin, group_admin, or in the group
     if not g.current_user['is_admin']:
-        cursor.execute('SELECT group_id, role FROM users WHERE id = ?', (g.current_user['id'],))
-        user = cursor.fetchone()
-        user_group_id = user['group_id']
-        user_role = user['role'] if 'role' in user.keys() else 'user'
+        user_group_id = g.current_user['group_id']
+        user_role = g.current_user['role']
         
         if user_group_id != group_id:
             return jsonify({'error': 'You do not have permission to view this group'}), 403
@@ -74,7 +73,6 @@ def get_group(group_id):
     
     # Get users in group
     cursor.execute('SELECT id, username, created_by, created_at FROM users WHERE group_id = ?', (group_id,))
-    users = cursor.fetchall()
     
     # Convert to dictionaries
     group_dict = {
@@ -85,18 +83,24 @@ def get_group(group_id):
         'created_at': group['created_at']
     }
     
-    users_list = []
-    for user in users:
-        users_list.append({
+    def user_to_dict(user):
+        return {
             'id': user['id'],
             'username': user['username'],
             'created_by': user['created_by'],
             'created_at': user['created_at']
-        })
+        }
+    
+    # Stream large member lists straight from the cursor
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_rows(cursor, 'users', user_to_dict, stream_format, {'group': group_dict})
+    
+    users = cursor.fetchall()
     
     return jsonify({
         'group': group_dict,
-        'users': users_list
+        'users': [user_to_dict(user) for user in users]
     })
 
 # Create group route
@@ -149,10 +153,7 @@ def update_group(group_id):
             return jsonify({'error': 'You do not have permission to update this group'}), 403
         
         # Check if group_admin belongs to this group
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        user_group_id = cursor.fetchone()['group_id']
+        user_group_id = g.current_user['group_id']
         
         if user_group_id != group_id:
             return jsonify({'error': 'You do not have permission to update this group'}), 403
@@ -0,0 +1,435 @@
+import os
+import json
+import hmac
+import time
+import bisect
+import ipaddress
+import threading
+from contextlib import contextmanager
+from flask import request, current_app, g, has_request_context
+from werkzeug.wsgi import FileWrapper
+from . import api_bp
+from .files import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where the app runs in one process
+    fcntl = None
+
+# Histogram buckets (upper bounds; +Inf is implied)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Metrics: name -> (type, help, histogram buckets)
+METRICS = {
+    'docnest_http_requests_total': (
+        'counter', 'API requests by endpoint, method and status.', None),
+    'docnest_http_request_duration_seconds': (
+        'histogram', 'API request time until the response is ready, by endpoint and status.', LATENCY_BUCKETS),
+    'docnest_http_requests_in_flight': (
+        'gauge', 'API requests being handled, by endpoint.', None),
+    'docnest_http_response_bytes_total': (
+        'counter', 'API response body bytes the server took from Python, counted when the response is closed '
+                   '(file bodies passed to the server are in docnest_http_file_response_bytes_total), by endpoint.',
+        None),
+    'docnest_http_file_response_bytes_total': (
+        'counter', 'Length of file bodies passed to the server as files (sent with sendfile where available, '
+                   'so also bytes a disconnected client never received), by endpoint.', None),
+    'docnest_db_queries_per_request': (
+        'histogram', 'SQLite statements executed per API request, by endpoint.', COUNT_BUCKETS),
+    'docnest_db_seconds_per_request': (
+        'histogram', 'Time spent in SQLite per API request, by endpoint.', LATENCY_BUCKETS),
+    'docnest_db_queries_total': (
+        'counter', 'SQLite statements executed, by endpoint ("background" outside requests).', None),
+    'docnest_db_seconds_total': (
+        'counter', 'Time spent in SQLite, by endpoint ("background" outside requests).', None),
+    'docnest_jwt_verify_seconds': (
+        'histogram', 'JWT verification time (including the decoded-token cache).', FAST_BUCKETS),
+    'docnest_jwt_cache_requests_total': (
+        'counter', 'Decoded-token cache lookups by result.', None),
+    'docnest_qr_render_seconds': (
+        'histogram', 'QR code render time by format.', FAST_BUCKETS),
+    'docnest_qr_cache_requests_total': (
+        'counter', 'In-memory QR cache lookups by cache (document, render) and result.', None),
+}
+
+# Seconds between writes of this process's snapshot to the metrics
+# directory (only when something changed)
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Files in the metrics directory besides the per-process <pid>.json
+# snapshots: the summed values of exited processes, and the lock taken
+# while they are merged
+METRICS_EXITED_FILE = 'exited.json'
+METRICS_LOCK_FILE = '.lock'
+
+# Clients allowed to read /metrics when no METRICS_TOKEN is configured
+METRICS_LOCAL_NETWORKS = (ipaddress.ip_network('127.0.0.0/8'), ipaddress.ip_network('::1/128'))
+
+# Values of this process. Labels are tuples of (name, value) pairs.
+# (name, labels) -> value for counters and gauges
+_values = {}
+# (name, labels) -> [count per bucket..., count above the last bucket, sum]
+_histograms = {}
+_lock = threading.Lock()
+_version = 0
+
+# Functions returning (name, labels, value) of counters kept elsewhere
+# (e.g. cache statistics), read when a snapshot is taken
+_collectors = []
+
+# Directory shared by the worker processes (app.config['METRICS_DIR']):
+# each writes its snapshot there, /metrics merges them. None when the app
+# runs in a single process.
+_directory = None
+_flusher_pid = None
+_flushed_pid = None
+
+
+# Add value to a counter or gauge
+def inc(name, labels=(), value=1):
+    global _version
+    key = (name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+        _version += 1
+
+# Record an observation in a histogram
+def observe(name, labels, value):
+    global _version
+    buckets = METRICS[name][2]
+    key = (name, labels)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+        _version += 1
+
+# Register a collector function (see _collectors)
+def register_collector(collector):
+    _collectors.append(collector)
+
+# Record a SQLite statement (count 1) or time spent fetching rows (count 0),
+# attributed to the current request if any
+def record_query(seconds, count=1):
+    if has_request_context():
+        state = g.get('_metrics')
+        if state is not None:
+            state['db_queries'] += count
+            state['db_seconds'] += seconds
+            return
+    labels = (('endpoint', 'background'),)
+    inc('docnest_db_queries_total', labels, count)
+    inc('docnest_db_seconds_total', labels, seconds)
+
+# Snapshot of this process's metrics
+def snapshot():
+    with _lock:
+        values = [[name, labels, value] for (name, labels), value in _values.items()]
+        histograms = [[name, labels, list(counts)] for (name, labels), counts in _histograms.items()]
+    for collector in _collectors:
+        values.extend([name, labels, value] for name, labels, value in collector())
+    return {'pid': os.getpid(), 'values': values, 'histograms': histograms}
+
+def snapshot_path(directory, pid):
+    return os.path.join(directory, '{}.json'.format(pid))
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Hold the metrics directory lock: exclusive while snapshots are merged,
+# shared while they are read, so no scrape counts a snapshot twice
+@contextmanager
+def _directory_lock(directory, exclusive):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, METRICS_LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# Fold the snapshot of an exited process into METRICS_EXITED_FILE (its
+# counters and histograms; gauges are dropped) and remove it, so the
+# directory doesn't grow with every replaced worker and a new process
+# reusing the pid doesn't overwrite it
+def merge_exited(directory, pid):
+    path = snapshot_path(directory, pid)
+    exited_path = os.path.join(directory, METRICS_EXITED_FILE)
+    try:
+        with _directory_lock(directory, exclusive=True):
+            data = _read_snapshot(path)
+            if data is None:
+                return
+            data['values'] = [value for value in data['values'] if METRICS[value[0]][0] != 'gauge']
+            snapshots = [data]
+            exited = _read_snapshot(exited_path)
+            if exited is not None:
+                snapshots.append(exited)
+
+            values, histograms = _sum(snapshots)
+            merged = {
+                'values': [[name, labels, value] for (name, labels), value in values.items()],
+                'histograms': [[name, labels, counts] for (name, labels), counts in histograms.items()],
+            }
+            write_atomic(exited_path, json.dumps(merged).encode('utf-8'))
+            os.remove(path)
+    except OSError as e:
+        print(f"Failed to merge metrics snapshot of process {pid}: {e}")
+
+# Write this process's snapshot to the metrics directory. A snapshot left
+# there under this pid belongs to an exited process and is merged first.
+def flush():
+    global _flushed_pid
+    if _directory is None:
+        return
+    pid = os.getpid()
+    if _flushed_pid != pid:
+        merge_exited(_directory, pid)
+        _flushed_pid = pid
+    try:
+        write_atomic(snapshot_path(_directory, pid), json.dumps(snapshot()).encode('utf-8'))
+    except OSError as e:
+        print(f"Failed to write metrics snapshot: {e}")
+
+# Write the snapshot every METRICS_FLUSH_INTERVAL while it changes
+def _flush_loop(pid):
+    flushed = None
+    while os.getpid() == pid:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _version != flushed:
+            flushed = _version
+            flush()
+
+# Start this process's flush thread, once per process
+def _ensure_flusher():
+    global _flusher_pid
+    if _directory is None or _flusher_pid == os.getpid():
+        return
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, args=(_flusher_pid,), name='metrics-flush', daemon=True).start()
+
+# Forget the values of the parent process in a freshly forked child
+def reset():
+    global _lock, _flusher_pid
+    _lock = threading.Lock()
+    _values.clear()
+    _histograms.clear()
+    _flusher_pid = None
+
+# Remove the snapshots of an earlier run (at server start)
+def clear_directory(directory):
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            os.remove(entry.path)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Pids of the snapshots in the metrics directory
+def _snapshot_pids(directory):
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+
+    pids = []
+    for entry in entries:
+        name, extension = os.path.splitext(entry.name)
+        if extension == '.json' and name.isdigit():
+            pids.append(int(name))
+    return pids
+
+# Snapshots of all processes: this one's live values, the other running
+# processes' files and the merged values of exited processes (whose
+# counters and histograms are kept, so totals never go backwards)
+def _all_snapshots():
+    snapshots = [snapshot()]
+    if _directory is None:
+        return snapshots
+
+    # Exited processes not merged yet (e.g. the ASGI service, which has no
+    # exit hook)
+    for pid in _snapshot_pids(_directory):
+        if pid != os.getpid() and not _process_alive(pid):
+            merge_exited(_directory, pid)
+
+    try:
+        with _directory_lock(_directory, exclusive=False):
+            paths = [os.path.join(_directory, METRICS_EXITED_FILE)]
+            paths.extend(snapshot_path(_directory, pid) for pid in _snapshot_pids(_directory) if pid != os.getpid())
+            for path in paths:
+                data = _read_snapshot(path)
+                if data is not None:
+                    snapshots.append(data)
+    except OSError as e:
+        print(f"Failed to read metrics snapshots: {e}")
+    return snapshots
+
+# Sum snapshots.
+# Returns ({(name, labels): value}, {(name, labels): histogram counts}).
+def _sum(snapshots):
+    values = {}
+    histograms = {}
+    for data in snapshots:
+        for name, labels, value in data['values']:
+            key = (name, tuple(tuple(label) for label in labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, counts in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.get(key)
+            histograms[key] = counts if total is None else [a + b for a, b in zip(total, counts)]
+    return values, histograms
+
+# Sum the snapshots of all processes
+def collect():
+    return _sum(_all_snapshots())
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    ) for name, value in labels) + '}'
+
+# Prometheus text exposition format of collected metrics
+def render(values, histograms):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == 'histogram':
+            samples = sorted((labels, counts) for (metric, labels), counts in histograms.items() if metric == name)
+        else:
+            samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+        if not samples:
+            continue
+
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, sample in samples:
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(sample)))
+                continue
+
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), sample[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(bound)
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(sample[-1])))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+# Start timing an API request
+@api_bp.before_request
+def start_request_metrics():
+    g._metrics = {'started': time.perf_counter(), 'db_queries': 0, 'db_seconds': 0.0, 'status': 500}
+    inc('docnest_http_requests_in_flight', (('endpoint', request.endpoint),))
+
+# Response body counting the bytes the server takes from it, recorded when
+# the server closes the response (also after a client disconnects)
+class CountingBody:
+    def __init__(self, body, labels):
+        self.body = body
+        self.labels = labels
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            inc('docnest_http_response_bytes_total', self.labels, self.sent)
+
+# Check whether a response body is the server's file wrapper, which the
+# server may send with sendfile (wrapping it would prevent that)
+def is_file_wrapper(body):
+    wrapper = request.environ.get('wsgi.file_wrapper', FileWrapper)
+    return isinstance(wrapper, type) and isinstance(body, wrapper)
+
+# Note the response status and count the bytes of its body (registered
+# first, so this runs after the other hooks, e.g. compression)
+@api_bp.after_request
+def record_response_metrics(response):
+    state = g.get('_metrics')
+    if state is not None:
+        state['status'] = response.status_code
+        labels = (('endpoint', request.endpoint),)
+        if is_file_wrapper(response.response):
+            inc('docnest_http_file_response_bytes_total', labels, response.content_length or 0)
+        else:
+            response.response = CountingBody(response.response, labels)
+    return response
+
+# Record the request (also when the view raised)
+@api_bp.teardown_request
+def finish_request_metrics(exc):
+    state = g.pop('_metrics', None)
+    if state is None:
+        return
+
+    endpoint = request.endpoint
+    elapsed = time.perf_counter() - state['started']
+    endpoint_labels = (('endpoint', endpoint),)
+    status_labels = (('endpoint', endpoint), ('status', str(state['status'])))
+
+    inc('docnest_http_requests_in_flight', endpoint_labels, -1)
+    inc('docnest_http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(state['status']))))
+    observe('docnest_http_request_duration_seconds', status_labels, elapsed)
+    observe('docnest_db_queries_per_request', endpoint_labels, state['db_queries'])
+    observe('docnest_db_seconds_per_request', endpoint_labels, state['db_seconds'])
+    inc('docnest_db_queries_total', endpoint_labels, state['db_queries'])
+    inc('docnest_db_seconds_total', endpoint_labels, state['db_seconds'])
+    _ensure_flusher()
+
+# Check whether the client may read /metrics: with the bearer token when
+# METRICS_TOKEN is set, otherwise from the local host only
+def metrics_allowed():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token)
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in network for network in METRICS_LOCAL_NETWORKS)
+
+# Metrics route (Prometheus text format, summed over all worker processes)
+def get_metrics():
+    if not metrics_allowed():
+        return current_app.response_class('Forbidden\n', status=403, mimetype='text/plain')
+    return current_app.response_class(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Set up metrics for the app
+def init_app(app):
+    global _directory
+    _directory = app.config.get('METRICS_DIR')
+    if _directory:
+        os.makedirs(_directory, exist_ok=True)
+    app.add_url_rule('/metrics', 'metrics', get_metrics)
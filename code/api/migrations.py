@@ -0,0 +1,211 @@
+import sqlite3
+
+# Tokenizers of documents_fts in order of preference. trigram (SQLite
+# 3.34+) matches any substring of 3 or more characters, which also works for
+# Chinese text that has no spaces between words; unicode61 matches words.
+FTS_TOKENIZERS = ('trigram', 'unicode61')
+
+# Best FTS5 tokenizer this SQLite build supports, None without FTS5
+def probe_fts_tokenizer():
+    conn = sqlite3.connect(':memory:')
+    try:
+        for tokenizer in FTS_TOKENIZERS:
+            try:
+                conn.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize = '{}')".format(tokenizer))
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        return None
+    finally:
+        conn.close()
+
+# Without FTS5 the index is not created and search falls back to substring
+# matching of the document columns (see api/search.py)
+FTS_TOKENIZER = probe_fts_tokenizer()
+
+# documents_fts and the triggers keeping it in sync with documents.
+# rowid = documents.id; content is filled in by the text stage, the other
+# columns are kept in sync by the triggers. Permissions and visibility are
+# checked by joining documents at query time.
+FTS_SCHEMA = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5('
+    "file_number, original_filename, title, content, tokenize = '{}')".format(FTS_TOKENIZER),
+    "INSERT INTO documents_fts (rowid, file_number, original_filename, title, content) "
+    "SELECT id, file_number, original_filename, COALESCE(pdf_title, ''), '' FROM documents",
+    'CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN '
+    "INSERT INTO documents_fts (rowid, file_number, original_filename, title, content) "
+    "VALUES (new.id, new.file_number, new.original_filename, COALESCE(new.pdf_title, ''), ''); "
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN '
+    'DELETE FROM documents_fts WHERE rowid = old.id; '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS documents_fts_update '
+    'AFTER UPDATE OF file_number, original_filename, pdf_title ON documents BEGIN '
+    'UPDATE documents_fts SET file_number = new.file_number, original_filename = new.original_filename, '
+    "title = COALESCE(new.pdf_title, '') WHERE rowid = new.id; "
+    'END',
+]
+
+# Schema version that adds documents_fts
+FTS_SCHEMA_VERSION = 7
+
+# Ordered schema migrations. Each entry is (version, description, statements);
+# the applied version is tracked in the database via PRAGMA user_version.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    (1, 'Add indexes for document and user hot paths', [
+        # query_document: file_number + inspection_date + is_visible
+        'CREATE INDEX IF NOT EXISTS idx_documents_lookup '
+        'ON documents (file_number, inspection_date, is_visible)',
+        # get_documents for group members, ordered by upload date;
+        # also serves the duplicate file number check in upload_document
+        'CREATE INDEX IF NOT EXISTS idx_documents_group_upload '
+        'ON documents (group_id, upload_date)',
+        # get_documents for the uploader, ordered by upload date
+        'CREATE INDEX IF NOT EXISTS idx_documents_uploader_upload '
+        'ON documents (uploaded_by, upload_date)',
+        # get_documents for admins, ordered by upload date
+        'CREATE INDEX IF NOT EXISTS idx_documents_upload_date '
+        'ON documents (upload_date)',
+        # get_users / get_group / delete_group filter users by group
+        'CREATE INDEX IF NOT EXISTS idx_users_group '
+        'ON users (group_id, created_at)',
+    ]),
+    (2, 'Track membership version for token claims', [
+        # Bumped whenever a user's group, role or username changes so tokens
+        # carrying stale claims are detected
+        'ALTER TABLE users ADD COLUMN membership_version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (3, 'Store the content-addressed QR code of each document', [
+        # URL encoded in the QR code and its sha256, which names the QR file
+        'ALTER TABLE documents ADD COLUMN qr_url TEXT',
+        'ALTER TABLE documents ADD COLUMN qr_hash TEXT',
+    ]),
+    (4, 'Track QR code generation status', [
+        # pending / ready / failed, QR codes are generated in the background
+        "ALTER TABLE documents ADD COLUMN qr_status TEXT NOT NULL DEFAULT 'pending'",
+        "UPDATE documents SET qr_status = 'ready' WHERE qr_hash IS NOT NULL",
+    ]),
+    (5, 'Store PDF metadata extracted after upload', [
+        # Filled in by the preview stage (api/previews.py); page_sizes is a
+        # JSON list of [width, height] in PDF points
+        'ALTER TABLE documents ADD COLUMN page_count INTEGER',
+        'ALTER TABLE documents ADD COLUMN page_sizes TEXT',
+        'ALTER TABLE documents ADD COLUMN pdf_title TEXT',
+        'ALTER TABLE documents ADD COLUMN pdf_producer TEXT',
+        # pending / ready / failed
+        "ALTER TABLE documents ADD COLUMN preview_status TEXT NOT NULL DEFAULT 'pending'",
+    ]),
+    (6, 'Store uploads by content hash', [
+        # sha256 of the file body, stored as ab/cd/<hash>.pdf and shared by
+        # every document with the same content; NULL for files uploaded
+        # before deduplication (see dedupe_uploads.py)
+        'ALTER TABLE documents ADD COLUMN content_hash TEXT',
+        # delete_document counts the remaining references
+        'CREATE INDEX IF NOT EXISTS idx_documents_content_hash '
+        'ON documents (content_hash)',
+    ]),
+    (7, 'Add full-text search over document contents', [
+        # pending / ready / failed, text is extracted in the background
+        # (api/texts.py, backfill_texts.py)
+        "ALTER TABLE documents ADD COLUMN text_status TEXT NOT NULL DEFAULT 'pending'",
+        # documents_fts, skipped when SQLite lacks FTS5 (created later by
+        # run_migrations once it is available)
+    ] + (FTS_SCHEMA if FTS_TOKENIZER else [])),
+]
+
+# Queries that must be served by an index (or the rowid) rather than a full
+# table scan. Parameters are placeholders, only the plan matters.
+HOT_QUERIES = [
+    ('query_document',
+     'SELECT id FROM documents WHERE file_number = ? AND inspection_date = ? AND is_visible = 1',
+     ('A1', '2024-01-01')),
+    ('autocomplete file numbers',
+     'SELECT DISTINCT file_number FROM documents WHERE file_number >= ? AND file_number < ? AND is_visible = 1 '
+     'ORDER BY file_number LIMIT ?',
+     ('A', 'B', 10)),
+    ('autocomplete inspection dates',
+     'SELECT DISTINCT file_number, inspection_date FROM documents WHERE file_number IN (?, ?) AND is_visible = 1',
+     ('A1', 'A2')),
+    ('upload_document duplicate check (group)',
+     'SELECT COUNT(*) FROM documents WHERE file_number = ? AND group_id = ?',
+     ('A1', 1)),
+    ('upload_document duplicate check (no group)',
+     'SELECT COUNT(*) FROM documents WHERE file_number = ? AND uploaded_by = ? AND group_id IS NULL',
+     ('A1', 1)),
+    ('get_documents (admin)',
+     'SELECT id FROM documents ORDER BY upload_date DESC',
+     ()),
+    ('get_documents (group)',
+     'SELECT id FROM documents WHERE group_id = ? OR uploaded_by = ? ORDER BY upload_date DESC',
+     (1, 1)),
+    ('get_documents (uploader)',
+     'SELECT id FROM documents WHERE uploaded_by = ? ORDER BY upload_date DESC',
+     (1,)),
+    ('delete_document reference count',
+     'SELECT COUNT(*) FROM documents WHERE content_hash = ?',
+     ('0' * 64,)),
+    ('user group lookup',
+     'SELECT group_id FROM users WHERE id = ?',
+     (1,)),
+    ('get_users (group)',
+     'SELECT id FROM users WHERE group_id = ? ORDER BY created_at DESC',
+     (1,)),
+]
+
+# Get the schema version stored in the database
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+# Apply all pending migrations in order, each in its own transaction
+def run_migrations(conn):
+    current = get_schema_version(conn)
+    applied = []
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        conn.execute('BEGIN')
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('PRAGMA user_version = {}'.format(int(version)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        applied.append((version, description))
+
+    # Databases migrated by a SQLite build without FTS5 get the index once
+    # FTS5 is available; backfill_texts.py then fills in the text
+    if FTS_TOKENIZER and get_schema_version(conn) >= FTS_SCHEMA_VERSION and not has_fts_index(conn):
+        conn.execute('BEGIN')
+        try:
+            for statement in FTS_SCHEMA:
+                conn.execute(statement)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        applied.append((FTS_SCHEMA_VERSION, 'Create the full-text search index'))
+
+    return applied
+
+# Whether the database has the full-text search index
+def has_fts_index(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'").fetchone()
+    return row is not None
+
+# Return the hot queries whose plan contains a full table scan
+def check_query_plans(conn):
+    regressions = []
+    for name, sql, params in HOT_QUERIES:
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        details = [row[-1] for row in plan]
+        # "SCAN <table>" without "USING ... INDEX" is a full table scan
+        scans = [d for d in details if d.startswith('SCAN') and 'INDEX' not in d]
+        if scans:
+            regressions.append((name, details))
+    return regressions
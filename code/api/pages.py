@@ -0,0 +1,194 @@
+import io
+import os
+import json
+import shutil
+from flask import request, jsonify, current_app, url_for
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+from . import api_bp
+from .db import get_read_db
+from .files import write_atomic, send_stored_file
+from .storage import get_storage
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # raster page images are optional
+    pdfium = None
+
+# Per-document cache of single pages, raster pages and manifests
+PAGES_DIR = 'static/pages'
+
+# Page output formats and their MIME types
+PAGE_FORMATS = {
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+# Raster widths are rounded up to a multiple of this step (and clamped) so
+# the cache holds a bounded number of variants per page
+PAGE_WIDTH_STEP = 200
+PAGE_MIN_WIDTH = 200
+PAGE_MAX_WIDTH = 2000
+PAGE_DEFAULT_WIDTH = 1000
+
+# Pages never change for a given document, so cache them for a day
+PAGE_CACHE_CONTROL = 'public, max-age=86400'
+
+
+# Cache directory of a document's pages
+def page_cache_dir(root_path, filename):
+    return os.path.join(root_path, PAGES_DIR, os.path.splitext(filename)[0])
+
+# Remove a document's cached pages (e.g. when the document is deleted)
+def remove_page_cache(root_path, filename):
+    shutil.rmtree(page_cache_dir(root_path, filename), ignore_errors=True)
+
+# Round a requested raster width to a cached width bucket
+def bucket_width(width):
+    width = -(-width // PAGE_WIDTH_STEP) * PAGE_WIDTH_STEP
+    return max(PAGE_MIN_WIDTH, min(width, PAGE_MAX_WIDTH))
+
+# Page sizes of an open PDF (in PDF points, rotation applied)
+def read_page_sizes(reader):
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        width = float(page.mediabox.width)
+        height = float(page.mediabox.height)
+        if (page.get('/Rotate') or 0) % 180 == 90:
+            width, height = height, width
+        pages.append({'number': number, 'width': round(width, 2), 'height': round(height, 2)})
+    return pages
+
+# Read page count and page sizes
+def build_manifest(pdf_path):
+    pages = read_page_sizes(PdfReader(pdf_path))
+    return {'page_count': len(pages), 'pages': pages}
+
+# Store a manifest in the page cache
+def save_manifest(root_path, filename, manifest):
+    manifest_path = os.path.join(page_cache_dir(root_path, filename), 'manifest.json')
+    write_atomic(manifest_path, json.dumps(manifest).encode('utf-8'))
+
+# Load the manifest from cache, building it on first use
+def load_manifest(root_path, filename):
+    manifest_path = os.path.join(page_cache_dir(root_path, filename), 'manifest.json')
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    with get_storage('uploads').local_copy(filename) as pdf_path:
+        manifest = build_manifest(pdf_path)
+    save_manifest(root_path, filename, manifest)
+    return manifest
+
+# Extract one page as a standalone PDF
+def render_page_pdf(pdf_path, number):
+    reader = PdfReader(pdf_path)
+    writer = PdfWriter()
+    writer.add_page(reader.pages[number - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+# Rasterize one page at the given pixel width
+def render_page_image(pdf_path, number, width, fmt):
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page = pdf[number - 1]
+        scale = width / page.get_width()
+        image = page.render(scale=scale).to_pil()
+        buffer = io.BytesIO()
+        if fmt == 'webp':
+            image.save(buffer, format='WEBP', quality=80, method=4)
+        else:
+            image.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+    finally:
+        pdf.close()
+
+# Look up a document's stored file name, None if the document doesn't exist
+def get_document_file(document_id):
+    cursor = get_read_db().cursor()
+    cursor.execute('SELECT filename FROM documents WHERE id = ?', (document_id,))
+    document = cursor.fetchone()
+    return document['filename'] if document else None
+
+# Document manifest route
+@api_bp.route('/documents/<int:document_id>/manifest')
+def get_document_manifest(document_id):
+    filename = get_document_file(document_id)
+    if not filename:
+        return jsonify({'error': 'Document not found'}), 404
+
+    try:
+        manifest = load_manifest(current_app.root_path, filename)
+    except FileNotFoundError:
+        return jsonify({'error': 'Document file not found'}), 404
+    except (PdfReadError, OSError, ValueError) as e:
+        return jsonify({'error': 'Unable to read PDF: {}'.format(e)}), 422
+
+    page_url = url_for('api.get_document_page', document_id=document_id, number=0)
+    response = jsonify({
+        'document_id': document_id,
+        'page_count': manifest['page_count'],
+        'pages': manifest['pages'],
+        'page_url_template': page_url.replace('/pages/0', '/pages/{number}'),
+        'formats': [fmt for fmt in PAGE_FORMATS if fmt == 'pdf' or pdfium is not None]
+    })
+    response.headers['Cache-Control'] = PAGE_CACHE_CONTROL
+    return response
+
+# Document page route
+# Query parameters: format (pdf, png or webp), width (raster formats only)
+@api_bp.route('/documents/<int:document_id>/pages/<int:number>')
+def get_document_page(document_id, number):
+    fmt = request.args.get('format', 'pdf').lower()
+    if fmt not in PAGE_FORMATS:
+        return jsonify({'error': 'Format must be one of: {}'.format(', '.join(PAGE_FORMATS))}), 400
+
+    if fmt != 'pdf' and pdfium is None:
+        return jsonify({'error': 'Page images are not available on this server'}), 501
+
+    try:
+        width = bucket_width(int(request.args.get('width', PAGE_DEFAULT_WIDTH)))
+    except ValueError:
+        return jsonify({'error': 'Width must be an integer'}), 400
+
+    filename = get_document_file(document_id)
+    if not filename:
+        return jsonify({'error': 'Document not found'}), 404
+
+    try:
+        manifest = load_manifest(current_app.root_path, filename)
+    except FileNotFoundError:
+        return jsonify({'error': 'Document file not found'}), 404
+    except (PdfReadError, OSError, ValueError) as e:
+        return jsonify({'error': 'Unable to read PDF: {}'.format(e)}), 422
+
+    if not 1 <= number <= manifest['page_count']:
+        return jsonify({'error': 'Page not found'}), 404
+
+    # Generate the page lazily on first request
+    if fmt == 'pdf':
+        page_name = 'page-{}.pdf'.format(number)
+    else:
+        page_name = 'page-{}-w{}.{}'.format(number, width, fmt)
+    page_path = os.path.join(page_cache_dir(current_app.root_path, filename), page_name)
+
+    if not os.path.exists(page_path):
+        try:
+            with get_storage('uploads').local_copy(filename) as pdf_path:
+                if fmt == 'pdf':
+                    data = render_page_pdf(pdf_path, number)
+                else:
+                    data = render_page_image(pdf_path, number, width, fmt)
+        except FileNotFoundError:
+            return jsonify({'error': 'Document file not found'}), 404
+        except Exception as e:
+            return jsonify({'error': 'Unable to render page: {}'.format(e)}), 422
+        write_atomic(page_path, data)
+
+    return send_stored_file(page_path, None, PAGE_FORMATS[fmt], cache_control=PAGE_CACHE_CONTROL)
@@ -0,0 +1,182 @@
+import io
+import os
+import json
+import hashlib
+from flask import request, jsonify, current_app
+from pypdf import PdfReader
+from . import api_bp
+from .db import get_thread_db
+from .files import write_atomic, send_stored_file
+from .pages import pdfium, page_cache_dir, read_page_sizes, save_manifest, get_document_file
+from .storage import get_storage
+
+# Preview status of a document
+PREVIEW_STATUS_PENDING = 'pending'
+PREVIEW_STATUS_READY = 'ready'
+PREVIEW_STATUS_FAILED = 'failed'
+
+# First-page thumbnail widths in pixels
+THUMBNAIL_SIZES = {
+    'small': 160,
+    'large': 480,
+}
+
+# Thumbnail formats and their MIME types
+THUMBNAIL_FORMATS = {
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+
+# Cache lifetime for versioned thumbnail URLs
+THUMBNAIL_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Records the extracted metadata of a document (parameters from
+# preview_values plus the document id)
+PREVIEW_UPDATE = ('UPDATE documents SET page_count = ?, page_sizes = ?, pdf_title = ?, pdf_producer = ?, '
+                  'preview_status = ? WHERE id = ?')
+
+
+# Path of a cached thumbnail (kept with the document's cached pages)
+def thumbnail_path(root_path, filename, size, fmt):
+    return os.path.join(page_cache_dir(root_path, filename), 'thumb-{}.{}'.format(size, fmt))
+
+# Version token for thumbnail URLs; stored files never change, so the
+# thumbnail of a given file can be cached forever
+def thumbnail_version(filename):
+    return hashlib.sha256(filename.encode('utf-8')).hexdigest()[:16]
+
+# Normalize a document information entry (None when empty)
+def _info_text(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+# Read page sizes and document information of a PDF
+def extract_metadata(pdf_path):
+    reader = PdfReader(pdf_path)
+    pages = read_page_sizes(reader)
+    info = reader.metadata
+    return {
+        'page_count': len(pages),
+        'pages': pages,
+        'title': _info_text(info.title) if info else None,
+        'producer': _info_text(info.producer) if info else None,
+    }
+
+# Render the first page once at the largest size and store every
+# thumbnail size and format
+def render_thumbnails(root_path, filename, pdf_path):
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page = pdf[0]
+        scale = max(THUMBNAIL_SIZES.values()) / page.get_width()
+        image = page.render(scale=scale).to_pil().convert('RGB')
+    finally:
+        pdf.close()
+
+    for size, width in THUMBNAIL_SIZES.items():
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height))
+        for fmt in THUMBNAIL_FORMATS:
+            buffer = io.BytesIO()
+            if fmt == 'webp':
+                resized.save(buffer, format='WEBP', quality=75, method=4)
+            else:
+                resized.save(buffer, format='PNG', optimize=True)
+            write_atomic(thumbnail_path(root_path, filename, size, fmt), buffer.getvalue())
+
+# Run the preview stage for one stored PDF: extract metadata, seed the page
+# manifest cache and render thumbnails (when pypdfium2 is available).
+# Returns the metadata.
+def build_preview(root_path, filename):
+    with get_storage('uploads').local_copy(filename) as pdf_path:
+        metadata = extract_metadata(pdf_path)
+        save_manifest(root_path, filename, {'page_count': metadata['page_count'], 'pages': metadata['pages']})
+        if pdfium is not None:
+            render_thumbnails(root_path, filename, pdf_path)
+    return metadata
+
+# Column values for a document's metadata, in the order of PREVIEW_UPDATE
+def preview_values(metadata):
+    page_sizes = json.dumps([[page['width'], page['height']] for page in metadata['pages']])
+    return (metadata['page_count'], page_sizes, metadata['title'], metadata['producer'], PREVIEW_STATUS_READY)
+
+# Background task: run the preview stage for a newly uploaded document
+def generate_document_preview(root_path, document_id):
+    conn = get_thread_db()
+    document = conn.execute('SELECT id, filename FROM documents WHERE id = ?', (document_id,)).fetchone()
+    if not document:
+        return
+
+    try:
+        metadata = build_preview(root_path, document['filename'])
+    except Exception:
+        conn.execute('UPDATE documents SET preview_status = ? WHERE id = ?', (PREVIEW_STATUS_FAILED, document_id))
+        conn.commit()
+        raise
+
+    conn.execute(PREVIEW_UPDATE, preview_values(metadata) + (document_id,))
+    conn.commit()
+
+# Background task: run the preview stage for a batch of newly uploaded
+# documents, recording the results with one transaction per batch
+def generate_documents_preview(root_path, document_ids):
+    conn = get_thread_db()
+    placeholders = ','.join('?' * len(document_ids))
+    documents = conn.execute(
+        'SELECT id, filename FROM documents WHERE id IN ({})'.format(placeholders), list(document_ids)
+    ).fetchall()
+
+    updates = []
+    failures = []
+    for document in documents:
+        try:
+            metadata = build_preview(root_path, document['filename'])
+        except Exception as e:
+            print(f"Failed to extract preview for document ID {document['id']}: {e}")
+            failures.append((PREVIEW_STATUS_FAILED, document['id']))
+            continue
+        updates.append(preview_values(metadata) + (document['id'],))
+
+    conn.executemany(PREVIEW_UPDATE, updates)
+    conn.executemany('UPDATE documents SET preview_status = ? WHERE id = ?', failures)
+    conn.commit()
+
+# Document thumbnail route
+# Query parameters: size (small or large), format (webp or png), v (version)
+@api_bp.route('/documents/<int:document_id>/thumbnail')
+def get_thumbnail(document_id):
+    size = request.args.get('size', 'small').lower()
+    fmt = request.args.get('format', 'webp').lower()
+
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': 'Size must be one of: {}'.format(', '.join(THUMBNAIL_SIZES))}), 400
+
+    if fmt not in THUMBNAIL_FORMATS:
+        return jsonify({'error': 'Format must be one of: {}'.format(', '.join(THUMBNAIL_FORMATS))}), 400
+
+    if pdfium is None:
+        return jsonify({'error': 'Thumbnails are not available on this server'}), 501
+
+    filename = get_document_file(document_id)
+    if not filename:
+        return jsonify({'error': 'Document not found'}), 404
+
+    # Render on demand if the preview stage hasn't run (yet)
+    path = thumbnail_path(current_app.root_path, filename, size, fmt)
+    if not os.path.exists(path):
+        try:
+            with get_storage('uploads').local_copy(filename) as pdf_path:
+                render_thumbnails(current_app.root_path, filename, pdf_path)
+        except FileNotFoundError:
+            return jsonify({'error': 'Document file not found'}), 404
+        except Exception as e:
+            return jsonify({'error': 'Unable to render thumbnail: {}'.format(e)}), 422
+
+    if request.args.get('v') == thumbnail_version(filename):
+        cache_control = 'public, max-age={}, immutable'.format(THUMBNAIL_IMMUTABLE_MAX_AGE)
+    else:
+        # Unversioned URL, clients must revalidate
+        cache_control = 'no-cache'
+
+    return send_stored_file(path, None, THUMBNAIL_FORMATS[fmt], cache_control=cache_control)
@@ -0,0 +1,294 @@
+import os
+import io
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import qrcode
+import qrcode.image.svg
+from .db import get_thread_db
+from .storage import STORES, sharded_key, get_storage
+from . import metrics
+
+# QR code directory (local storage backend)
+QRCODE_DIR = STORES['qrcodes']
+
+# QR code status of a document
+QR_STATUS_PENDING = 'pending'
+QR_STATUS_READY = 'ready'
+QR_STATUS_FAILED = 'failed'
+
+# Number of rendered QR PNGs kept in memory
+QR_MEMORY_CACHE_SIZE = 512
+
+# LRU of qr_hash -> PNG bytes
+_png_cache = OrderedDict()
+_png_cache_lock = threading.Lock()
+_png_cache_stats = {'hits': 0, 'misses': 0}
+
+# Output formats of render_qr and their MIME types. png-compact draws one
+# pixel per module as a 1-bit PNG, to be scaled up by the client.
+QR_FORMATS = {
+    'png': 'image/png',
+    'png-compact': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Error correction levels
+QR_ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Number of rendered ad-hoc QR codes kept in memory
+QR_RENDER_CACHE_SIZE = 256
+
+# LRU of (text, box_size, border, error_correction, format) -> (etag, bytes)
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+_render_cache_stats = {'hits': 0, 'misses': 0}
+
+
+# Canonical base URL encoded in document QR codes (DOCNEST_PUBLIC_URL,
+# e.g. https://docs.example.com), shared by the app and
+# regenerate_qrcodes.py; None if not configured
+def base_url_from_env():
+    return os.environ.get('DOCNEST_PUBLIC_URL', '').strip().rstrip('/') or None
+
+# URL encoded in a document's QR code
+def qr_target_url(base_url, document_id):
+    return f"{base_url.rstrip('/')}/mobile-viewer.html?id={document_id}"
+
+# Content hash of the encoded URL, also used as the QR file name
+def qr_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+# Storage key of the QR file for a hash
+def qr_key(hash_value):
+    return sharded_key(hash_value, 'png')
+
+# Path of the QR file used before QR codes were content-addressed
+def legacy_qr_path(root_path, filename):
+    return os.path.join(root_path, QRCODE_DIR, '{}.png'.format(filename.split('.')[0]))
+
+# Render a QR code for text as bytes in one of QR_FORMATS
+def render_qr(text, box_size=10, border=4, error_correction='L', fmt='png'):
+    started = time.perf_counter()
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=QR_ERROR_CORRECTION[error_correction],
+        box_size=1 if fmt == 'png-compact' else box_size,
+        border=border,
+    )
+    qr.add_data(text)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+    elif fmt == 'png-compact':
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.get_image().convert('1').save(buffer, format='PNG', optimize=True)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format='PNG')
+
+    metrics.observe('docnest_qr_render_seconds', (('format', fmt),), time.perf_counter() - started)
+    return buffer.getvalue()
+
+# Render a QR code for url as PNG bytes
+def render_qr_png(url):
+    return render_qr(url)
+
+# Render a QR code through the in-memory LRU, returns (etag, bytes)
+def render_qr_cached(text, box_size=10, border=4, error_correction='L', fmt='png'):
+    key = (text, box_size, border, error_correction, fmt)
+    with _render_cache_lock:
+        cached = _render_cache.get(key)
+        if cached is not None:
+            _render_cache.move_to_end(key)
+            _render_cache_stats['hits'] += 1
+            return cached
+        _render_cache_stats['misses'] += 1
+
+    data = render_qr(text, box_size, border, error_correction, fmt)
+    cached = (hashlib.sha256(data).hexdigest(), data)
+
+    with _render_cache_lock:
+        _render_cache[key] = cached
+        while len(_render_cache) > QR_RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return cached
+
+# Remember rendered PNG bytes
+def remember_png(hash_value, data):
+    with _png_cache_lock:
+        _png_cache[hash_value] = data
+        _png_cache.move_to_end(hash_value)
+        while len(_png_cache) > QR_MEMORY_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+
+# Forget a QR code (e.g. when its document is deleted)
+def forget_png(hash_value):
+    with _png_cache_lock:
+        _png_cache.pop(hash_value, None)
+
+# Get PNG bytes for a hash from memory, then storage; None if it doesn't exist
+def load_png(hash_value):
+    with _png_cache_lock:
+        data = _png_cache.get(hash_value)
+        if data is not None:
+            _png_cache.move_to_end(hash_value)
+            _png_cache_stats['hits'] += 1
+            return data
+        _png_cache_stats['misses'] += 1
+
+    data = get_storage('qrcodes').get(qr_key(hash_value))
+    if data is None:
+        return None
+
+    remember_png(hash_value, data)
+    return data
+
+# Render and store the QR code for url, returns (hash, PNG bytes)
+def generate_qr(url):
+    hash_value = qr_hash(url)
+    data = render_qr_png(url)
+    get_storage('qrcodes').put(qr_key(hash_value), data)
+    remember_png(hash_value, data)
+    return hash_value, data
+
+# Remove a stored QR code
+def remove_qr(hash_value):
+    forget_png(hash_value)
+    get_storage('qrcodes').delete(qr_key(hash_value))
+
+# Make sure a document's QR code encodes base_url.
+# Returns (qr_hash, PNG bytes); renders and records a new QR code only when
+# the base URL changed or the QR file is missing.
+def refresh_document_qr(conn, root_path, base_url, document):
+    url = qr_target_url(base_url, document['id'])
+    hash_value = qr_hash(url)
+
+    if document['qr_hash'] == hash_value:
+        data = load_png(hash_value)
+        if data is not None:
+            return hash_value, data
+
+    hash_value, data = generate_qr(url)
+
+    cursor = conn.execute(
+        'UPDATE documents SET qr_url = ?, qr_hash = ?, qr_status = ? WHERE id = ?',
+        (url, hash_value, QR_STATUS_READY, document['id'])
+    )
+    conn.commit()
+
+    if cursor.rowcount == 0:
+        # Document was deleted meanwhile
+        remove_qr(hash_value)
+        return hash_value, data
+
+    # Remove the QR file it replaces
+    if document['qr_hash'] and document['qr_hash'] != hash_value:
+        remove_qr(document['qr_hash'])
+    legacy_path = legacy_qr_path(root_path, document['filename'])
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+    return hash_value, data
+
+# QR code of a document for the public read routes, which never write to
+# the database: the recorded QR code (stored again from its recorded URL if
+# the file is missing), or, until one is recorded, a QR code for base_url
+# rendered in memory. Returns (qr_hash, PNG bytes).
+def load_document_qr(document, base_url):
+    if document['qr_hash']:
+        data = load_png(document['qr_hash'])
+        if data is not None:
+            return document['qr_hash'], data
+        if document['qr_url']:
+            # Content-addressed: stores the file under the recorded hash
+            return generate_qr(document['qr_url'])
+
+    url = qr_target_url(base_url, document['id'])
+    _, data = render_qr_cached(url)
+    return qr_hash(url), data
+
+# Background task: generate the QR code of a newly uploaded document
+def generate_document_qr(root_path, base_url, document_id):
+    conn = get_thread_db()
+    document = conn.execute('SELECT id, filename, qr_hash FROM documents WHERE id = ?', (document_id,)).fetchone()
+    if not document:
+        return
+
+    try:
+        refresh_document_qr(conn, root_path, base_url, document)
+    except Exception:
+        conn.execute('UPDATE documents SET qr_status = ? WHERE id = ?', (QR_STATUS_FAILED, document_id))
+        conn.commit()
+        raise
+
+# Background task: generate the QR codes of a batch of newly uploaded
+# documents, recording them with one UPDATE per batch
+def generate_documents_qr(root_path, base_url, document_ids):
+    updates = []
+    failures = []
+    for document_id in document_ids:
+        url = qr_target_url(base_url, document_id)
+        try:
+            hash_value, _ = generate_qr(url)
+        except Exception as e:
+            print(f"Failed to generate QR code for document ID {document_id}: {e}")
+            failures.append((QR_STATUS_FAILED, document_id))
+            continue
+        updates.append((url, hash_value, QR_STATUS_READY, document_id))
+
+    conn = get_thread_db()
+    conn.executemany('UPDATE documents SET qr_url = ?, qr_hash = ?, qr_status = ? WHERE id = ?', updates)
+    conn.executemany('UPDATE documents SET qr_status = ? WHERE id = ?', failures)
+    conn.commit()
+
+    # Remove the QR codes of documents deleted meanwhile
+    placeholders = ','.join('?' * len(document_ids))
+    remaining = {row[0] for row in conn.execute(
+        'SELECT id FROM documents WHERE id IN ({})'.format(placeholders), list(document_ids))}
+    for _, hash_value, _, document_id in updates:
+        if document_id not in remaining:
+            remove_qr(hash_value)
+
+# QR cache counters for the metrics endpoint
+def qr_cache_metrics():
+    samples = []
+    for cache, stats in (('document', get_qr_cache_stats()), ('render', get_render_cache_stats())):
+        for key, result in (('hits', 'hit'), ('misses', 'miss')):
+            samples.append(('docnest_qr_cache_requests_total', (('cache', cache), ('result', result)), stats[key]))
+    return samples
+
+metrics.register_collector(qr_cache_metrics)
+
+# Empty the in-memory QR caches and their counters (e.g. in a freshly
+# forked worker, which must not inherit the parent's locks)
+def reset_caches():
+    global _png_cache_lock, _render_cache_lock
+    _png_cache_lock = threading.Lock()
+    _render_cache_lock = threading.Lock()
+    for cache, stats in ((_png_cache, _png_cache_stats), (_render_cache, _render_cache_stats)):
+        cache.clear()
+        stats.update(hits=0, misses=0)
+
+# Get in-memory QR cache counters
+def get_qr_cache_stats():
+    with _png_cache_lock:
+        stats = dict(_png_cache_stats)
+        stats['size'] = len(_png_cache)
+    return stats
+
+# Get ad-hoc QR render cache counters
+def get_render_cache_stats():
+    with _render_cache_lock:
+        stats = dict(_render_cache_stats)
+        stats['size'] = len(_render_cache)
+    return stats
@@ -0,0 +1,176 @@
+import re
+from markupsafe import escape
+from flask import request, jsonify
+from . import api_bp
+from .auth import token_required
+from .db import get_read_db
+from .migrations import FTS_TOKENIZER, has_fts_index
+from .documents import (document_access_scope, document_filter, document_url_templates, versioned_qrcode_url,
+                        versioned_thumbnail_url)
+
+# Search result page sizes; deep pages get expensive for ranked results,
+# so clients should refine the query instead of paging past the limit
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_OFFSET = 1000
+
+# Terms used from a query
+SEARCH_MAX_TERMS = 8
+
+# bm25 weights of the documents_fts columns: file_number,
+# original_filename, title, content
+SEARCH_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+# Snippet length in tokens (characters with the trigram tokenizer)
+SEARCH_SNIPPET_TOKENS = 32
+
+# Shortest term the FTS index can match; shorter terms are substring
+# matched with a scan of the matching rows instead
+SEARCH_MIN_MATCH_LENGTH = 3 if FTS_TOKENIZER == 'trigram' else 1
+
+# Characters around the first hit shown for substring matched terms
+SEARCH_CONTEXT_LENGTH = 40
+
+# Highlight markers placed by snippet(), replaced by <mark> after escaping
+_MARK_OPEN = '\x02'
+_MARK_CLOSE = '\x03'
+
+# All indexed text of a row, for substring matching
+_ALL_TEXT = "lower(f.file_number || ' ' || f.original_filename || ' ' || f.title || ' ' || f.content)"
+
+# Searchable text of a document without the full-text search index (SQLite
+# built without FTS5): every term is substring matched against it
+_DOCUMENT_TEXT = "(d.file_number || ' ' || d.original_filename || ' ' || COALESCE(d.pdf_title, ''))"
+
+
+# FTS5 query matching every term (quoted, so no query syntax is interpreted)
+def match_expression(terms):
+    suffix = '' if FTS_TOKENIZER == 'trigram' else '*'
+    return ' AND '.join('"{}"{}'.format(term.replace('"', '""'), suffix) for term in terms)
+
+# Mark occurrences of terms in text
+def mark_terms(text, terms):
+    if not terms:
+        return text
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda m: _MARK_OPEN + m.group(0) + _MARK_CLOSE, text)
+
+# Snippet as safe HTML, hits wrapped in <mark>
+def render_snippet(text, terms=()):
+    html = str(escape(mark_terms(text or '', terms)))
+    return html.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+# Search documents route
+# Query parameters: q (search terms), limit, offset, include_total, and the
+# filters of get_documents (file_number, date_from, date_to, group_id,
+# uploaded_by, is_visible)
+@api_bp.route('/documents/search', methods=['GET'])
+@token_required
+def search_documents():
+    args = request.args
+    terms = args.get('q', '').split()[:SEARCH_MAX_TERMS]
+    if not terms:
+        return jsonify({'error': 'q is required'}), 400
+
+    try:
+        limit = int(args.get('limit', SEARCH_PAGE_SIZE))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    if offset < 0 or offset > SEARCH_MAX_OFFSET:
+        return jsonify({'error': 'offset must be between 0 and {}'.format(SEARCH_MAX_OFFSET)}), 400
+
+    # Only documents the user can see
+    where, params = document_access_scope()
+
+    try:
+        filter_where, filter_params = document_filter(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    where.extend(filter_where)
+    params.extend(filter_params)
+
+    conn = get_read_db()
+    cursor = conn.cursor()
+
+    if has_fts_index(conn):
+        tables = 'documents_fts f JOIN documents d ON d.id = f.rowid'
+        all_text = _ALL_TEXT
+        context_text = 'f.content'
+        match_terms = [term for term in terms if len(term) >= SEARCH_MIN_MATCH_LENGTH]
+        short_terms = [term for term in terms if len(term) < SEARCH_MIN_MATCH_LENGTH]
+    else:
+        tables = 'documents d'
+        all_text = 'lower({})'.format(_DOCUMENT_TEXT)
+        context_text = _DOCUMENT_TEXT
+        match_terms = []
+        short_terms = terms
+
+    for term in short_terms:
+        where.append('instr({}, ?) > 0'.format(all_text))
+        params.append(term.lower())
+
+    if match_terms:
+        # Ranked by bm25, with a highlighted snippet from the best column
+        where.insert(0, 'documents_fts MATCH ?')
+        params.insert(0, match_expression(match_terms))
+        snippet = "snippet(documents_fts, -1, char(2), char(3), '…', {})".format(SEARCH_SNIPPET_TOKENS)
+        snippet_params = []
+        order = 'bm25(documents_fts, {}), d.id DESC'.format(', '.join(str(w) for w in SEARCH_WEIGHTS))
+    else:
+        # Substring matches only: newest first, context around the first hit
+        snippet = 'substr({0}, max(1, instr(lower({0}), ?) - {1}), {2})'.format(
+            context_text, SEARCH_CONTEXT_LENGTH, 2 * SEARCH_CONTEXT_LENGTH)
+        snippet_params = [short_terms[0].lower()]
+        order = 'd.upload_date DESC, d.id DESC'
+
+    where_sql = ' AND '.join(where)
+
+    total = None
+    if args.get('include_total') in ('1', 'true'):
+        cursor.execute('SELECT COUNT(*) FROM {} WHERE {}'.format(tables, where_sql), params)
+        total = cursor.fetchone()[0]
+
+    # Fetch one extra row to know whether there is a next page
+    cursor.execute('''
+        SELECT d.id, d.file_number, d.original_filename, d.filename, d.inspection_date, d.upload_date,
+               u.username as uploader, g.group_name, d.is_visible, d.qr_hash, d.page_count, d.text_status,
+               {snippet} AS snippet
+        FROM {tables}
+        LEFT JOIN users u ON d.uploaded_by = u.id
+        LEFT JOIN user_groups g ON d.group_id = g.id
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    '''.format(snippet=snippet, tables=tables, where=where_sql, order=order),
+        snippet_params + params + [limit + 1, offset])
+    rows = cursor.fetchall()
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+
+    view_url, qrcode_url, thumbnail_url = document_url_templates()
+    documents = [{
+        'id': doc['id'],
+        'file_number': doc['file_number'],
+        'original_filename': doc['original_filename'],
+        'inspection_date': doc['inspection_date'],
+        'upload_date': doc['upload_date'],
+        'uploader': doc['uploader'],
+        'group_name': doc['group_name'],
+        'view_url': view_url.format(doc['id']),
+        'qrcode_url': versioned_qrcode_url(qrcode_url, doc['id'], doc['qr_hash']),
+        'thumbnail_url': versioned_thumbnail_url(thumbnail_url, doc['id'], doc['filename']),
+        'is_visible': doc['is_visible'],
+        'page_count': doc['page_count'],
+        'text_status': doc['text_status'],
+        'snippet': render_snippet(doc['snippet'], short_terms)
+    } for doc in rows]
+
+    result = {'documents': documents, 'next_offset': next_offset}
+    if total is not None:
+        result['total'] = total
+    return jsonify(result)
@@ -0,0 +1,328 @@
+import os
+import datetime
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from werkzeug.security import safe_join
+from .files import UPLOAD_DIR, COPY_BLOCK_SIZE, write_atomic
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for the s3 backend
+    boto3 = None
+
+# Storage backends (app.config['STORAGE_BACKEND']):
+#   'local' - files under the application's static directory
+#   's3'    - an S3-compatible object store (AWS S3, MinIO, ...)
+STORAGE_BACKENDS = ('local', 's3')
+
+# Named stores and their directory (local backend) or key prefix (s3 backend)
+STORES = {
+    'uploads': UPLOAD_DIR,
+    'qrcodes': 'static/qrcodes',
+}
+
+# Settings read from the environment: config key -> (variable, default)
+STORAGE_ENV = {
+    'STORAGE_BACKEND': ('DOCNEST_STORAGE_BACKEND', 'local'),
+    'STORAGE_S3_BUCKET': ('DOCNEST_S3_BUCKET', None),
+    'STORAGE_S3_PREFIX': ('DOCNEST_S3_PREFIX', ''),
+    'STORAGE_S3_ENDPOINT_URL': ('DOCNEST_S3_ENDPOINT_URL', None),
+    'STORAGE_S3_REGION': ('DOCNEST_S3_REGION', None),
+    'STORAGE_S3_PRESIGN': ('DOCNEST_S3_PRESIGN', '1'),
+    'STORAGE_S3_PRESIGN_EXPIRES': ('DOCNEST_S3_PRESIGN_EXPIRES', '300'),
+}
+
+_settings = {'root_path': None, 'STORAGE_BACKEND': 'local'}
+_stores = {}
+_stores_pid = None
+_lock = threading.Lock()
+
+
+# Key of a content-addressed object, sharded two levels deep
+# (ab/cd/<hash>.<ext>) so no directory grows too large
+def sharded_key(digest, extension):
+    return '{}/{}/{}.{}'.format(digest[:2], digest[2:4], digest, extension)
+
+# Key of an uploaded file body with the given SHA-256
+def content_filename(digest):
+    return sharded_key(digest, 'pdf')
+
+
+# Interface shared by the storage backends. Keys are '/'-separated relative
+# names; get/stream/range/stat return None for missing objects.
+class Storage(ABC):
+    # Store bytes under key
+    @abstractmethod
+    def put(self, key, data):
+        pass
+
+    # Move a local file into the store under key (source_path is consumed)
+    @abstractmethod
+    def put_file(self, key, source_path):
+        pass
+
+    # Get an object's bytes
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    # Get an iterator over an object's bytes
+    @abstractmethod
+    def stream(self, key):
+        pass
+
+    # Get length bytes of an object starting at start
+    @abstractmethod
+    def range(self, key, start, length):
+        pass
+
+    # Get (size, etag, last_modified) of an object
+    @abstractmethod
+    def stat(self, key):
+        pass
+
+    # Remove an object (missing objects are ignored)
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    # Local filesystem path of an object, if the backend has one
+    def path(self, key):
+        return None
+
+    # URL clients can fetch the object from directly, if the backend has one
+    def url(self, key, mimetype=None, disposition=None):
+        return None
+
+    # Context manager yielding a local file with the object's content, for
+    # libraries that need a path (pypdf, pdfium)
+    @contextmanager
+    def local_copy(self, key):
+        chunks = self.stream(key)
+        if chunks is None:
+            raise FileNotFoundError(key)
+
+        fd, tmp_path = tempfile.mkstemp(prefix='docnest-', suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+
+
+# Files in a local directory
+class LocalStorage(Storage):
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+    def path(self, key):
+        path = safe_join(self.base_dir, key)
+        if path is None:
+            raise ValueError('Invalid storage key: {}'.format(key))
+        return path
+
+    def put(self, key, data):
+        write_atomic(self.path(key), data)
+
+    def put_file(self, key, source_path):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def stream(self, key):
+        try:
+            f = open(self.path(key), 'rb')
+        except FileNotFoundError:
+            return None
+        return self._iter_file(f)
+
+    def _iter_file(self, f):
+        with f:
+            while True:
+                block = f.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    def range(self, key, start, length):
+        try:
+            with open(self.path(key), 'rb') as f:
+                f.seek(start)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        etag = '{:x}-{:x}'.format(stat.st_mtime_ns, stat.st_size)
+        last_modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc)
+        return stat.st_size, etag, last_modified
+
+    def delete(self, key):
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    @contextmanager
+    def local_copy(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(key)
+        yield path
+
+
+# Objects in an S3-compatible bucket, under a key prefix
+class S3Storage(Storage):
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, presign=True, presign_expires=300):
+        if boto3 is None:
+            raise RuntimeError('The s3 storage backend requires boto3')
+        if not bucket:
+            raise RuntimeError('STORAGE_S3_BUCKET is required for the s3 storage backend')
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign = presign
+        self.presign_expires = presign_expires
+
+        # Path-style addressing works with MinIO and other S3-compatible
+        # servers that don't have per-bucket DNS names
+        config = BotoConfig(signature_version='s3v4',
+                            s3={'addressing_style': 'path' if endpoint_url else 'auto'})
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region, config=config)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    # Check if a botocore error means the object doesn't exist
+    def _missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def put_file(self, key, source_path):
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def _get_object(self, key, **kwargs):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def get(self, key):
+        response = self._get_object(key)
+        return response['Body'].read() if response else None
+
+    def stream(self, key):
+        response = self._get_object(key)
+        return response['Body'].iter_chunks(COPY_BLOCK_SIZE) if response else None
+
+    def range(self, key, start, length):
+        response = self._get_object(key, Range='bytes={}-{}'.format(start, start + length - 1))
+        return response['Body'].read() if response else None
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return response['ContentLength'], response['ETag'].strip('"'), response['LastModified']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key, mimetype=None, disposition=None):
+        if not self.presign:
+            return None
+
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        if disposition:
+            params['ResponseContentDisposition'] = disposition
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expires)
+
+
+# Read storage settings from DOCNEST_* environment variables
+def settings_from_env():
+    settings = {name: os.environ.get(variable, default) for name, (variable, default) in STORAGE_ENV.items()}
+    settings['STORAGE_S3_PRESIGN'] = settings['STORAGE_S3_PRESIGN'] not in ('0', 'false', 'no')
+    settings['STORAGE_S3_PRESIGN_EXPIRES'] = int(settings['STORAGE_S3_PRESIGN_EXPIRES'])
+    return settings
+
+# Select the storage backend. root_path is the application root that local
+# store directories are relative to.
+def configure(root_path, settings):
+    global _settings
+    backend = settings.get('STORAGE_BACKEND') or 'local'
+    if backend not in STORAGE_BACKENDS:
+        raise RuntimeError('Unknown storage backend: {}'.format(backend))
+
+    with _lock:
+        _settings = dict(settings, root_path=root_path, STORAGE_BACKEND=backend)
+        _stores.clear()
+
+# Create a store for the configured backend
+def _create_store(name):
+    if _settings['STORAGE_BACKEND'] == 's3':
+        prefix = (_settings.get('STORAGE_S3_PREFIX') or '') + os.path.basename(STORES[name]) + '/'
+        return S3Storage(
+            _settings.get('STORAGE_S3_BUCKET'),
+            prefix=prefix,
+            endpoint_url=_settings.get('STORAGE_S3_ENDPOINT_URL'),
+            region=_settings.get('STORAGE_S3_REGION'),
+            presign=_settings.get('STORAGE_S3_PRESIGN', True),
+            presign_expires=_settings.get('STORAGE_S3_PRESIGN_EXPIRES', 300),
+        )
+    return LocalStorage(os.path.join(_settings['root_path'], STORES[name]))
+
+# Get a named store ('uploads' or 'qrcodes')
+def get_storage(name):
+    global _stores_pid
+    with _lock:
+        # Client connections don't survive a fork; create fresh stores in the child
+        if _stores_pid != os.getpid():
+            _stores.clear()
+            _stores_pid = os.getpid()
+        store = _stores.get(name)
+        if store is None:
+            store = _stores[name] = _create_store(name)
+        return store
+
+# Drop the stores of this process; they are created again on next use
+def reset():
+    global _lock, _stores_pid
+    _lock = threading.Lock()
+    _stores.clear()
+    _stores_pid = os.getpid()
+
+# Set up storage for the app
+def init_app(app):
+    configure(app.root_path, app.config)
@@ -0,0 +1,59 @@
+import json
+from flask import Response, request, stream_with_context
+
+# Rows fetched from the cursor per batch when streaming
+STREAM_BATCH_SIZE = 500
+
+# Supported streaming formats (?stream=<format>)
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# Get the requested streaming format, or None for a regular response
+def requested_stream_format():
+    stream = request.args.get('stream', '').lower()
+    if stream in ('1', 'true'):
+        return 'json'
+    return stream if stream in STREAM_FORMATS else None
+
+# Encode a value as compact JSON
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+# Iterate a cursor in fetchmany batches so only one batch is held in memory
+def iter_rows(cursor, batch_size=STREAM_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+# Yield {"<key>": [row, row, ...], <extra>} chunk by chunk
+def _json_chunks(cursor, key, row_to_dict, extra):
+    yield '{' + _dumps(key) + ':['
+    first = True
+    for row in iter_rows(cursor):
+        yield ('' if first else ',') + _dumps(row_to_dict(row))
+        first = False
+    yield ']'
+    for name, value in (extra or {}).items():
+        yield ',' + _dumps(name) + ':' + _dumps(value)
+    yield '}'
+
+# Yield one JSON object per line; extra fields go on a leading header line
+def _ndjson_chunks(cursor, key, row_to_dict, extra):
+    if extra:
+        yield _dumps(extra) + '\n'
+    for row in iter_rows(cursor):
+        yield _dumps(row_to_dict(row)) + '\n'
+
+# Stream the rows of an executed cursor as a JSON or NDJSON response
+def stream_rows(cursor, key, row_to_dict, stream_format='json', extra=None):
+    if stream_format == 'ndjson':
+        chunks = _ndjson_chunks(cursor, key, row_to_dict, extra)
+    else:
+        chunks = _json_chunks(cursor, key, row_to_dict, extra)
+    return Response(stream_with_context(chunks), mimetype=STREAM_FORMATS[stream_format])
@@ -0,0 +1,90 @@
+import re
+from pypdf import PdfReader
+from .db import get_thread_db
+from .storage import get_storage
+from .migrations import has_fts_index
+
+# Text extraction status of a document
+TEXT_STATUS_PENDING = 'pending'
+TEXT_STATUS_READY = 'ready'
+TEXT_STATUS_FAILED = 'failed'
+
+# Longest text indexed per document, in characters
+TEXT_MAX_LENGTH = 1000000
+
+# Records the extracted text of a document (parameters: text, document id)
+TEXT_UPDATE = 'UPDATE documents_fts SET content = ? WHERE rowid = ?'
+
+# Whitespace between two CJK characters, which PDF text extraction often
+# inserts between every glyph; removed so substring search works
+_CJK_GAP = re.compile(r'(?<=[\u3000-\u9fff\uff00-\uffef])\s+(?=[\u3000-\u9fff\uff00-\uffef])')
+
+
+# Extract the searchable text of a PDF: pages in order, whitespace collapsed,
+# truncated to TEXT_MAX_LENGTH characters
+def extract_text(pdf_path):
+    reader = PdfReader(pdf_path)
+    pages = []
+    length = 0
+    for page in reader.pages:
+        text = _CJK_GAP.sub('', ' '.join((page.extract_text() or '').split()))
+        pages.append(text)
+        length += len(text) + 1
+        if length >= TEXT_MAX_LENGTH:
+            break
+    return '\n'.join(pages)[:TEXT_MAX_LENGTH]
+
+# Run the text stage for one stored PDF, returns the text
+def build_text(filename):
+    with get_storage('uploads').local_copy(filename) as pdf_path:
+        return extract_text(pdf_path)
+
+# Text already extracted for another document with the same content, if any
+def shared_text(conn, document_id, content_hash):
+    if not content_hash:
+        return None
+
+    row = conn.execute('''
+        SELECT f.content FROM documents d JOIN documents_fts f ON f.rowid = d.id
+        WHERE d.content_hash = ? AND d.id != ? AND d.text_status = ?
+        LIMIT 1
+    ''', (content_hash, document_id, TEXT_STATUS_READY)).fetchone()
+    return row[0] if row else None
+
+# Get the text of a document, reusing the text of identical files
+def document_text(conn, document):
+    text = shared_text(conn, document['id'], document['content_hash'])
+    if text is None:
+        text = build_text(document['filename'])
+    return text
+
+# Background task: index the text of a newly uploaded document
+def generate_document_text(document_id):
+    generate_documents_text([document_id])
+
+# Background task: index the text of a batch of documents, recording the
+# results with one transaction per batch. Without the search index the
+# documents stay pending for backfill_texts.py.
+def generate_documents_text(document_ids):
+    conn = get_thread_db()
+    if not has_fts_index(conn):
+        return
+
+    placeholders = ','.join('?' * len(document_ids))
+    documents = conn.execute(
+        'SELECT id, filename, content_hash FROM documents WHERE id IN ({})'.format(placeholders), list(document_ids)
+    ).fetchall()
+
+    updates = []
+    failures = []
+    for document in documents:
+        try:
+            updates.append((document_text(conn, document), document['id']))
+        except Exception as e:
+            print(f"Failed to extract text for document ID {document['id']}: {e}")
+            failures.append((TEXT_STATUS_FAILED, document['id']))
+
+    conn.executemany(TEXT_UPDATE, updates)
+    conn.executemany('UPDATE documents SET text_status = ? WHERE id = ?',
+                     [(TEXT_STATUS_READY, document_id) for _, document_id in updates] + failures)
+    conn.commit()
@@ -0,0 +1,47 @@
+import time
+import math
+import threading
+from collections import OrderedDict
+from flask import request
+
+
+# Token bucket rate limiter keyed by client (e.g. IP address). Each client
+# may make burst requests at once and rate requests per second after that.
+# Buckets are kept in an LRU of max_clients entries, so memory stays bounded
+# and a forgotten client simply starts with a full bucket. Limits apply per
+# process.
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Take a token for key. Returns 0 if the request is allowed, otherwise
+    # the number of seconds until it would be.
+    def acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+# Address of the client making the current request (the real client behind
+# trusted proxies when DOCNEST_PROXY_COUNT is set, see app.py)
+def client_address():
+    return request.remote_addr or ''
+
+# Seconds for a Retry-After header
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
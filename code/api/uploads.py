@@ -0,0 +1,299 @@
+import os
+import re
+import json
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from flask import request, jsonify, g, current_app, url_for
+from werkzeug.exceptions import ClientDisconnected
+from . import api_bp
+from .auth import token_required
+from .db import get_db
+from .files import UPLOAD_STAGING_DIR, write_atomic
+from .documents import (allowed_file, validate_document_fields, file_number_exists, insert_document,
+                        load_document_dict)
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunks are only serialized within one process
+    fcntl = None
+
+# Chunk size suggested to clients, and the largest chunk accepted
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Largest file accepted through resumable uploads
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+# Unfinished uploads are removed after this many seconds without activity
+UPLOAD_SESSION_TTL = 24 * 3600
+
+# Block size for reading the request body and rehashing staging files
+UPLOAD_BLOCK_SIZE = 256 * 1024
+
+# Number of in-progress SHA-256 states kept in memory
+UPLOAD_HASHER_CACHE_SIZE = 256
+
+# LRU of upload_id -> (offset, sha256 state). A state is only valid for the
+# offset it was saved at; otherwise (another process took the chunk, or the
+# server restarted) it is rebuilt from the staging file.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+# Paths of an upload's staging file and session file
+def staging_paths(root_path, upload_id):
+    staging_dir = os.path.join(root_path, UPLOAD_STAGING_DIR)
+    return (os.path.join(staging_dir, '{}.part'.format(upload_id)),
+            os.path.join(staging_dir, '{}.json'.format(upload_id)))
+
+# Load an upload session of the current user, returns None if it doesn't exist
+def load_session(upload_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return None
+
+    part_path, session_path = staging_paths(current_app.root_path, upload_id)
+    try:
+        with open(session_path, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if session['user_id'] != g.current_user['id'] or not os.path.exists(part_path):
+        return None
+    return session
+
+# Remove an upload's staging files and hash state
+def remove_session(root_path, upload_id):
+    forget_hasher(upload_id)
+    for path in staging_paths(root_path, upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+# Remove uploads that have been inactive for longer than UPLOAD_SESSION_TTL
+def cleanup_expired_sessions(root_path):
+    staging_dir = os.path.join(root_path, UPLOAD_STAGING_DIR)
+    expires = time.time() - UPLOAD_SESSION_TTL
+    try:
+        entries = list(os.scandir(staging_dir))
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        if entry.name.endswith('.part') and entry.stat().st_mtime < expires:
+            remove_session(root_path, entry.name[:-len('.part')])
+
+# Get the SHA-256 state of the first offset bytes of an upload
+def get_hasher(upload_id, part_path, offset):
+    with _hashers_lock:
+        cached = _hashers.pop(upload_id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+
+    hasher = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        remaining = offset
+        while remaining > 0:
+            block = f.read(min(UPLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+# Remember the SHA-256 state of an upload at offset
+def remember_hasher(upload_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hasher)
+        _hashers.move_to_end(upload_id)
+        while len(_hashers) > UPLOAD_HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+# Forget the SHA-256 state of an upload
+def forget_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+# Upload status as returned to clients
+def session_status(upload_id, session, offset):
+    return {
+        'upload_id': upload_id,
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': offset,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'upload_url': url_for('api.upload_chunk', upload_id=upload_id)
+    }
+
+# Start a resumable upload
+# JSON body: filename, size (bytes)
+@api_bp.route('/uploads', methods=['POST'])
+@token_required
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename', ''))
+    size = data.get('size')
+
+    if not filename:
+        return jsonify({'error': 'Filename is required'}), 400
+
+    if not allowed_file(filename):
+        return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return jsonify({'error': 'size must be a positive integer'}), 400
+
+    if size > UPLOAD_MAX_SIZE:
+        return jsonify({'error': 'File is too large'}), 413
+
+    cleanup_expired_sessions(current_app.root_path)
+
+    upload_id = secrets.token_hex(16)
+    part_path, session_path = staging_paths(current_app.root_path, upload_id)
+    session = {
+        'user_id': g.current_user['id'],
+        'filename': filename,
+        'size': size,
+        'created_at': int(time.time())
+    }
+
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    open(part_path, 'wb').close()
+    write_atomic(session_path, json.dumps(session).encode('utf-8'))
+
+    return jsonify(session_status(upload_id, session, 0)), 201
+
+# Get the status of a resumable upload (clients resume from offset)
+@api_bp.route('/uploads/<upload_id>', methods=['GET'])
+@token_required
+def get_upload(upload_id):
+    session = load_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    part_path, _ = staging_paths(current_app.root_path, upload_id)
+    return jsonify(session_status(upload_id, session, os.path.getsize(part_path)))
+
+# Append a chunk to a resumable upload
+# Query parameters: offset (must equal the bytes received so far)
+# Body: raw chunk bytes
+@api_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@token_required
+def upload_chunk(upload_id):
+    session = load_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'offset must be an integer'}), 400
+
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+
+    if length > UPLOAD_MAX_CHUNK_SIZE:
+        return jsonify({'error': 'Chunk is too large (max {} bytes)'.format(UPLOAD_MAX_CHUNK_SIZE)}), 413
+
+    part_path, _ = staging_paths(current_app.root_path, upload_id)
+    with open(part_path, 'ab') as f:
+        # One chunk at a time per upload
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return jsonify({'error': 'Another chunk of this upload is in progress'}), 409
+
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            return jsonify({'error': 'Offset mismatch', 'offset': current}), 409
+
+        if current + length > session['size']:
+            return jsonify({'error': 'Chunk exceeds the declared file size', 'offset': current}), 400
+
+        # Append straight to the staging file, hashing as the bytes arrive.
+        # If the client disconnects, the bytes received so far are kept and
+        # the upload resumes from there.
+        hasher = get_hasher(upload_id, part_path, current)
+        received = 0
+        try:
+            while received < length:
+                block = request.stream.read(min(UPLOAD_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                received += len(block)
+        except ClientDisconnected:
+            pass
+        finally:
+            f.flush()
+            remember_hasher(upload_id, current + received, hasher)
+
+    if received < length:
+        return jsonify({'error': 'Incomplete chunk', 'offset': current + received}), 400
+
+    return jsonify({'offset': current + received, 'size': session['size']})
+
+# Finish a resumable upload and create the document
+# JSON body: file_number, inspection_date, sha256 (optional, verified if given)
+@api_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@token_required
+def finalize_upload(upload_id):
+    session = load_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    file_number = str(data.get('file_number', ''))
+    inspection_date = str(data.get('inspection_date', ''))
+
+    error = validate_document_fields(file_number, inspection_date)
+    if error:
+        return jsonify({'error': error}), 400
+
+    part_path, _ = staging_paths(current_app.root_path, upload_id)
+    offset = os.path.getsize(part_path)
+    if offset != session['size']:
+        return jsonify({'error': 'Upload is incomplete', 'offset': offset}), 409
+
+    digest = get_hasher(upload_id, part_path, offset).hexdigest()
+    if data.get('sha256') and str(data['sha256']).lower() != digest:
+        return jsonify({'error': 'Checksum mismatch', 'sha256': digest}), 422
+
+    # Connect to database
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Check if file number already exists in the same group
+    if file_number_exists(cursor, file_number):
+        return jsonify({'error': 'File number already exists in your group'}), 400
+
+    # Only the metadata insert and moving the staging file into place are left
+    try:
+        document_id = insert_document(conn, file_number, part_path, digest, session['filename'], inspection_date)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    remove_session(current_app.root_path, upload_id)
+
+    return jsonify({
+        'message': 'Document uploaded successfully',
+        'document': load_document_dict(cursor, document_id),
+        'sha256': digest
+    }), 201
+
+# Abort a resumable upload
+@api_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@token_required
+def delete_upload(upload_id):
+    session = load_session(upload_id)
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    remove_session(current_app.root_path, upload_id)
+    return jsonify({'message': 'Upload cancelled'})
@@ -1,7 +1,9 @@
 import sqlite3
 from flask import request, jsonify, g
 from . import api_bp
-from .auth import token_required, admin_required, get_db
+from .auth import token_required, admin_required, bump_membership_version
+from .db import get_db
+from .streaming import requested_stream_format, stream_rows
 
 # Default admin username
 DEFAULT_USERNAME = 'admin'
@@ -25,8 +27,7 @@ def get_users():
         ''')
     else:
         # Non-admin can only see users in their group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        group_id = cursor.fetchone()['group_id']
+        group_id = g.current_user['group_id']
         
         if not group_id:
             # User doesn't belong to any group
@@ -40,13 +41,10 @@ def get_users():
             ORDER BY u.created_at DESC
         ''', (group_id,))
     
-    users = cursor.fetchall()
-    
-    # Convert to list of dictionaries
-    users_list = []
-    for user in users:
+    # Convert to dictionary
+    def to_dict(user):
         role = user['role'] if 'role' in user.keys() else 'user'
-        users_list.append({
+        return {
             'id': user['id'],
             'username': user['username'],
             'group_id': user['group_id'],
@@ -54,9 +52,16 @@ def get_users():
             'created_by': user['created_by'],
             'created_at': user['created_at'],
             'role': role
-        })
+        }
+    
+    # Stream large listings straight from the cursor
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_rows(cursor, 'users', to_dict, stream_format)
     
-    return jsonify({'users': users_list})
+    users = cursor.fetchall()
+    
+    return jsonify({'users': [to_dict(user) for user in users]})
 
 # Get user route
 @api_bp.route('/users/<int:user_id>', methods=['GET'])
@@ -69,8 +74,7 @@ def get_user(user_id):
     # Check if user is admin or getting their own info
     if not g.current_user['is_admin'] and g.current_user['id'] != user_id:
         # Check if user is in the same group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        current_user_group = cursor.fetchone()['group_id']
+        current_user_group = g.current_user['group_id']
         
         cursor.execute('SELECT group_id FROM users WHERE id = ?', (user_id,))
         target_user_group = cursor.fetchone()
@@ -131,8 +135,7 @@ def create_user():
     # Check if user is admin or group manager
     if not g.current_user['is_admin']:
         # Non-admin can only create users in their group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        current_user_group = cursor.fetchone()['group_id']
+        current_user_group = g.current_user['group_id']
         
         if not current_user_group:
             return jsonify({'error': 'You do not have permission to create users'}), 403
@@ -203,8 +206,7 @@ def update_user(user_id):
     # Check if user is admin or updating their own info
     if not g.current_user['is_admin'] and g.current_user['id'] != user_id:
         # Check if user is in the same group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        current_user_group = cursor.fetchone()['group_id']
+        current_user_group = g.current_user['group_id']
         
         if user['group_id'] != current_user_group:
             return jsonify({'error': 'You do not have permission to update this user'}), 403
@@ -253,6 +255,9 @@ def update_user(user_id):
             params
         )
         
+        # Tokens issued before this change carry stale claims
+        bump_membership_version(cursor, user_id)
+        
         conn.commit()
         
         return jsonify({'message': 'User updated successfully'})
@@ -282,8 +287,7 @@ def delete_user(user_id):
     # Check if user is admin or deleting a user in their group
     if not g.current_user['is_admin']:
         # Check if user is in the same group
-        cursor.execute('SELECT group_id FROM users WHERE id = ?', (g.current_user['id'],))
-        current_user_group = cursor.fetchone()['group_id']
+        current_user_group = g.current_user['group_id']
         
         if not current_user_group or user['group_id'] != current_user_group:
             return jsonify({'error': 'You do not have permission to delete this user'}), 403
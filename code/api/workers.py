@@ -0,0 +1,69 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from .db import release_thread_db
+
+# Number of background threads generating derived artifacts (QR codes etc.)
+ARTIFACT_WORKERS = 2
+
+# Maximum number of queued + running artifact tasks; beyond this, submit()
+# refuses the task and the artifact is generated on demand instead
+ARTIFACT_QUEUE_SIZE = 256
+
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(ARTIFACT_QUEUE_SIZE)
+_lock = threading.Lock()
+
+
+# Get the executor for this process, creating it on first use
+def _get_executor():
+    global _executor, _executor_pid, _slots
+    with _lock:
+        # Worker threads don't survive a fork; start a fresh pool in the child
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=ARTIFACT_WORKERS, thread_name_prefix='artifact')
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(ARTIFACT_QUEUE_SIZE)
+        return _executor, _slots
+
+# Run a task, logging instead of raising (nobody waits on the result)
+def _run(slots, fn, args):
+    try:
+        fn(*args)
+    except Exception:
+        print(f"Background task {getattr(fn, '__name__', fn)} failed:")
+        traceback.print_exc()
+    finally:
+        release_thread_db()
+        slots.release()
+
+# Queue fn(*args) on the background pool. Returns False if the queue is full.
+def submit(fn, *args):
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        return False
+    try:
+        executor.submit(_run, slots, fn, args)
+    except RuntimeError:
+        # Executor is shutting down
+        slots.release()
+        return False
+    return True
+
+# Stop the background pool (waits for queued tasks when wait is True)
+def shutdown(wait=True):
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None and _executor_pid == os.getpid():
+        executor.shutdown(wait=wait)
+
+# Forget the background pool of the parent process in a freshly forked child
+# (its threads don't exist here); a new pool is started on next submit()
+def reset():
+    global _executor, _executor_pid, _lock
+    _lock = threading.Lock()
+    _executor = None
+    _executor_pid = None
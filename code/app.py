@@ -3,12 +3,56 @@
 
 import os
 import sys
-from flask import Flask, send_from_directory, send_file
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Create Flask app
 app = Flask(__name__, static_folder='static')
 app.secret_key = 'your_secret_key'  # Change this to a random secret key
 
+# Let the front-end server send uploaded PDFs: 'x-accel-redirect' (nginx,
+# internal location FILE_OFFLOAD_PREFIX mapped to static/uploads) or
+# 'x-sendfile' (Apache mod_xsendfile). Unset to stream from Python.
+app.config['FILE_OFFLOAD_MODE'] = os.environ.get('DOCNEST_FILE_OFFLOAD_MODE') or None
+app.config['FILE_OFFLOAD_PREFIX'] = os.environ.get('DOCNEST_FILE_OFFLOAD_PREFIX', '/protected/uploads/')
+
+# Where uploads and QR codes are stored: DOCNEST_STORAGE_BACKEND=local (default)
+# or s3 with DOCNEST_S3_* settings (see api/storage.py)
+from api.storage import settings_from_env
+app.config.update(settings_from_env())
+
+# Public base URL encoded in document QR codes (DOCNEST_PUBLIC_URL, e.g.
+# https://docs.example.com). Without it, new QR codes encode the address
+# of the upload request. Changing it takes effect for existing documents
+# once regenerate_qrcodes.py (which reads the same variable) has run.
+from api.qrcodes import base_url_from_env
+app.config['PUBLIC_URL'] = base_url_from_env()
+
+# Number of reverse proxies (nginx etc.) in front of the app whose
+# X-Forwarded-For / X-Forwarded-Proto headers are trusted, so per-IP
+# throttling sees the real client address
+proxy_count = int(os.environ.get('DOCNEST_PROXY_COUNT', '0'))
+if proxy_count:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count, x_host=proxy_count)
+
+# Include inspection dates in file number autocomplete suggestions on the
+# public query pages (DOCNEST_AUTOCOMPLETE_DATES=0 returns numbers only)
+app.config['AUTOCOMPLETE_DATES'] = os.environ.get('DOCNEST_AUTOCOMPLETE_DATES', '1') not in ('0', 'false', 'no')
+
+# Compression of API responses (gzip, or brotli when installed): bodies
+# smaller than DOCNEST_COMPRESS_MIN_SIZE bytes are sent as is; levels trade
+# CPU time for size (see api/compression.py)
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('DOCNEST_COMPRESS_MIN_SIZE', '1024'))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('DOCNEST_COMPRESS_GZIP_LEVEL', '6'))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('DOCNEST_COMPRESS_BROTLI_QUALITY', '4'))
+
+# Metrics at /metrics (see api/metrics.py): with several worker processes
+# each writes its values to DOCNEST_METRICS_DIR, where they are summed
+# (serve.py sets it). Readable from localhost, or anywhere with
+# DOCNEST_METRICS_TOKEN as a bearer token.
+app.config['METRICS_DIR'] = os.environ.get('DOCNEST_METRICS_DIR') or None
+app.config['METRICS_TOKEN'] = os.environ.get('DOCNEST_METRICS_TOKEN') or None
+
 # Ensure upload and QR code directories exist
 try:
     os.makedirs('static/uploads')
@@ -26,14 +70,17 @@ except OSError:
 from api import init_app
 init_app(app)
 
-# Serve static files
+# Serve static files (the bundled, precompressed assets of build_assets.py
+# when they have been built, see api/assets.py)
+from api.assets import send_asset
+
 @app.route('/')
 def index():
-    return send_file('static/index.html')
+    return send_asset(app.static_folder, 'index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory('static', path)
+    return send_asset(app.static_folder, path)
 
 # Run the app
 if __name__ == '__main__':
@@ -44,4 +91,7 @@ if __name__ == '__main__':
     if len(sys.argv) >= 3:
         serverPort = int(sys.argv[2])
 
-    app.run(host=serverHost, port=serverPort, debug=True)
+    # Development server only; use serve.py in production. The debugger
+    # and reloader are enabled with DOCNEST_DEBUG=1.
+    debug = os.environ.get('DOCNEST_DEBUG', '0') not in ('0', 'false', 'no')
+    app.run(host=serverHost, port=serverPort, debug=debug)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ASGI service for the public read endpoints that get large bursts of
+# traffic when a sheet of printed QR codes is handed out: the mobile viewer
+# page, document query, PDF view, QR code, page manifest, page and thumbnail
+# routes. Run it beside the WSGI app (serve.py) and let the front-end server
+# route these paths to it:
+#
+#     uvicorn asgi:app --host 127.0.0.1 --port 8001 --workers 4
+#
+# Requests are handled by the same Flask view functions as the WSGI app
+# (same lookups, visibility checks and caching headers), called on a small
+# thread pool that also does the database reads. Only the response body is
+# sent from the event loop: files are read block by block on the pool, so a
+# slow mobile download holds an open file and a coroutine instead of a
+# thread, and thousands of them can be in flight at once.
+
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from app import app as flask_app
+
+# Endpoints served by this service; other requests get 404 (they belong to
+# the WSGI app)
+ASGI_ENDPOINTS = {
+    'api.query_document',
+    'api.view_document',
+    'api.get_qrcode',
+    'api.get_document_manifest',
+    'api.get_document_page',
+    'api.get_thumbnail',
+}
+
+# Static pages served by this service
+ASGI_STATIC_PATHS = {'/mobile-viewer.html'}
+
+# Threads running view functions and file reads (each keeps its own pooled
+# database connection)
+ASGI_THREADS = 16
+
+# Largest request body accepted (the query endpoint takes a small JSON body)
+ASGI_MAX_BODY = 64 * 1024
+
+# Bytes read from a file and sent per block
+ASGI_BLOCK_SIZE = 64 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+
+
+# wsgi.file_wrapper for the view functions: marks a response body as a
+# plain file, which is then sent block by block without holding a thread
+class FileBody:
+    def __init__(self, file, block_size=ASGI_BLOCK_SIZE):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            block = self.file.read(self.block_size)
+            if not block:
+                break
+            yield block
+
+    def close(self):
+        self.file.close()
+
+# WSGI environ of an ASGI HTTP request whose body has been read
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileBody,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+# Check whether a request is for an endpoint of this service
+def is_served(environ):
+    adapter = flask_app.url_map.bind_to_environ(environ)
+    try:
+        endpoint, _ = adapter.match()
+    except HTTPException:
+        return False
+    if endpoint == 'serve_static':
+        return environ['PATH_INFO'] in ASGI_STATIC_PATHS
+    return endpoint in ASGI_ENDPOINTS
+
+# Run the Flask app for a request (on the thread pool).
+# Returns (status code, headers, body iterable).
+def call_flask(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    body = flask_app(environ, start_response)
+    return started['status'], started['headers'], body
+
+# Read the whole request body. Returns None if the client went away.
+# Raises ValueError if the body is larger than ASGI_MAX_BODY.
+async def read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            raise ValueError('Request body too large')
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+# Send a complete response with a JSON error body
+async def send_error(send, status, message):
+    body = '{{"error": "{}"}}'.format(message).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+# Send a WSGI response body, reading it on the thread pool. Stops early when
+# the client disconnects; the body is always closed.
+async def send_body(send, receive, body):
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        if isinstance(body, FileBody):
+            read = body.file.read
+            next_block = lambda: read(ASGI_BLOCK_SIZE)
+        else:
+            iterator = iter(body)
+            next_block = lambda: next(iterator, b'')
+
+        while not disconnected.is_set():
+            block = await loop.run_in_executor(_executor, next_block)
+            if not block:
+                break
+            await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(body, 'close'):
+            await loop.run_in_executor(_executor, body.close)
+
+# Answer lifespan events (startup / shutdown of the server)
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# ASGI application
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    try:
+        body = await read_body(receive)
+    except ValueError:
+        await send_error(send, 413, 'Request body too large')
+        return
+    if body is None:
+        return
+
+    environ = build_environ(scope, body)
+    if not is_served(environ):
+        await send_error(send, 404, 'Not found')
+        return
+
+    loop = asyncio.get_running_loop()
+    status, headers, body = await loop.run_in_executor(_executor, call_flask, environ)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send_body(send, receive, body)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Extract page counts, PDF metadata and thumbnails for existing documents:
+#
+#     python backfill_previews.py --workers 8
+#
+# Documents whose preview is already ready are skipped (unless --force), so
+# the command is incremental and can simply be re-run after an interruption.
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from api.db import DB_PATH
+from api.storage import settings_from_env, configure
+from api.previews import PREVIEW_STATUS_READY, PREVIEW_STATUS_FAILED, PREVIEW_UPDATE, build_preview, preview_values
+
+# Root directory that PAGES_DIR and the local storage directories are relative to
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Documents read from the database per batch
+BATCH_SIZE = 200
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 2.0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Extract metadata and thumbnails for existing documents.')
+    parser.add_argument('--db', default=DB_PATH, help='Database path (default: %(default)s)')
+    parser.add_argument('--root', default=ROOT_PATH, help='Application root directory (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of extraction processes (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Documents read and committed per batch (default: %(default)s)')
+    parser.add_argument('--start-id', type=int, default=0, help='Only process documents with id >= START_ID')
+    parser.add_argument('--force', action='store_true', help='Process documents whose preview is already ready')
+    return parser.parse_args(argv)
+
+# Stream documents in id order, one batch at a time
+def iter_batches(conn, start_id, batch_size):
+    last_id = start_id - 1
+    while True:
+        rows = conn.execute(
+            'SELECT id, filename, preview_status FROM documents WHERE id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1]['id']
+
+# Run the preview stage for one document (runs in a worker process)
+def preview_task(task):
+    document_id, filename, root_path = task
+    return document_id, preview_values(build_preview(root_path, filename))
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = settings_from_env()
+    configure(args.root, settings)
+
+    # Connect to database
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+
+    total = conn.execute('SELECT COUNT(*) FROM documents WHERE id >= ?', (args.start_id,)).fetchone()[0]
+    print(f"Extracting previews for {total} documents using {args.workers} workers...")
+
+    started = time.monotonic()
+    last_report = started
+    seen = extracted = skipped = failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=configure,
+                             initargs=(args.root, settings)) as executor:
+        for batch in iter_batches(conn, args.start_id, args.batch_size):
+            tasks = [
+                (document['id'], document['filename'], args.root)
+                for document in batch
+                if args.force or document['preview_status'] != PREVIEW_STATUS_READY
+            ]
+            skipped += len(batch) - len(tasks)
+
+            # Extract the batch in parallel
+            futures = {task[0]: executor.submit(preview_task, task) for task in tasks}
+
+            # Record the results in a single transaction per batch
+            updates = []
+            failures = []
+            for document_id, future in futures.items():
+                try:
+                    _, values = future.result()
+                except Exception as e:
+                    print(f"Failed to extract preview for document ID {document_id}: {e}")
+                    failures.append((PREVIEW_STATUS_FAILED, document_id))
+                    continue
+                updates.append(values + (document_id,))
+
+            conn.executemany(PREVIEW_UPDATE, updates)
+            conn.executemany('UPDATE documents SET preview_status = ? WHERE id = ?', failures)
+            conn.commit()
+
+            extracted += len(updates)
+            failed += len(failures)
+            seen += len(batch)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = seen / (now - started)
+                print(f"  {seen}/{total} documents ({extracted} extracted, {skipped} up to date, {failed} failed), "
+                      f"{rate:.0f} docs/s, last id {batch[-1]['id']}")
+
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    rate = seen / elapsed if elapsed > 0 else 0
+    print(f"Done in {elapsed:.1f}s: {extracted} extracted, {skipped} up to date, {failed} failed ({rate:.0f} docs/s)")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
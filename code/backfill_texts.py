@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Extract the text of existing documents into the full-text search index:
+#
+#     python backfill_texts.py --workers 8
+#
+# Documents whose text is already indexed are skipped (unless --force), so
+# the command is incremental and can simply be re-run after an interruption.
+# Documents sharing a file are only extracted once.
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from api.db import DB_PATH
+from api.migrations import has_fts_index
+from api.storage import settings_from_env, configure
+from api.texts import TEXT_STATUS_READY, TEXT_STATUS_FAILED, TEXT_UPDATE, build_text
+
+# Root directory that the local storage directories are relative to
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Documents read from the database per batch
+BATCH_SIZE = 200
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 2.0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Index the text of existing documents for full-text search.')
+    parser.add_argument('--db', default=DB_PATH, help='Database path (default: %(default)s)')
+    parser.add_argument('--root', default=ROOT_PATH, help='Application root directory (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of extraction processes (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Documents read and committed per batch (default: %(default)s)')
+    parser.add_argument('--start-id', type=int, default=0, help='Only process documents with id >= START_ID')
+    parser.add_argument('--force', action='store_true', help='Process documents whose text is already indexed')
+    return parser.parse_args(argv)
+
+# Stream documents in id order, one batch at a time
+def iter_batches(conn, start_id, batch_size):
+    last_id = start_id - 1
+    while True:
+        rows = conn.execute(
+            'SELECT id, filename, content_hash, text_status FROM documents WHERE id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1]['id']
+
+# Extract the text of one stored file (runs in a worker process)
+def text_task(filename):
+    return build_text(filename)
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = settings_from_env()
+    configure(args.root, settings)
+
+    # Connect to database
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+
+    if not has_fts_index(conn):
+        print("No full-text search index: this SQLite build lacks FTS5")
+        conn.close()
+        return 1
+
+    total = conn.execute('SELECT COUNT(*) FROM documents WHERE id >= ?', (args.start_id,)).fetchone()[0]
+    print(f"Indexing text of {total} documents using {args.workers} workers...")
+
+    started = time.monotonic()
+    last_report = started
+    seen = extracted = skipped = failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=configure,
+                             initargs=(args.root, settings)) as executor:
+        for batch in iter_batches(conn, args.start_id, args.batch_size):
+            documents = [
+                document for document in batch
+                if args.force or document['text_status'] != TEXT_STATUS_READY
+            ]
+            skipped += len(batch) - len(documents)
+
+            # Extract each distinct file of the batch once, in parallel
+            futures = {}
+            for document in documents:
+                key = document['content_hash'] or document['filename']
+                if key not in futures:
+                    futures[key] = executor.submit(text_task, document['filename'])
+
+            # Record the results in a single transaction per batch
+            updates = []
+            failures = []
+            for document in documents:
+                try:
+                    text = futures[document['content_hash'] or document['filename']].result()
+                except Exception as e:
+                    print(f"Failed to extract text for document ID {document['id']}: {e}")
+                    failures.append((TEXT_STATUS_FAILED, document['id']))
+                    continue
+                updates.append((text, document['id']))
+
+            conn.executemany(TEXT_UPDATE, updates)
+            conn.executemany('UPDATE documents SET text_status = ? WHERE id = ?',
+                             [(TEXT_STATUS_READY, document_id) for _, document_id in updates] + failures)
+            conn.commit()
+
+            extracted += len(updates)
+            failed += len(failures)
+            seen += len(batch)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = seen / (now - started)
+                print(f"  {seen}/{total} documents ({extracted} indexed, {skipped} up to date, {failed} failed), "
+                      f"{rate:.0f} docs/s, last id {batch[-1]['id']}")
+
+    # Merge the index segments written by the batches
+    conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    rate = seen / elapsed if elapsed > 0 else 0
+    print(f"Done in {elapsed:.1f}s: {extracted} indexed, {skipped} up to date, {failed} failed ({rate:.0f} docs/s)")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
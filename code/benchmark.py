@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measure the throughput of a running DocNest server with the public
+# read traffic of QR code scans: 40% file number queries, 40% PDF views and
+# 20% QR codes, spread over the benchmark documents.
+#
+#     python benchmark.py http://127.0.0.1:8000 --seed --password admin
+#     python benchmark.py http://127.0.0.1:8000 --concurrency 16 --duration 10
+#
+# --seed uploads the benchmark documents (file numbers BENCH000, BENCH001,
+# ... with inspection date 2024-01-01) with an admin account first; later
+# runs reuse them. Each concurrent client keeps one connection open and
+# sends requests back to back. Prints requests per second, latency
+# percentiles and errors.
+
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+# Benchmark documents
+BENCH_FILE_NUMBER = 'BENCH{:03d}'
+BENCH_INSPECTION_DATE = '2024-01-01'
+
+# Request mix: (share, kind)
+BENCH_MIX = ((0.4, 'query'), (0.4, 'view'), (0.2, 'qrcode'))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the public read endpoints of a running server.')
+    parser.add_argument('url', help='Base URL of the server, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent connections (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default: %(default)s)')
+    parser.add_argument('--documents', type=int, default=20, help='Benchmark documents (default: %(default)s)')
+    parser.add_argument('--seed', action='store_true', help='Upload the benchmark documents first')
+    parser.add_argument('--username', default='admin', help='Account used by --seed (default: %(default)s)')
+    parser.add_argument('--password', help='Password of the --seed account')
+    parser.add_argument('--pages', type=int, default=3, help='Pages per seeded PDF (default: %(default)s)')
+    parser.add_argument('--random-seed', type=int, default=1, help='Seed of the request sequence (default: %(default)s)')
+    return parser.parse_args(argv)
+
+def connect(url):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port)
+
+# Send a request, returns (status, parsed JSON body or raw bytes)
+def call(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    if response.getheader('Content-Type', '').startswith('application/json'):
+        return response.status, json.loads(data)
+    return response.status, data
+
+def json_body(data):
+    return json.dumps(data), {'Content-Type': 'application/json'}
+
+# Blank PDF with the given number of pages
+def make_pdf(pages, title):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    writer.add_metadata({'/Title': title})
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+# Multipart body of an upload
+def multipart(fields, filename, data):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(
+            boundary, name, value).encode('utf-8'))
+    parts.append('--{}\r\nContent-Disposition: form-data; name="file"; filename="{}"\r\n'
+                 'Content-Type: application/pdf\r\n\r\n'.format(boundary, filename).encode('utf-8'))
+    parts.append(data + '\r\n--{}--\r\n'.format(boundary).encode('utf-8'))
+    return b''.join(parts), {'Content-Type': 'multipart/form-data; boundary=' + boundary}
+
+# Look up the id of each benchmark document; None for missing ones
+def find_documents(conn, count):
+    ids = []
+    for index in range(count):
+        body, headers = json_body({'file_number': BENCH_FILE_NUMBER.format(index),
+                                   'inspection_date': BENCH_INSPECTION_DATE})
+        status, data = call(conn, 'POST', '/api/documents/query', body, headers)
+        ids.append(data['document']['id'] if status == 200 else None)
+    return ids
+
+# Upload the benchmark documents that don't exist yet
+def seed(args, conn):
+    body, headers = json_body({'username': args.username, 'password': args.password})
+    status, data = call(conn, 'POST', '/api/auth/login', body, headers)
+    if status != 200:
+        raise RuntimeError('Login failed: {}'.format(data))
+    token = data['token']
+
+    missing = [index for index, document_id in enumerate(find_documents(conn, args.documents)) if document_id is None]
+    for index in missing:
+        file_number = BENCH_FILE_NUMBER.format(index)
+        body, headers = multipart({'file_number': file_number, 'inspection_date': BENCH_INSPECTION_DATE},
+                                  file_number + '.pdf', make_pdf(args.pages, file_number))
+        headers['Authorization'] = 'Bearer ' + token
+        status, data = call(conn, 'POST', '/api/documents', body, headers)
+        if status != 201:
+            raise RuntimeError('Upload of {} failed: {}'.format(file_number, data))
+    print(f"Seeded {len(missing)} documents ({args.documents - len(missing)} already present)")
+
+# One client: requests back to back until the deadline
+def run_client(url, document_ids, deadline, rng, results):
+    conn = connect(url)
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        index = rng.randrange(len(document_ids))
+        document_id = document_ids[index]
+        choice = rng.random()
+        for share, kind in BENCH_MIX:
+            if choice < share:
+                break
+            choice -= share
+
+        started = time.perf_counter()
+        try:
+            if kind == 'query':
+                body, headers = json_body({'file_number': BENCH_FILE_NUMBER.format(index),
+                                           'inspection_date': BENCH_INSPECTION_DATE})
+                status, _ = call(conn, 'POST', '/api/documents/query', body, headers)
+            else:
+                status, _ = call(conn, 'GET', '/api/documents/{}/{}'.format(document_id, kind))
+            if status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = connect(url)
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    results.append((latencies, errors))
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main(argv=None):
+    args = parse_args(argv)
+    url = args.url.rstrip('/')
+
+    conn = connect(url)
+    if args.seed:
+        if not args.password:
+            print("--seed needs --password")
+            return 2
+        seed(args, conn)
+
+    document_ids = find_documents(conn, args.documents)
+    conn.close()
+    if None in document_ids:
+        print("Missing benchmark documents, run with --seed first")
+        return 1
+
+    print(f"Benchmarking {url}: {args.concurrency} connections for {args.duration:.0f}s "
+          f"over {len(document_ids)} documents...")
+    results = []
+    deadline = time.monotonic() + args.duration
+    clients = [
+        threading.Thread(target=run_client,
+                         args=(url, document_ids, deadline, random.Random(args.random_seed + n), results))
+        for n in range(args.concurrency)
+    ]
+    started = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    errors = sum(client_errors for _, client_errors in results)
+    if not latencies:
+        print("No requests completed")
+        return 1
+
+    print(f"{len(latencies) / elapsed:.0f} req/s, p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, {len(latencies)} requests, {errors} errors")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Build the front-end assets for production:
+#
+#     python build_assets.py
+#
+# The local scripts and stylesheets of each page (index.html,
+# mobile-viewer.html) are bundled in page order, minified (when rjsmin /
+# rcssmin are installed) and written to static/dist/ under content-hashed
+# names. The page is rewritten to load the bundles and written to
+# static/dist/ as well. Every built file gets gzip and brotli (when the
+# brotli package is installed) variants, which the app serves according to
+# Accept-Encoding, with immutable caching for the hashed files (see
+# api/assets.py).
+#
+# Re-run after changing anything under static/. Without static/dist/ the
+# source pages and files are served as before.
+
+import os
+import re
+import sys
+import gzip
+import hashlib
+import argparse
+from api.assets import ASSET_DIST_DIR, ASSET_PAGES, ASSET_ENCODINGS
+from api.files import write_atomic
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip variants are written without it
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # optional, scripts are bundled unminified without it
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:  # optional, stylesheets are bundled unminified without it
+    rcssmin = None
+
+# Static directory of the app
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# Hex digits of the content hash in built file names
+FINGERPRINT_LENGTH = 12
+
+# Files smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 512
+
+# Compression levels (built once, so the slowest, smallest settings)
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Local (relative URL) script and stylesheet tags, each on its own line
+_SCRIPT_TAG = re.compile(r'^([ \t]*)<script src="(?!https?:|//)([^"]+)"></script>[ \t]*\n', re.M)
+_STYLE_TAG = re.compile(r'^([ \t]*)<link rel="stylesheet" href="(?!https?:|//)([^"]+)">[ \t]*\n', re.M)
+
+# HTML comments and blank lines, dropped from built pages
+_HTML_COMMENT = re.compile(r'^[ \t]*<!--.*?-->[ \t]*\n', re.M | re.S)
+_BLANK_LINES = re.compile(r'\n([ \t]*\n)+')
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Bundle, fingerprint and precompress the front-end assets.')
+    parser.add_argument('--static-dir', default=STATIC_DIR, help='Static directory (default: %(default)s)')
+    parser.add_argument('--no-minify', action='store_true', help='Bundle scripts and stylesheets without minifying')
+    parser.add_argument('--clean', action='store_true',
+                        help='Remove built files of earlier builds (pages cached by clients may still reference them)')
+    return parser.parse_args(argv)
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def minify_js(source):
+    return rjsmin.jsmin(source) if rjsmin else source
+
+def minify_css(source):
+    return rcssmin.cssmin(source) if rcssmin else source
+
+# Concatenate files in order. Pages load their scripts as classic scripts
+# sharing one global scope, so the bundle behaves the same; the separator
+# guards against a file not ending its last statement.
+def bundle(static_dir, paths, minify, separator):
+    parts = []
+    for path in paths:
+        source = read_text(os.path.join(static_dir, path))
+        parts.append(minify(source).strip() if minify else source)
+    return separator.join(parts) + '\n'
+
+# Name of a built file: <stem>.<content hash>.<extension>
+def fingerprinted_name(stem, data, extension):
+    digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+    return '{}.{}.{}'.format(stem, digest, extension)
+
+# Compressed variants of data: {file suffix: bytes}, only those smaller
+# than the original
+def compressed_variants(data):
+    if len(data) < COMPRESS_MIN_SIZE:
+        return {}
+
+    variants = {}
+    for encoding, suffix in ASSET_ENCODINGS:
+        if encoding == 'gzip':
+            compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        elif encoding == 'br' and brotli is not None:
+            compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            continue
+        if len(compressed) < len(data):
+            variants[suffix] = compressed
+    return variants
+
+# Write a built file and its compressed variants to dist_dir.
+# Returns the names written.
+def write_built(dist_dir, name, data):
+    path = os.path.join(dist_dir, name)
+    write_atomic(path, data)
+    written = [name]
+    for suffix, compressed in compressed_variants(data).items():
+        write_atomic(path + suffix, compressed)
+        written.append(name + suffix)
+    return written
+
+# Replace the first tag matched by pattern with make_tag(indent) and drop the
+# others
+def replace_tags(html, pattern, make_tag):
+    first = True
+
+    def replace(match):
+        nonlocal first
+        if first:
+            first = False
+            return make_tag(match.group(1))
+        return ''
+
+    return pattern.sub(replace, html)
+
+# Human readable size
+def format_size(size):
+    return '{:.1f} KB'.format(size / 1024)
+
+# Size summary of a built file and its variants
+def describe(dist_dir, names):
+    sizes = []
+    for name in names:
+        size = os.path.getsize(os.path.join(dist_dir, name))
+        suffix = next((encoding for encoding, suffix in ASSET_ENCODINGS if name.endswith(suffix)), None)
+        sizes.append('{} {}'.format(suffix, format_size(size)) if suffix else format_size(size))
+    return ', '.join(sizes)
+
+# Build one page: bundle its local scripts and stylesheets, rewrite it to
+# load the bundles. Returns the names written.
+def build_page(static_dir, dist_dir, page, minify):
+    html = read_text(os.path.join(static_dir, page))
+    stem = os.path.splitext(page)[0]
+    written = []
+
+    bundles = (
+        (_SCRIPT_TAG, 'js', '\n;\n', minify_js if minify else None, '{}<script src="{}/{}"></script>\n'),
+        (_STYLE_TAG, 'css', '\n', minify_css if minify else None, '{}<link rel="stylesheet" href="{}/{}">\n'),
+    )
+    for pattern, extension, separator, minifier, tag in bundles:
+        sources = [match.group(2) for match in pattern.finditer(html)]
+        if not sources:
+            continue
+
+        data = bundle(static_dir, sources, minifier, separator).encode('utf-8')
+        name = fingerprinted_name(stem, data, extension)
+        names = write_built(dist_dir, name, data)
+        written.extend(names)
+
+        html = replace_tags(html, pattern, lambda indent: tag.format(indent, ASSET_DIST_DIR, name))
+        print(f"  {page}: {len(sources)} {extension} files -> {ASSET_DIST_DIR}/{name} ({describe(dist_dir, names)})")
+
+    html = _BLANK_LINES.sub('\n', _HTML_COMMENT.sub('', html))
+    names = write_built(dist_dir, page, html.encode('utf-8'))
+    written.extend(names)
+    print(f"  {page} -> {ASSET_DIST_DIR}/{page} ({describe(dist_dir, names)})")
+    return written
+
+# Remove files of earlier builds
+def clean(dist_dir, keep):
+    removed = 0
+    for entry in os.scandir(dist_dir):
+        if entry.is_file() and entry.name not in keep:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+def main(argv=None):
+    args = parse_args(argv)
+    dist_dir = os.path.join(args.static_dir, ASSET_DIST_DIR)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    minify = not args.no_minify
+    if minify and (rjsmin is None or rcssmin is None):
+        print("rjsmin / rcssmin not installed, bundling without minifying (pip install rjsmin rcssmin)")
+    if brotli is None:
+        print("brotli not installed, writing gzip variants only (pip install brotli)")
+
+    print(f"Building {len(ASSET_PAGES)} pages into {dist_dir}...")
+    written = set()
+    for page in ASSET_PAGES:
+        written.update(build_page(args.static_dir, dist_dir, page, minify))
+
+    if args.clean:
+        print(f"Removed {clean(dist_dir, written)} files of earlier builds")
+    print("Done")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
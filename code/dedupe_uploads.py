@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Move documents uploaded before deduplication into content-addressed
+# storage (static/uploads/ab/cd/<sha256>.pdf), sharing identical files:
+#
+#     python dedupe_uploads.py
+#
+# With --verify, rehash every content-addressed file instead and report
+# missing or corrupted files:
+#
+#     python dedupe_uploads.py --verify
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+from api.db import DB_PATH
+from api.files import UPLOAD_DIR, UPLOAD_STAGING_DIR, COPY_BLOCK_SIZE
+from api.storage import settings_from_env, configure, get_storage, content_filename
+from api.pages import remove_page_cache
+
+# Root directory that UPLOAD_DIR is relative to (legacy uploads are always
+# local files, whatever the storage backend)
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Documents read and committed per batch
+BATCH_SIZE = 200
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Move legacy uploads into content-addressed storage.')
+    parser.add_argument('--db', default=DB_PATH, help='Database path (default: %(default)s)')
+    parser.add_argument('--root', default=ROOT_PATH, help='Application root directory (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Documents read and committed per batch (default: %(default)s)')
+    parser.add_argument('--verify', action='store_true', help='Check stored files against their hashes')
+    return parser.parse_args(argv)
+
+# SHA-256 of a file
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+# Link (or copy) a file into the staging directory, returns the new path
+def stage_copy(root_path, path):
+    staging_dir = os.path.join(root_path, UPLOAD_STAGING_DIR)
+    os.makedirs(staging_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir, prefix='.tmp-')
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copy2(path, tmp_path)
+    return tmp_path
+
+# Stream rows in id order, one batch at a time
+def iter_batches(conn, query, batch_size):
+    last_id = 0
+    while True:
+        rows = conn.execute(query, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1]['id']
+
+def migrate(conn, args):
+    upload_dir = os.path.join(args.root, UPLOAD_DIR)
+    store = get_storage('uploads')
+    moved = shared = missing = 0
+
+    query = 'SELECT id, filename FROM documents WHERE content_hash IS NULL AND id > ? ORDER BY id LIMIT ?'
+    for batch in iter_batches(conn, query, args.batch_size):
+        updates = []
+        for document in batch:
+            old_path = os.path.join(upload_dir, document['filename'])
+            if not os.path.exists(old_path):
+                missing += 1
+                print(f"Missing file for document ID {document['id']}: {document['filename']}")
+                continue
+
+            digest = hash_file(old_path)
+            filename = content_filename(digest)
+
+            # Store a copy first; the old file is only removed once the
+            # database points at the new one
+            if store.exists(filename):
+                shared += 1
+            else:
+                store.put_file(filename, stage_copy(args.root, old_path))
+            updates.append((filename, digest, document['id'], document['filename']))
+
+        conn.executemany('UPDATE documents SET filename = ?, content_hash = ? WHERE id = ?',
+                         [update[:3] for update in updates])
+        conn.commit()
+
+        for _, _, _, old_filename in updates:
+            os.remove(os.path.join(upload_dir, old_filename))
+            remove_page_cache(args.root, old_filename)
+        moved += len(updates)
+        print(f"  {moved} moved ({shared} duplicates shared), {missing} missing, last id {batch[-1]['id']}")
+
+    print(f"Done: {moved} documents moved to content-addressed storage, "
+          f"{shared} duplicate files removed, {missing} missing")
+    return 1 if missing else 0
+
+def verify(conn, args):
+    store = get_storage('uploads')
+    checked = bad = 0
+
+    # Each stored file once, however many documents share it
+    last_hash = ''
+    while True:
+        rows = conn.execute(
+            'SELECT DISTINCT content_hash FROM documents WHERE content_hash > ? ORDER BY content_hash LIMIT ?',
+            (last_hash, args.batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            digest = row['content_hash']
+            chunks = store.stream(content_filename(digest))
+            if chunks is None:
+                bad += 1
+                print(f"Missing: {content_filename(digest)}")
+            else:
+                hasher = hashlib.sha256()
+                for chunk in chunks:
+                    hasher.update(chunk)
+                if hasher.hexdigest() != digest:
+                    bad += 1
+                    print(f"Corrupted: {content_filename(digest)}")
+            checked += 1
+        last_hash = rows[-1]['content_hash']
+
+    print(f"Done: {checked} files checked, {bad} missing or corrupted")
+    return 1 if bad else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure(args.root, settings_from_env())
+
+    # Connect to database
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+
+    started = time.monotonic()
+    status = verify(conn, args) if args.verify else migrate(conn, args)
+    conn.close()
+
+    print(f"Finished in {time.monotonic() - started:.1f}s")
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
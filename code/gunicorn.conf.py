@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Gunicorn settings for running DocNest in production. Used by serve.py,
+# which overrides them with its command line options; also usable directly:
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# Every setting can be changed through a DOCNEST_* environment variable.
+# The file is read again on SIGHUP, so edits apply on a graceful reload.
+
+import os
+import tempfile
+
+# Directory the app is run from (the database and static paths are
+# relative to it)
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def env_flag(name, default):
+    return os.environ.get(name, default) not in ('0', 'false', 'no')
+
+chdir = ROOT_PATH
+wsgi_app = 'app:app'
+bind = os.environ.get('DOCNEST_BIND', '127.0.0.1:8000').split(',')
+
+# Preforked worker processes, each serving requests from a pool of threads
+# (requests mostly wait on SQLite and file I/O, so threads overlap well;
+# processes spread PDF/QR rendering over the CPUs)
+worker_class = 'gthread'
+workers = env_int('DOCNEST_WORKERS', os.cpu_count() or 1)
+threads = env_int('DOCNEST_THREADS', 8)
+
+# Import the app once in the master before forking: workers start faster
+# and share the imported code's memory. Note that a SIGHUP reload then
+# keeps serving the old code; restart the master to deploy new code.
+preload_app = env_flag('DOCNEST_PRELOAD', '1')
+
+# Seconds before a silent worker is killed and replaced, and seconds given
+# to in-flight requests when workers are stopped or reloaded
+timeout = env_int('DOCNEST_TIMEOUT', 120)
+graceful_timeout = env_int('DOCNEST_GRACEFUL_TIMEOUT', 30)
+keepalive = 5
+
+# Replace workers after this many requests (0 = never), with jitter so
+# they don't all restart at once
+max_requests = env_int('DOCNEST_MAX_REQUESTS', 0)
+max_requests_jitter = max_requests // 10
+
+# Worker heartbeat files in memory rather than on a possibly slow disk
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Directory where each worker writes its metrics for /metrics to sum up
+# (cleared when the server starts)
+os.environ.setdefault('DOCNEST_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'docnest-metrics'))
+
+accesslog = os.environ.get('DOCNEST_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+# Apply pending schema migrations once in the master, before any worker
+# starts (without preloading, workers would otherwise race to migrate), and
+# drop the metrics of the previous run
+def on_starting(server):
+    from api.db import bootstrap_schema
+    from api.metrics import clear_directory
+    bootstrap_schema()
+    clear_directory(os.environ['DOCNEST_METRICS_DIR'])
+
+# Give each worker its own database connections, storage clients,
+# background task pool and caches instead of the ones inherited from the
+# master
+def post_fork(server, worker):
+    from api import reset_after_fork
+    reset_after_fork()
+
+# Save the final metrics of a worker that is shut down or replaced
+def worker_exit(server, worker):
+    from api.metrics import flush
+    flush()
+
+# Fold the metrics of an exited worker into the totals of exited workers
+# (in the master, once the worker is gone and before a replacement can
+# reuse its pid)
+def child_exit(server, worker):
+    from api.metrics import merge_exited
+    merge_exited(os.environ['DOCNEST_METRICS_DIR'], worker.pid)
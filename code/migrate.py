@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import sqlite3
+from api.db import DB_PATH, bootstrap_schema
+from api.migrations import HOT_QUERIES, get_schema_version, check_query_plans
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) >= 2 else DB_PATH
+
+    # Create tables and apply pending migrations
+    bootstrap_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        print(f"Schema version: {get_schema_version(conn)}")
+
+        # Make sure no hot query regressed to a full table scan
+        regressions = check_query_plans(conn)
+        for name, details in regressions:
+            print(f"Full table scan in {name}: {'; '.join(details)}")
+        if regressions:
+            return 1
+
+        print(f"All {len(HOT_QUERIES)} hot queries use an index")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
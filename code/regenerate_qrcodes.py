@@ -1,73 +1,154 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# Regenerate document QR codes for a base URL:
+#
+#     python regenerate_qrcodes.py https://docs.example.com --workers 8
+#
+# The base URL defaults to DOCNEST_PUBLIC_URL, the setting the app encodes
+# in new QR codes, so both agree. Documents without a recorded QR code
+# (e.g. its background task failed) get one as well.
+#
+# Documents whose stored QR hash already matches the base URL (and whose QR
+# file exists) are skipped, so the command is incremental and can simply be
+# re-run after an interruption.
+
 import os
+import sys
+import time
 import sqlite3
-import qrcode
-from flask import Flask
-
-# Database path
-DB_PATH = 'static/documents.db'
-
-# Upload directory
-UPLOAD_DIR = 'static/uploads'
-
-# QR code directory
-QRCODE_DIR = 'static/qrcodes'
-
-# Create a minimal Flask app for the context
-app = Flask(__name__)
-app.config['SERVER_NAME'] = 'localhost:5000'
-
-# Generate QR code for a document (copy from documents.py but without request dependency)
-def generate_qr_code(document_id, filename):
-    # Create QR code with the mobile viewer URL instead of direct view URL
-    base_url = f"http://{app.config['SERVER_NAME']}"
-    mobile_viewer_url = f"{base_url}/mobile-viewer.html?id={document_id}"
-    
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(mobile_viewer_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    qr_path = os.path.join(QRCODE_DIR, "{}.png".format(filename.split('.')[0]))
-    img.save(qr_path)
-    return qr_path
-
-def main():
-    print("Regenerating QR codes for all documents...")
-    
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from api.db import DB_PATH
+from api.storage import settings_from_env, configure, get_storage
+from api.qrcodes import QR_STATUS_READY, base_url_from_env, qr_target_url, qr_hash, qr_key, legacy_qr_path, render_qr_png
+
+# Root directory that the local storage directories are relative to
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Documents read from the database per batch
+BATCH_SIZE = 500
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 2.0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Regenerate document QR codes for a base URL.')
+    parser.add_argument('base_url', nargs='?', default=base_url_from_env(),
+                        help='Base URL encoded in the QR codes, e.g. https://docs.example.com '
+                             '(default: DOCNEST_PUBLIC_URL)')
+    parser.add_argument('--db', default=DB_PATH, help='Database path (default: %(default)s)')
+    parser.add_argument('--root', default=ROOT_PATH, help='Application root directory (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of rendering processes (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Documents read and committed per batch (default: %(default)s)')
+    parser.add_argument('--start-id', type=int, default=0, help='Only process documents with id >= START_ID')
+    parser.add_argument('--force', action='store_true', help='Regenerate even if the QR hash already matches')
+    return parser.parse_args(argv)
+
+# Stream documents in id order, one batch at a time
+def iter_batches(conn, start_id, batch_size):
+    last_id = start_id - 1
+    while True:
+        rows = conn.execute(
+            'SELECT id, filename, qr_hash FROM documents WHERE id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1]['id']
+
+# Render and store one QR code (runs in a worker process)
+def render_task(task):
+    document_id, url, hash_value = task
+    get_storage('qrcodes').put(qr_key(hash_value), render_qr_png(url))
+    return document_id
+
+# Remove the QR files a document no longer uses
+def remove_old_files(root_path, document, hash_value):
+    if document['qr_hash'] and document['qr_hash'] != hash_value:
+        get_storage('qrcodes').delete(qr_key(document['qr_hash']))
+    legacy_path = legacy_qr_path(root_path, document['filename'])
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.base_url:
+        print("Give the base URL, or set DOCNEST_PUBLIC_URL")
+        return 2
+    base_url = args.base_url.rstrip('/')
+    settings = settings_from_env()
+    configure(args.root, settings)
+    store = get_storage('qrcodes')
+
     # Connect to database
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(args.db)
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Get all documents
-    cursor.execute('SELECT id, filename FROM documents')
-    documents = cursor.fetchall()
-    
-    # Regenerate QR codes
-    for doc in documents:
-        document_id = doc['id']
-        filename = doc['filename']
-        
-        # Delete existing QR code if it exists
-        qr_filename = "{}.png".format(filename.split('.')[0])
-        qr_path = os.path.join(QRCODE_DIR, qr_filename)
-        if os.path.exists(qr_path):
-            os.remove(qr_path)
-        
-        # Generate new QR code
-        generate_qr_code(document_id, filename)
-        print(f"Regenerated QR code for document ID {document_id}")
-    
-    print(f"Successfully regenerated QR codes for {len(documents)} documents")
+
+    total = conn.execute('SELECT COUNT(*) FROM documents WHERE id >= ?', (args.start_id,)).fetchone()[0]
+    print(f"Regenerating QR codes for {total} documents with base URL {base_url} using {args.workers} workers...")
+
+    started = time.monotonic()
+    last_report = started
+    seen = rendered = skipped = failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=configure,
+                             initargs=(args.root, settings)) as executor:
+        for batch in iter_batches(conn, args.start_id, args.batch_size):
+            tasks = {}
+            for document in batch:
+                url = qr_target_url(base_url, document['id'])
+                hash_value = qr_hash(url)
+                if (not args.force and document['qr_hash'] == hash_value
+                        and store.exists(qr_key(hash_value))):
+                    skipped += 1
+                    continue
+                tasks[document['id']] = (document, url, hash_value)
+
+            # Render the batch in parallel
+            futures = {
+                document_id: executor.submit(render_task, (document_id, url, hash_value))
+                for document_id, (document, url, hash_value) in tasks.items()
+            }
+
+            # Record the finished QR codes in a single transaction per batch
+            updates = []
+            for document_id, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to render QR code for document ID {document_id}: {e}")
+                    continue
+                document, url, hash_value = tasks[document_id]
+                updates.append((url, hash_value, QR_STATUS_READY, document_id))
+
+            conn.executemany('UPDATE documents SET qr_url = ?, qr_hash = ?, qr_status = ? WHERE id = ?', updates)
+            conn.commit()
+
+            # Old files are only removed once the new hash is committed
+            for url, hash_value, _, document_id in updates:
+                remove_old_files(args.root, tasks[document_id][0], hash_value)
+
+            rendered += len(updates)
+            seen += len(batch)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = seen / (now - started)
+                print(f"  {seen}/{total} documents ({rendered} rendered, {skipped} up to date, {failed} failed), "
+                      f"{rate:.0f} docs/s, last id {batch[-1]['id']}")
+
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    rate = seen / elapsed if elapsed > 0 else 0
+    print(f"Done in {elapsed:.1f}s: {rendered} rendered, {skipped} up to date, {failed} failed ({rate:.0f} docs/s)")
+    return 1 if failed else 0
 
 if __name__ == '__main__':
-    with app.app_context():
-        main()
+    sys.exit(main())
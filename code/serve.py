@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Run DocNest with a production server: preforked worker processes, each
+# with a pool of request threads (gunicorn, settings in gunicorn.conf.py):
+#
+#     python serve.py --bind 0.0.0.0:8000 --workers 4 --threads 8
+#
+# Signals to the master process:
+#
+#     kill -HUP <pid>     graceful reload: start new workers, let the old
+#                         ones finish their requests, re-read the settings
+#     kill -TERM <pid>    graceful shutdown
+#     kill -TTIN / -TTOU  add / remove a worker
+#
+# `python app.py` is the development server and should not be used in
+# production.
+
+import os
+import sys
+import argparse
+
+try:
+    from gunicorn.app.wsgiapp import WSGIApplication
+except ImportError:
+    WSGIApplication = None
+
+# Settings file with the defaults of the options below
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Run DocNest with a multi-process, multi-threaded server.')
+    parser.add_argument('--bind', action='append',
+                        help='Address to listen on, HOST:PORT or unix:PATH; may be repeated (default: 127.0.0.1:8000)')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--threads', type=int, help='Request threads per worker process (default: 8)')
+    preload = parser.add_mutually_exclusive_group()
+    preload.add_argument('--preload', dest='preload', action='store_true', default=None,
+                         help='Load the app in the master before forking workers (default)')
+    preload.add_argument('--no-preload', dest='preload', action='store_false',
+                         help='Load the app in each worker, so SIGHUP also reloads the code')
+    parser.add_argument('--timeout', type=int, help='Seconds before an unresponsive worker is restarted (default: 120)')
+    parser.add_argument('--max-requests', type=int, help='Restart workers after this many requests (default: never)')
+    parser.add_argument('--pid', help='Write the master process id to this file')
+    parser.add_argument('--daemon', action='store_true', help='Detach from the terminal')
+    return parser.parse_args(argv)
+
+# Command line for gunicorn: the settings file, then the given options
+def gunicorn_argv(args):
+    argv = ['gunicorn', '--config', CONFIG_PATH]
+    for address in args.bind or []:
+        argv += ['--bind', address]
+    if args.workers is not None:
+        argv += ['--workers', str(args.workers)]
+    if args.threads is not None:
+        argv += ['--threads', str(args.threads)]
+    if args.preload:
+        argv.append('--preload')
+    elif args.preload is False:
+        # No command line switch turns preloading off again
+        os.environ['DOCNEST_PRELOAD'] = '0'
+    if args.timeout is not None:
+        argv += ['--timeout', str(args.timeout)]
+    if args.max_requests is not None:
+        argv += ['--max-requests', str(args.max_requests)]
+    if args.pid:
+        argv += ['--pid', args.pid]
+    if args.daemon:
+        argv.append('--daemon')
+    return argv
+
+def main(argv=None):
+    args = parse_args(argv)
+    if WSGIApplication is None:
+        print('gunicorn is not installed (pip install gunicorn)', file=sys.stderr)
+        return 1
+
+    # gunicorn reads its options from sys.argv, also when reloading
+    sys.argv = gunicorn_argv(args)
+    WSGIApplication('%(prog)s [OPTIONS]').run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,7 +26,16 @@ const API_ENDPOINTS = {
     DOCUMENT: (id) => `/documents/${id}`,
     DOCUMENT_VIEW: (id) => `/documents/${id}/view`,
     DOCUMENT_QRCODE: (id) => `/documents/${id}/qrcode`,
-    DOCUMENT_QUERY: '/documents/query'
+    DOCUMENT_QUERY: '/documents/query',
+    DOCUMENT_AUTOCOMPLETE: '/documents/autocomplete',
+    DOCUMENTS_BULK: '/documents/bulk',
+    DOCUMENTS_SEARCH: '/documents/search',
+    DOCUMENTS_BULK_DELETE: '/documents/bulk/delete',
+    DOCUMENTS_BULK_VISIBILITY: '/documents/bulk/visibility',
+    
+    // Resumable uploads
+    UPLOADS: '/uploads',
+    UPLOAD: (id) => `/uploads/${id}`
 };
 
 // API client
@@ -230,8 +239,29 @@ const api = {
     },
     
     // Documents
-    async getDocuments() {
-        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS, {
+    // params: limit, cursor, order, file_number, date_from, date_to,
+    // group_id, uploaded_by, is_visible, include_total
+    async getDocuments(params = {}) {
+        const query = new URLSearchParams();
+        Object.entries(params).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') {
+                query.append(key, value);
+            }
+        });
+        const queryString = query.toString();
+        
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS + (queryString ? `?${queryString}` : ''), {
+            method: 'GET',
+            headers: this.getHeaders()
+        });
+        
+        return this.handleResponse(response);
+    },
+    
+    // Full-text search; params: q, limit, offset, include_total and list filters
+    async searchDocuments(params = {}) {
+        const queryString = new URLSearchParams(params).toString();
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS_SEARCH + `?${queryString}`, {
             method: 'GET',
             headers: this.getHeaders()
         });
@@ -260,6 +290,73 @@ const api = {
         return this.handleResponse(response);
     },
     
+    // Bulk upload; the per-item report is returned even when some items fail
+    async bulkUploadDocuments(formData) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS_BULK, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${this.getToken()}`
+            },
+            body: formData
+        });
+        
+        const data = await response.json();
+        if (!response.ok && !data.results) {
+            throw new Error(data.error || 'API request failed');
+        }
+        
+        return data;
+    },
+    
+    // Resumable uploads
+    async createUpload(filename, size) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.UPLOADS, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ filename, size })
+        });
+        
+        return this.handleResponse(response);
+    },
+    
+    async getUpload(id) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.UPLOAD(id), {
+            method: 'GET',
+            headers: this.getHeaders()
+        });
+        
+        return this.handleResponse(response);
+    },
+    
+    // Returns the response data, including the current offset on a 409
+    async uploadChunk(id, offset, chunk) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.UPLOAD(id) + `?offset=${offset}`, {
+            method: 'PUT',
+            headers: {
+                'Authorization': `Bearer ${this.getToken()}`,
+                'Content-Type': 'application/octet-stream'
+            },
+            body: chunk
+        });
+        
+        const data = await response.json();
+        if (!response.ok && response.status !== 409) {
+            throw new Error(data.error || 'API request failed');
+        }
+        
+        return data;
+    },
+    
+    async finalizeUpload(id, fileNumber, inspectionDate) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.UPLOAD(id) + '/finalize', {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ file_number: fileNumber, inspection_date: inspectionDate })
+        });
+        
+        return this.handleResponse(response);
+    },
+    
     async deleteDocument(id) {
         const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENT(id), {
             method: 'DELETE',
@@ -269,6 +366,27 @@ const api = {
         return this.handleResponse(response);
     },
     
+    // target: { ids: [...] } or { filter: { file_number, date_from, date_to, ... } }
+    async bulkDeleteDocuments(target) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS_BULK_DELETE, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify(target)
+        });
+        
+        return this.handleResponse(response);
+    },
+    
+    async bulkSetDocumentVisibility(target, isVisible) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENTS_BULK_VISIBILITY, {
+            method: 'PUT',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ ...target, is_visible: isVisible ? 1 : 0 })
+        });
+        
+        return this.handleResponse(response);
+    },
+    
     async toggleDocumentVisibility(id) {
         const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENT(id) + '/visibility', {
             method: 'PUT',
@@ -278,6 +396,13 @@ const api = {
         return this.handleResponse(response);
     },
     
+    // File number suggestions for a prefix (public)
+    async autocompleteFileNumbers(prefix) {
+        const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENT_AUTOCOMPLETE + `?prefix=${encodeURIComponent(prefix)}`);
+        
+        return this.handleResponse(response);
+    },
+    
     async queryDocument(fileNumber, inspectionDate) {
         const response = await fetch(API_BASE_URL + API_ENDPOINTS.DOCUMENT_QUERY, {
             method: 'POST',
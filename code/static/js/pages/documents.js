@@ -3,14 +3,33 @@
  */
 
 const documentsPage = {
+    // Rows per page
+    pageSize: 50,
+    
+    // Paging state (cursor for the list, offset for search results)
+    nextCursor: null,
+    nextOffset: null,
+    loading: false,
+    filters: {},
+    observer: null,
+    
     // Render documents page
     render: async function() {
         // Set page title
         ui.setTitle('文档列表');
         
+        // Reset paging state
+        this.nextCursor = null;
+        this.nextOffset = null;
+        this.loading = false;
+        if (this.observer) {
+            this.observer.disconnect();
+            this.observer = null;
+        }
+        
         try {
-            // Get documents
-            const data = await api.getDocuments();
+            // Get first page of documents, or of search results
+            const data = await this.fetchPage({ include_total: 1 });
             const documents = data.documents || [];
             
             // Create page content
@@ -22,6 +41,27 @@ const documentsPage = {
                             <i class="fas fa-upload"></i> 上传文档
                         </a>
                     </div>
+                    <form id="documents-filter" style="display: flex; flex-wrap: wrap; gap: 0.5rem; align-items: flex-end; margin-bottom: 1rem;">
+                        <div class="form-group" style="margin-bottom: 0;">
+                            <label class="form-label" for="filter-q">全文搜索</label>
+                            <input type="search" id="filter-q" class="form-input" placeholder="文件内容、文件名、标题" value="${this.filters.q || ''}">
+                        </div>
+                        <div class="form-group" style="margin-bottom: 0;">
+                            <label class="form-label" for="filter-file-number">文件编号</label>
+                            <input type="text" id="filter-file-number" class="form-input" placeholder="编号前缀" value="${this.filters.file_number || ''}">
+                        </div>
+                        <div class="form-group" style="margin-bottom: 0;">
+                            <label class="form-label" for="filter-date-from">检测日期从</label>
+                            <input type="date" id="filter-date-from" class="form-input" value="${this.filters.date_from || ''}">
+                        </div>
+                        <div class="form-group" style="margin-bottom: 0;">
+                            <label class="form-label" for="filter-date-to">至</label>
+                            <input type="date" id="filter-date-to" class="form-input" value="${this.filters.date_to || ''}">
+                        </div>
+                        <button type="submit" class="btn">
+                            <i class="fas fa-filter"></i> 筛选
+                        </button>
+                    </form>
             `;
             
             // Check if there are documents
@@ -38,10 +78,21 @@ const documentsPage = {
             } else {
                 // Create table
                 content += `
+                    <div style="display: flex; flex-wrap: wrap; justify-content: space-between; align-items: center; gap: 0.5rem; margin-bottom: 0.5rem;">
+                        <p style="margin: 0; color: #666;">共 ${data.total} 个文档</p>
+                        ${this.canManage() && this.hasFilters() ? `
+                        <div id="documents-bulk-actions" style="display: flex; gap: 0.5rem;">
+                            <button class="btn btn-success" data-action="show"><i class="fas fa-eye"></i> 全部显示</button>
+                            <button class="btn btn-warning" data-action="hide"><i class="fas fa-eye-slash"></i> 全部隐藏</button>
+                            <button class="btn btn-danger" data-action="delete"><i class="fas fa-trash"></i> 全部删除</button>
+                        </div>
+                        ` : ''}
+                    </div>
                     <div class="table-container">
                         <table>
                             <thead>
                                 <tr>
+                                    <th>预览</th>
                                     <th>文件编号</th>
                                     <th>文件名</th>
                                     <th>检测日期</th>
@@ -50,46 +101,12 @@ const documentsPage = {
                                     <th>操作</th>
                                 </tr>
                             </thead>
-                            <tbody>
-                `;
-                
-                // Add documents to table
-                documents.forEach(doc => {
-                    content += `
-                        <tr>
-                            <td>${doc.file_number}</td>
-                            <td>${doc.original_filename}</td>
-                            <td>${doc.inspection_date}</td>
-                            <td>${doc.uploader || '-'}</td>
-                            <td>${ui.formatDate(doc.upload_date)}</td>
-                            <td>
-                                <div class="table-actions">
-                                    <a href="${doc.view_url}" target="_blank" class="btn btn-icon" title="查看文档" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
-                                        <i class="fas fa-file-pdf fa-lg" style="margin: 0;"></i>
-                                    </a>
-                                    <button class="btn" title="查看二维码" onclick="documentsPage.showQRCode('${doc.qrcode_url}', '${doc.file_number}')" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
-                                        <i class="fas fa-qrcode" style="margin: 0;"></i>
-                                    </button>
-                                    ${auth.isAdmin() || auth.getUser().role === 'group_admin' ? `
-                                    <button class="btn ${doc.is_visible ? 'btn-success' : 'btn-warning'}" title="${doc.is_visible ? '隐藏文档' : '显示文档'}" onclick="documentsPage.toggleVisibility(${doc.id}, ${doc.is_visible})" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
-                                        <i class="fas ${doc.is_visible ? 'fa-eye' : 'fa-eye-slash'}" style="margin: 0;"></i>
-                                    </button>
-                                    ` : ''}
-                                    ${auth.isAdmin() || auth.getUser().role === 'group_admin' ? `
-                                    <button class="btn btn-danger" title="删除文档" onclick="documentsPage.deleteDocument(${doc.id})" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
-                                        <i class="fas fa-trash" style="margin: 0;"></i>
-                                    </button>
-                                    ` : ''}
-                                </div>
-                            </td>
-                        </tr>
-                    `;
-                });
-                
-                content += `
+                            <tbody id="documents-table-body">
+                                ${documents.map(doc => this.renderRow(doc)).join('')}
                             </tbody>
                         </table>
                     </div>
+                    <div id="documents-sentinel" style="text-align: center; padding: 1rem; color: #666;"></div>
                 `;
             }
             
@@ -97,12 +114,168 @@ const documentsPage = {
             
             // Render content
             ui.render(content);
+            
+            // Apply filters on submit
+            document.getElementById('documents-filter').addEventListener('submit', (event) => {
+                event.preventDefault();
+                this.filters = {
+                    q: document.getElementById('filter-q').value.trim(),
+                    file_number: document.getElementById('filter-file-number').value.trim(),
+                    date_from: document.getElementById('filter-date-from').value,
+                    date_to: document.getElementById('filter-date-to').value
+                };
+                this.render();
+            });
+            
+            // Bulk actions apply to every document matching the filters
+            const bulkActions = document.getElementById('documents-bulk-actions');
+            if (bulkActions) {
+                bulkActions.addEventListener('click', (event) => {
+                    const button = event.target.closest('button[data-action]');
+                    if (button) {
+                        this.bulkAction(button.dataset.action, data.total);
+                    }
+                });
+            }
+            
+            // Load the next page when the bottom of the table scrolls into view
+            const sentinel = document.getElementById('documents-sentinel');
+            if (sentinel) {
+                this.observer = new IntersectionObserver(entries => {
+                    if (entries.some(entry => entry.isIntersecting)) {
+                        this.loadMore();
+                    }
+                });
+                this.observer.observe(sentinel);
+            }
         } catch (error) {
             console.error('Error loading documents:', error);
             ui.showError('加载文档列表失败: ' + error.message, () => this.render());
         }
     },
     
+    // Load next page of documents
+    loadMore: async function() {
+        const sentinel = document.getElementById('documents-sentinel');
+        const tableBody = document.getElementById('documents-table-body');
+        
+        if (!this.nextCursor && this.nextOffset === null) {
+            if (sentinel) {
+                sentinel.textContent = '';
+            }
+            return;
+        }
+        if (this.loading || !tableBody) {
+            return;
+        }
+        
+        this.loading = true;
+        sentinel.textContent = '加载中...';
+        
+        try {
+            const data = await this.fetchPage(this.filters.q ? { offset: this.nextOffset } : { cursor: this.nextCursor });
+            tableBody.insertAdjacentHTML('beforeend', (data.documents || []).map(doc => this.renderRow(doc)).join(''));
+            sentinel.textContent = '';
+        } catch (error) {
+            console.error('Error loading documents:', error);
+            sentinel.textContent = '加载失败: ' + error.message;
+        } finally {
+            this.loading = false;
+        }
+    },
+    
+    // Fetch a page of the list, or of full-text search results when a
+    // search query is set, and remember where the next page starts
+    fetchPage: async function(params) {
+        const filters = Object.fromEntries(Object.entries(this.filters).filter(([, value]) => value));
+        if (filters.q) {
+            const data = await api.searchDocuments({ ...filters, limit: this.pageSize, ...params });
+            this.nextCursor = null;
+            this.nextOffset = data.next_offset ?? null;
+            return data;
+        }
+        
+        const data = await api.getDocuments({ ...filters, limit: this.pageSize, ...params });
+        this.nextCursor = data.next_cursor;
+        this.nextOffset = null;
+        return data;
+    },
+    
+    // Render a table row for a document
+    renderRow: function(doc) {
+        return `
+            <tr>
+                <td>
+                    <a href="${doc.view_url}" target="_blank">
+                        <img src="${doc.thumbnail_url}" alt="${doc.file_number}" loading="lazy" width="48" style="display: block; border: 1px solid #eee; background: white;" onerror="this.style.visibility='hidden'">
+                    </a>
+                </td>
+                <td>${doc.file_number}</td>
+                <td>
+                    ${doc.original_filename}${doc.page_count ? ` <span style="color: #999;">(${doc.page_count} 页)</span>` : ''}
+                    ${doc.snippet ? `<div class="search-snippet" style="color: #666; font-size: 0.85rem; margin-top: 0.25rem;">${doc.snippet}</div>` : ''}
+                </td>
+                <td>${doc.inspection_date}</td>
+                <td>${doc.uploader || '-'}</td>
+                <td>${ui.formatDate(doc.upload_date)}</td>
+                <td>
+                    <div class="table-actions">
+                        <a href="${doc.view_url}" target="_blank" class="btn btn-icon" title="查看文档" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
+                            <i class="fas fa-file-pdf fa-lg" style="margin: 0;"></i>
+                        </a>
+                        <button class="btn" title="查看二维码" onclick="documentsPage.showQRCode('${doc.qrcode_url}', '${doc.file_number}')" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
+                            <i class="fas fa-qrcode" style="margin: 0;"></i>
+                        </button>
+                        ${auth.isAdmin() || auth.getUser().role === 'group_admin' ? `
+                        <button class="btn ${doc.is_visible ? 'btn-success' : 'btn-warning'}" title="${doc.is_visible ? '隐藏文档' : '显示文档'}" onclick="documentsPage.toggleVisibility(${doc.id}, ${doc.is_visible})" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
+                            <i class="fas ${doc.is_visible ? 'fa-eye' : 'fa-eye-slash'}" style="margin: 0;"></i>
+                        </button>
+                        ` : ''}
+                        ${auth.isAdmin() || auth.getUser().role === 'group_admin' ? `
+                        <button class="btn btn-danger" title="删除文档" onclick="documentsPage.deleteDocument(${doc.id})" style="display: inline-flex; align-items: center; justify-content: center; width: 36px; height: 36px; padding: 0; line-height: 36px;">
+                            <i class="fas fa-trash" style="margin: 0;"></i>
+                        </button>
+                        ` : ''}
+                    </div>
+                </td>
+            </tr>
+        `;
+    },
+    
+    // Check if the current user can hide and delete documents
+    canManage: function() {
+        return auth.isAdmin() || auth.getUser().role === 'group_admin';
+    },
+    
+    // Check if any list filter is set (bulk actions don't apply to search results)
+    hasFilters: function() {
+        return !this.filters.q && Object.values(this.filters).some(value => value);
+    },
+    
+    // Show, hide or delete every document matching the current filters
+    bulkAction: function(action, total) {
+        const labels = { show: '显示', hide: '隐藏', delete: '删除' };
+        const filter = Object.fromEntries(Object.entries(this.filters).filter(([, value]) => value));
+        const warning = action === 'delete' ? '此操作不可撤销。' : '';
+        
+        confirmModal(`确定要${labels[action]}筛选出的 ${total} 个文档吗？${warning}`, async () => {
+            try {
+                let count;
+                if (action === 'delete') {
+                    count = (await api.bulkDeleteDocuments({ filter })).deleted;
+                } else {
+                    count = (await api.bulkSetDocumentVisibility({ filter }, action === 'show')).updated;
+                }
+                
+                showSuccess(`已${labels[action]} ${count} 个文档`);
+                this.render();
+            } catch (error) {
+                console.error('Error in bulk action:', error);
+                showError(`批量${labels[action]}失败: ` + error.message);
+            }
+        });
+    },
+    
     // Delete document
     deleteDocument: function(documentId) {
         // Show confirmation modal
@@ -44,6 +44,9 @@ const mobileQueryPage = {
         
         // Focus file number input
         document.getElementById('file_number').focus();
+        
+        // Suggest file numbers and their inspection dates
+        ui.attachFileNumberAutocomplete(document.getElementById('file_number'), document.getElementById('inspection_date'));
 
         // Initialize date picker
         this.initDatePicker('inspection_date');
@@ -120,12 +123,19 @@ const mobileQueryPage = {
                                 <i class="fas fa-calendar-alt"></i>
                                 <span>${document.inspection_date}</span>
                             </div>
+                            ${document.page_count ? `
+                            <div class="meta-item">
+                                <i class="fas fa-copy"></i>
+                                <span>${document.page_count} 页</span>
+                            </div>
+                            ` : ''}
                         </div>
                     </div>
                 </div>
                 
                 <div class="document-content">
                     <div id="loading" class="loading">
+                        <img src="${document.thumbnail_url.replace('?', '?size=large&')}" alt="" style="max-width: 100%; display: block; margin: 0 auto 10px;" onerror="this.remove()">
                         <p>正在加载文档...</p>
                     </div>
                     <div id="error-container" class="error-message" style="display: none;">
@@ -149,8 +159,75 @@ const mobileQueryPage = {
         // Render document details
         ui.render(documentDetails);
         
-        // Load and render PDF
-        this.loadPDF(document.view_url);
+        // Load and render pages
+        this.loadPages(document.id, document.view_url);
+    },
+
+    // Load pages as server-rendered images, falling back to pdf.js
+    loadPages: function(documentId, viewUrl) {
+        document.getElementById('loading').style.display = 'block';
+        document.getElementById('pdf-container').style.display = 'none';
+        document.getElementById('error-container').style.display = 'none';
+
+        fetch(`/api/documents/${documentId}/manifest`).then(function(response) {
+            if (!response.ok) {
+                throw new Error('manifest unavailable');
+            }
+            return response.json();
+        }).then(function(manifest) {
+            if (manifest.formats.indexOf('webp') === -1) {
+                throw new Error('page images unavailable');
+            }
+
+            document.getElementById('loading').style.display = 'none';
+            document.getElementById('pdf-container').style.display = 'flex';
+
+            const canvasContainer = document.getElementById('canvas-container');
+            canvasContainer.innerHTML = '';
+
+            // Size placeholders from the manifest so the layout doesn't jump
+            manifest.pages.forEach(function(page) {
+                const placeholder = document.createElement('div');
+                placeholder.className = 'page-placeholder';
+                placeholder.id = `placeholder-${page.number}`;
+                placeholder.dataset.page = page.number;
+                placeholder.style.height = 'auto';
+                placeholder.style.aspectRatio = `${page.width} / ${page.height}`;
+                placeholder.innerText = `加载页面 ${page.number}...`;
+                canvasContainer.appendChild(placeholder);
+            });
+
+            this.setupImageLoading(manifest);
+        }.bind(this)).catch(function() {
+            this.loadPDF(viewUrl);
+        }.bind(this));
+    },
+
+    // Setup lazy loading for page images
+    setupImageLoading: function(manifest) {
+        const containerWidth = document.getElementById('pdf-viewer').clientWidth - 40;
+        const pixelWidth = Math.round(containerWidth * (window.devicePixelRatio || 1));
+
+        const observer = new IntersectionObserver((entries) => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) {
+                    return;
+                }
+                observer.unobserve(entry.target);
+
+                const pageNum = entry.target.dataset.page;
+                const img = document.createElement('img');
+                img.className = 'page-image';
+                img.alt = `第 ${pageNum} 页`;
+                img.style.aspectRatio = entry.target.style.aspectRatio;
+                img.src = manifest.page_url_template.replace('{number}', pageNum) + `?format=webp&width=${pixelWidth}`;
+                entry.target.replaceWith(img);
+            });
+        }, { root: document.getElementById('pdf-viewer'), rootMargin: '200px 0px' });
+
+        document.querySelectorAll('.page-placeholder').forEach(placeholder => {
+            observer.observe(placeholder);
+        });
     },
 
     // Load and render PDF
@@ -603,6 +680,14 @@ const mobileQueryPage = {
                 height: auto !important;
             }
             
+            .page-image {
+                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                background: white;
+                width: 100%;
+                height: auto;
+                display: block;
+            }
+            
             .page-placeholder {
                 width: 100%;
                 height: 800px;
@@ -55,6 +55,9 @@ const queryPage = {
         
         // Focus file number input
         document.getElementById('file_number').focus();
+        
+        // Suggest file numbers and their inspection dates
+        ui.attachFileNumberAutocomplete(document.getElementById('file_number'), document.getElementById('inspection_date'));
 
         // 优化：自定义日历面板和日期输入
         this.initDatePicker('inspection_date');
@@ -3,6 +3,12 @@
  */
 
 const uploadPage = {
+    // Files larger than this are sent in resumable chunks
+    CHUNKED_UPLOAD_THRESHOLD: 8 * 1024 * 1024,
+    
+    // Attempts per chunk before giving up
+    CHUNK_RETRIES: 5,
+    
     // Render upload page
     render: async function() {
         // Set page title
@@ -41,6 +47,27 @@ const uploadPage = {
                     </button>
                 </form>
             </div>
+            <div class="card">
+                <h2>批量上传</h2>
+                <p style="color: var(--gray-color);">
+                    选择一个 ZIP 压缩包或多个 PDF 文件，并提供 CSV 清单（列：filename, file_number, inspection_date）。
+                    压缩包内包含 manifest.csv 时可不单独选择清单。
+                </p>
+                <form id="bulk-upload-form">
+                    <div class="form-group">
+                        <label for="bulk_files" class="form-label">ZIP 压缩包或 PDF 文件</label>
+                        <input type="file" id="bulk_files" class="form-input" accept=".zip,.pdf" multiple>
+                    </div>
+                    <div class="form-group">
+                        <label for="bulk_manifest" class="form-label">CSV 清单</label>
+                        <input type="file" id="bulk_manifest" class="form-input" accept=".csv">
+                    </div>
+                    <button type="submit" class="btn">
+                        <i class="fas fa-upload"></i> 批量上传
+                    </button>
+                </form>
+                <div id="bulk-upload-report"></div>
+            </div>
         `;
         
         // Render upload form
@@ -48,6 +75,7 @@ const uploadPage = {
         
         // Add event listener to upload form
         document.getElementById('upload-form').addEventListener('submit', this.handleUpload.bind(this));
+        document.getElementById('bulk-upload-form').addEventListener('submit', this.handleBulkUpload.bind(this));
         
         // Add event listener to file input to display file name when selected
         document.getElementById('file').addEventListener('change', function(e) {
@@ -318,14 +346,23 @@ const uploadPage = {
             submitButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> 上传中...';
             submitButton.disabled = true;
             
-            // Create form data
-            const formData = new FormData();
-            formData.append('file_number', fileNumber);
-            formData.append('inspection_date', inspectionDate);
-            formData.append('file', file);
-            
-            // Upload document
-            const data = await api.uploadDocument(formData);
+            let data;
+            if (file.size > this.CHUNKED_UPLOAD_THRESHOLD) {
+                // Large file: resumable chunked upload with progress
+                data = await this.uploadChunked(file, fileNumber, inspectionDate, (sent) => {
+                    const percent = Math.floor(sent * 100 / file.size);
+                    submitButton.innerHTML = `<i class="fas fa-spinner fa-spin"></i> 上传中... ${percent}%`;
+                });
+            } else {
+                // Create form data
+                const formData = new FormData();
+                formData.append('file_number', fileNumber);
+                formData.append('inspection_date', inspectionDate);
+                formData.append('file', file);
+                
+                // Upload document
+                data = await api.uploadDocument(formData);
+            }
             
             // Show success message
             showSuccess('文档上传成功');
@@ -342,6 +379,148 @@ const uploadPage = {
         }
     },
     
+    // Upload a file in chunks, resuming an interrupted upload of the same file
+    uploadChunked: async function(file, fileNumber, inspectionDate, onProgress) {
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        
+        // Resume where a previous attempt stopped, if the server still has it
+        let upload = null;
+        const previousId = localStorage.getItem(resumeKey);
+        if (previousId) {
+            try {
+                upload = await api.getUpload(previousId);
+            } catch (error) {
+                localStorage.removeItem(resumeKey);
+            }
+        }
+        if (!upload) {
+            upload = await api.createUpload(file.name, file.size);
+            localStorage.setItem(resumeKey, upload.upload_id);
+        }
+        
+        let offset = upload.offset;
+        let failures = 0;
+        onProgress(offset);
+        
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            try {
+                // On a 409 the server tells us where to continue
+                const result = await api.uploadChunk(upload.upload_id, offset, chunk);
+                offset = result.offset;
+                failures = 0;
+                onProgress(offset);
+            } catch (error) {
+                failures++;
+                if (failures >= this.CHUNK_RETRIES) {
+                    throw error;
+                }
+                
+                // Wait, then ask the server how much it has received
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                try {
+                    offset = (await api.getUpload(upload.upload_id)).offset;
+                } catch (statusError) {
+                    // Keep the current offset and retry
+                }
+            }
+        }
+        
+        const data = await api.finalizeUpload(upload.upload_id, fileNumber, inspectionDate);
+        localStorage.removeItem(resumeKey);
+        return data;
+    },
+    
+    // Handle bulk upload form submission
+    handleBulkUpload: async function(event) {
+        event.preventDefault();
+        
+        const files = Array.from(document.getElementById('bulk_files').files);
+        const manifest = document.getElementById('bulk_manifest').files[0];
+        const archive = files.find(file => file.name.toLowerCase().endsWith('.zip'));
+        
+        if (files.length === 0) {
+            showError('请选择 ZIP 压缩包或 PDF 文件');
+            return;
+        }
+        
+        if (archive && files.length > 1) {
+            showError('一次只能上传一个 ZIP 压缩包');
+            return;
+        }
+        
+        if (!archive && !manifest) {
+            showError('上传多个 PDF 文件时请选择 CSV 清单');
+            return;
+        }
+        
+        const formData = new FormData();
+        if (archive) {
+            formData.append('archive', archive);
+        } else {
+            files.forEach(file => formData.append('files', file));
+        }
+        if (manifest) {
+            formData.append('manifest', manifest);
+        }
+        
+        const submitButton = event.target.querySelector('button[type="submit"]');
+        const originalText = submitButton.innerHTML;
+        try {
+            submitButton.innerHTML = '<i class="fas fa-spinner fa-spin"></i> 上传中...';
+            submitButton.disabled = true;
+            
+            const data = await api.bulkUploadDocuments(formData);
+            if (data.failed === 0) {
+                showSuccess(`${data.created} 个文档上传成功`);
+            } else {
+                showError(`${data.created} 个文档上传成功，${data.failed} 个失败`);
+            }
+            this.showBulkReport(data);
+        } catch (error) {
+            console.error('Bulk upload error:', error);
+            showError('上传失败: ' + error.message);
+        } finally {
+            submitButton.innerHTML = originalText;
+            submitButton.disabled = false;
+        }
+    },
+    
+    // Show the per-item result of a bulk upload
+    showBulkReport: function(data) {
+        const escape = (value) => String(value ?? '').replace(/[&<>"']/g, (c) => `&#${c.charCodeAt(0)};`);
+        const rows = data.results.map(result => `
+            <tr>
+                <td>${result.index + 1}</td>
+                <td>${escape(result.filename)}</td>
+                <td>${escape(result.file_number)}</td>
+                <td>${escape(result.inspection_date)}</td>
+                <td>
+                    ${result.status === 'created'
+                        ? `<a href="${result.document.view_url}" target="_blank" style="color: var(--success-color);">成功</a>`
+                        : `<span style="color: var(--danger-color);">${escape(result.error)}</span>`}
+                </td>
+            </tr>
+        `).join('');
+        
+        document.getElementById('bulk-upload-report').innerHTML = `
+            <div class="table-container" style="margin-top: 1.5rem;">
+                <table>
+                    <thead>
+                        <tr>
+                            <th>#</th>
+                            <th>文件名</th>
+                            <th>报告编号</th>
+                            <th>检测日期</th>
+                            <th>结果</th>
+                        </tr>
+                    </thead>
+                    <tbody>${rows}</tbody>
+                </table>
+            </div>
+        `;
+    },
+    
     // Show upload success
     showUploadSuccess: function(data) {
         const document = data.document;
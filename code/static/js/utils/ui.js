@@ -31,6 +31,76 @@ const ui = {
         this.mainContent.innerHTML = content;
     },
     
+    // Suggest file numbers while the user types, and offer the inspection
+    // dates of the chosen number (filled in when there is only one)
+    attachFileNumberAutocomplete(fileNumberInput, dateInput) {
+        const list = document.createElement('datalist');
+        list.id = `${fileNumberInput.id}-suggestions`;
+        fileNumberInput.setAttribute('list', list.id);
+        fileNumberInput.setAttribute('autocomplete', 'off');
+        
+        const hint = document.createElement('div');
+        hint.className = 'inspection-date-hint';
+        hint.style.cssText = 'margin-top: 0.25rem; font-size: 0.85rem; color: var(--gray-color);';
+        fileNumberInput.after(list, hint);
+        
+        let dates = {};
+        let timer = null;
+        
+        const showDates = (fileNumber) => {
+            hint.innerHTML = '';
+            const available = dates[fileNumber];
+            if (!available || available.length === 0) {
+                return;
+            }
+            
+            if (available.length === 1 && !dateInput.value) {
+                dateInput.value = available[0];
+            }
+            
+            hint.append('检测日期：');
+            available.forEach(date => {
+                const link = document.createElement('a');
+                link.href = '#';
+                link.textContent = date;
+                link.style.marginRight = '0.5rem';
+                link.addEventListener('click', (event) => {
+                    event.preventDefault();
+                    dateInput.value = date;
+                });
+                hint.appendChild(link);
+            });
+        };
+        
+        fileNumberInput.addEventListener('input', () => {
+            const prefix = fileNumberInput.value.trim();
+            showDates(prefix);
+            
+            clearTimeout(timer);
+            if (prefix.length < 2) {
+                return;
+            }
+            
+            // Wait for a pause in typing
+            timer = setTimeout(async () => {
+                try {
+                    const data = await api.autocompleteFileNumbers(prefix);
+                    dates = {};
+                    list.innerHTML = '';
+                    data.suggestions.forEach(suggestion => {
+                        dates[suggestion.file_number] = suggestion.inspection_dates || [];
+                        const option = document.createElement('option');
+                        option.value = suggestion.file_number;
+                        list.appendChild(option);
+                    });
+                    showDates(fileNumberInput.value.trim());
+                } catch (error) {
+                    // Suggestions are optional (e.g. while throttled)
+                }
+            }, 150);
+        });
+    },
+    
     // Format date
     formatDate(dateString) {
         if (!dateString) return '';
@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+
+# Import the app's packages (api, ...) from the code directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import auth, db, storage, workers
+
+# Smallest body the upload endpoints accept as a PDF
+PDF_DATA = b'%PDF-1.4\n%%EOF\n'
+
+# The Flask app, imported once. app.py creates its directories and database
+# relative to the working directory, so import it from a scratch directory.
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(str(tmp_path_factory.mktemp('import')))
+    try:
+        from app import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+# The app with a fresh database and storage under tmp_path. Background
+# tasks are refused, so artifacts are generated on demand and nothing runs
+# after a test has finished.
+@pytest.fixture
+def app(flask_app, tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'documents.db')
+    db.bootstrap_schema(db_path)
+    monkeypatch.setattr(db, 'DB_PATH', db_path)
+    monkeypatch.setattr(flask_app, 'root_path', str(tmp_path))
+    monkeypatch.setitem(flask_app.config, 'TESTING', True)
+    monkeypatch.setattr(workers, 'submit', lambda fn, *args: False)
+    storage.configure(str(tmp_path), {'STORAGE_BACKEND': 'local'})
+    db.reset_pool()
+    auth.clear_token_cache()
+    yield flask_app
+    db.reset_pool()
+    auth.clear_token_cache()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+# Log in and return the Authorization header of the token
+def login(client, username, password):
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+# Authorization header of the default admin
+@pytest.fixture
+def admin_headers(client):
+    return login(client, 'admin', 'admin')
@@ -0,0 +1,97 @@
+import time
+import hashlib
+import pytest
+from api import auth
+from conftest import login
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    auth.clear_token_cache()
+    yield
+    auth.clear_token_cache()
+
+def make_token(user_id=1, username='admin'):
+    return auth.generate_token(user_id, username, username == 'admin', 'admin')
+
+def test_cache_hit(monkeypatch):
+    token = make_token()
+    before = auth.get_token_cache_stats()
+    first = auth.verify_token(token)
+
+    # A hit doesn't decode the token again
+    monkeypatch.setattr(auth.jwt, 'decode', lambda *args, **kwargs: pytest.fail('token decoded again'))
+    assert auth.verify_token(token) == first
+
+    stats = auth.get_token_cache_stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 1
+
+def test_expired_token_rejected_on_cache_hit():
+    # Cached while it was valid, expired since
+    exp = int(time.time()) - 1
+    payload = {'user_id': 1, 'username': 'admin', 'is_admin': True, 'role': 'admin', 'exp': exp}
+    token = auth.jwt.encode(payload, auth.JWT_SECRET, algorithm='HS256')
+    auth._token_cache[hashlib.sha256(token.encode('utf-8')).digest()] = payload
+
+    before = auth.get_token_cache_stats()
+    assert auth.verify_token(token) is None
+
+    stats = auth.get_token_cache_stats()
+    assert stats['hits'] == before['hits']
+    assert stats['size'] == 0
+
+def test_invalid_tokens_are_not_cached():
+    assert auth.verify_token(make_token() + 'x') is None
+    assert auth.verify_token('not a token') is None
+    assert auth.get_token_cache_stats()['size'] == 0
+
+def test_lru_evicts_at_cache_size(monkeypatch):
+    monkeypatch.setattr(auth, 'TOKEN_CACHE_SIZE', 3)
+    tokens = [make_token(user_id) for user_id in range(1, 5)]
+    before = auth.get_token_cache_stats()
+
+    for token in tokens[:3]:
+        auth.verify_token(token)
+    # Use the oldest entry again, so the second is now least recently used
+    auth.verify_token(tokens[0])
+    auth.verify_token(tokens[3])
+
+    stats = auth.get_token_cache_stats()
+    assert stats['size'] == 3
+    assert stats['evictions'] - before['evictions'] == 1
+
+    # tokens[0], [2] and [3] are hits, the evicted tokens[1] is a miss
+    for token in (tokens[0], tokens[2], tokens[3]):
+        auth.verify_token(token)
+    assert auth.get_token_cache_stats()['hits'] - stats['hits'] == 3
+    auth.verify_token(tokens[1])
+    assert auth.get_token_cache_stats()['misses'] - stats['misses'] == 1
+
+# A change to a user's membership bumps the version, so tokens issued
+# before it (still served from the cache) get the stored claims
+def test_membership_change_reloads_claims(client, admin_headers):
+    response = client.post('/api/groups', headers=admin_headers, json={'group_name': 'Lab'})
+    assert response.status_code == 201
+    group_id = response.get_json()['group_id']
+
+    response = client.post('/api/users', headers=admin_headers, json={'username': 'bob', 'password': 'secret'})
+    user_id = response.get_json()['user_id']
+    headers = login(client, 'bob', 'secret')
+
+    assert client.get('/api/auth/verify', headers=headers).get_json()['user']['role'] == 'user'
+    assert client.get('/api/users', headers=headers).get_json()['users'] == []
+
+    response = client.put('/api/users/{}'.format(user_id), headers=admin_headers,
+                          json={'role': 'group_admin', 'group_id': group_id})
+    assert response.status_code == 200
+
+    before = auth.get_token_cache_stats()
+    assert client.get('/api/auth/verify', headers=headers).get_json()['user']['role'] == 'group_admin'
+    assert auth.get_token_cache_stats()['hits'] - before['hits'] == 1
+    users = client.get('/api/users', headers=headers).get_json()['users']
+    assert [(u['username'], u['group_id']) for u in users] == [('bob', group_id)]
+
+    # Deleting the user invalidates the token
+    assert client.delete('/api/users/{}'.format(user_id), headers=admin_headers).status_code == 200
+    assert client.get('/api/auth/verify', headers=headers).get_json()['valid'] is False
+    assert client.get('/api/users', headers=headers).status_code == 401
@@ -0,0 +1,200 @@
+import io
+import os
+import hashlib
+import zipfile
+import pytest
+from api import bulk, documents
+from api.files import UPLOAD_STAGING_DIR
+from api.storage import content_filename, get_storage
+
+PDF_A = b'%PDF-1.4\n% a\n%%EOF\n'
+PDF_B = b'%PDF-1.4\n% b\n%%EOF\n'
+PDF_C = b'%PDF-1.4\n% c\n%%EOF\n'
+
+def manifest(*rows):
+    lines = ['filename,file_number,inspection_date'] + [','.join(row) for row in rows]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+def post_bulk(client, headers, data, query=''):
+    return client.post('/api/documents/bulk' + query, headers=headers, data=data,
+                       content_type='multipart/form-data')
+
+def post_archive(client, headers, entries, query=''):
+    return post_bulk(client, headers, {'archive': (io.BytesIO(make_zip(entries)), 'batch.zip')}, query)
+
+def file_numbers(client, headers):
+    return sorted(d['file_number'] for d in client.get('/api/documents', headers=headers).get_json()['documents'])
+
+def statuses(response):
+    return [(result['file_number'], result['status']) for result in response.get_json()['results']]
+
+def test_archive_with_manifest_inside(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('sub/b.pdf', 'B1', '2024-01-02')),
+        'a.pdf': PDF_A,
+        'sub/b.pdf': PDF_B,
+    })
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (2, 0)
+
+    results = body['results']
+    assert [result['index'] for result in results] == [0, 1]
+    view = client.get('/api/documents/{}/view'.format(results[1]['document']['id']))
+    assert view.get_data() == PDF_B
+    assert file_numbers(client, admin_headers) == ['A1', 'B1']
+
+def test_archive_with_separate_gbk_manifest(client, admin_headers):
+    # Excel in Chinese locales saves GBK; rows are matched to entries in
+    # subdirectories by base name
+    data = {
+        'manifest': (io.BytesIO('filename,file_number,inspection_date\n报告.pdf,GB-1,2024-01-01\n'.encode('gbk')),
+                     'manifest.csv'),
+        'archive': (io.BytesIO(make_zip({'docs/报告.pdf': PDF_A})), 'batch.zip'),
+    }
+    response = post_bulk(client, admin_headers, data)
+    assert response.status_code == 201
+    assert response.get_json()['results'][0]['filename'] == '报告.pdf'
+    assert file_numbers(client, admin_headers) == ['GB-1']
+
+def test_files_with_form_fields(client, admin_headers):
+    data = {
+        'files': [(io.BytesIO(PDF_A), 'a.pdf'), (io.BytesIO(PDF_B), 'b.pdf')],
+        'file_number': ['A1', 'B1'],
+        'inspection_date': ['2024-01-01', '2024-01-02'],
+    }
+    response = post_bulk(client, admin_headers, data)
+    assert response.status_code == 201
+    assert statuses(response) == [('A1', 'created'), ('B1', 'created')]
+
+def test_partial_success_is_multi_status(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('missing.pdf', 'M1', '2024-01-01'),
+                                 ('b.pdf', 'B 1', '2024-01-01')),
+        'a.pdf': PDF_A,
+        'b.pdf': PDF_B,
+    })
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (1, 2)
+    assert statuses(response) == [('A1', 'created'), ('M1', 'failed'), ('B 1', 'failed')]
+    assert body['results'][1]['error'] == 'File not found in upload'
+    assert file_numbers(client, admin_headers) == ['A1']
+
+def test_nothing_valid_is_bad_request(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('missing.pdf', 'M1', '2024-01-01')),
+        'a.pdf': PDF_A,
+    })
+    assert response.status_code == 400
+    assert statuses(response) == [('M1', 'failed')]
+
+@pytest.mark.parametrize('data, error', [
+    ({'archive': (io.BytesIO(b'not a zip'), 'batch.zip')}, 'Archive is not a valid ZIP file'),
+    ({'archive': (io.BytesIO(make_zip({'a.pdf': PDF_A})), 'batch.zip')}, 'A manifest is required'),
+    ({'manifest': (io.BytesIO(b'filename,file_number\na.pdf,A1\n'), 'manifest.csv'),
+      'files': [(io.BytesIO(PDF_A), 'a.pdf')]}, 'Manifest is missing columns: inspection_date'),
+    ({'files': [(io.BytesIO(PDF_A), 'a.pdf')], 'file_number': ['A1']}, 'Send a manifest'),
+    ({}, 'No files'),
+])
+def test_malformed_request(client, admin_headers, data, error):
+    response = post_bulk(client, admin_headers, data)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith(error)
+
+def test_atomic_uploads_nothing_on_any_error(app, client, admin_headers):
+    entries = {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('missing.pdf', 'M1', '2024-01-01')),
+        'a.pdf': PDF_A,
+    }
+    response = post_archive(client, admin_headers, entries, '?atomic=1')
+    assert response.status_code == 400
+    assert response.get_json()['created'] == 0
+    assert file_numbers(client, admin_headers) == []
+    assert not get_storage('uploads').exists(content_filename(hashlib.sha256(PDF_A).hexdigest()))
+
+    # Without atomic the valid item is uploaded
+    assert post_archive(client, admin_headers, entries).status_code == 207
+
+def test_atomic_all_valid(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('b.pdf', 'B1', '2024-01-01')),
+        'a.pdf': PDF_A,
+        'b.pdf': PDF_B,
+    }, '?atomic=1')
+    assert response.status_code == 201
+    assert file_numbers(client, admin_headers) == ['A1', 'B1']
+
+def test_file_number_repeated_in_batch(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('b.pdf', 'A1', '2024-01-02')),
+        'a.pdf': PDF_A,
+        'b.pdf': PDF_B,
+    })
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['created', 'failed']
+    assert results[1]['error'] == 'File number is repeated in this upload'
+
+def test_file_number_existing_in_database(client, admin_headers):
+    entries = {'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01')), 'a.pdf': PDF_A}
+    assert post_archive(client, admin_headers, entries).status_code == 201
+
+    entries = {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-02-01'), ('b.pdf', 'B1', '2024-02-01')),
+        'a.pdf': PDF_A,
+        'b.pdf': PDF_B,
+    }
+    response = post_archive(client, admin_headers, entries)
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['failed', 'created']
+    assert results[0]['error'] == 'File number already exists in your group'
+
+def test_rows_sharing_a_file(client, admin_headers):
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01'), ('a.pdf', 'A2', '2024-01-02')),
+        'a.pdf': PDF_A,
+    })
+    assert response.status_code == 201
+    ids = [result['document']['id'] for result in response.get_json()['results']]
+    assert len(set(ids)) == 2
+    for document_id in ids:
+        assert client.get('/api/documents/{}/view'.format(document_id)).get_data() == PDF_A
+
+# A failure while storing rolls everything back and removes only the
+# content this upload added, never content shared with other documents
+def test_failure_removes_only_new_content(app, client, admin_headers, monkeypatch):
+    entries = {'manifest.csv': manifest(('a.pdf', 'A1', '2024-01-01')), 'a.pdf': PDF_A}
+    assert post_archive(client, admin_headers, entries).status_code == 201
+
+    calls = []
+    def failing_store_content(path, digest):
+        calls.append(digest)
+        if len(calls) == 3:
+            raise OSError('disk full')
+        return documents.store_content(path, digest)
+    monkeypatch.setattr(bulk, 'store_content', failing_store_content)
+
+    response = post_archive(client, admin_headers, {
+        'manifest.csv': manifest(('a.pdf', 'A2', '2024-01-01'), ('b.pdf', 'B1', '2024-01-01'),
+                                 ('c.pdf', 'C1', '2024-01-01')),
+        'a.pdf': PDF_A,
+        'b.pdf': PDF_B,
+        'c.pdf': PDF_C,
+    })
+    assert response.status_code == 500
+    assert [result['status'] for result in response.get_json()['results']] == ['failed'] * 3
+    assert file_numbers(client, admin_headers) == ['A1']
+
+    store = get_storage('uploads')
+    for data, kept in ((PDF_A, True), (PDF_B, False), (PDF_C, False)):
+        assert store.exists(content_filename(hashlib.sha256(data).hexdigest())) == kept
+    assert os.listdir(os.path.join(app.root_path, UPLOAD_STAGING_DIR)) == []
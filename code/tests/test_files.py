@@ -0,0 +1,132 @@
+import io
+import pytest
+from flask import Flask
+from api.files import send_stored_file
+
+DATA = b'%PDF-1.4\n' + bytes(range(256)) * 16 + b'\n%%EOF\n'
+
+# App sending one file from tmp_path at /file, offloaded as ab/cd/abcd.pdf
+@pytest.fixture
+def file_app(tmp_path):
+    path = tmp_path / 'abcd.pdf'
+    path.write_bytes(DATA)
+
+    app = Flask(__name__)
+    app.config['FILE_OFFLOAD_PREFIX'] = '/protected/uploads/'
+
+    @app.route('/file')
+    def send():
+        return send_stored_file(str(path), 'ab/cd/abcd.pdf', 'application/pdf', 'inline; filename="abcd.pdf"')
+
+    app.file_path = str(path)
+    return app
+
+@pytest.fixture
+def file_client(file_app):
+    return file_app.test_client()
+
+def test_full_response(file_client):
+    response = file_client.get('/file')
+    assert response.status_code == 200
+    assert response.get_data() == DATA
+    assert response.headers['Content-Length'] == str(len(DATA))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Disposition'] == 'inline; filename="abcd.pdf"'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.headers['ETag'] and response.headers['Last-Modified']
+
+def test_not_modified(file_client):
+    first = file_client.get('/file')
+
+    response = file_client.get('/file', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == first.headers['ETag']
+
+    response = file_client.get('/file', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 304
+
+    response = file_client.get('/file', headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=10-19', 10, 19),
+    ('bytes=-16', len(DATA) - 16, len(DATA) - 1),
+    ('bytes=4000-', 4000, len(DATA) - 1),
+    ('bytes=0-999999', 0, len(DATA) - 1),
+])
+def test_single_range(file_client, header, start, end):
+    response = file_client.get('/file', headers={'Range': header})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes {}-{}/{}'.format(start, end, len(DATA))
+    assert response.headers['Content-Length'] == str(end - start + 1)
+    assert response.get_data() == DATA[start:end + 1]
+
+def test_unsatisfiable_range(file_client):
+    response = file_client.get('/file', headers={'Range': 'bytes={}-'.format(len(DATA))})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */{}'.format(len(DATA))
+    assert response.get_data() == b''
+
+@pytest.mark.parametrize('header', ['bytes=0-9,20-29', 'pages=1-2'])
+def test_ignored_ranges(file_client, header):
+    # Multiple ranges and other units get the whole file
+    response = file_client.get('/file', headers={'Range': header})
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+    assert response.get_data() == DATA
+
+def test_if_range(file_client):
+    etag = file_client.get('/file').headers['ETag']
+
+    response = file_client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.get_data() == DATA[:10]
+
+    # The file changed since the client's copy: send all of it
+    response = file_client.get('/file', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.get_data() == DATA
+
+def test_x_accel_redirect(file_app, file_client):
+    file_app.config['FILE_OFFLOAD_MODE'] = 'x-accel-redirect'
+    response = file_client.get('/file', headers={'Range': 'bytes=0-9'})
+
+    # nginx sends the body and handles the range
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/protected/uploads/ab/cd/abcd.pdf'
+    assert response.get_data() == b''
+    assert response.headers['Content-Type'] == 'application/pdf'
+    assert response.headers['ETag']
+
+    # Conditional requests are still answered by the app
+    response = file_client.get('/file', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert 'X-Accel-Redirect' not in response.headers
+
+def test_x_sendfile(file_app, file_client):
+    file_app.config['FILE_OFFLOAD_MODE'] = 'x-sendfile'
+    response = file_client.get('/file')
+    assert response.status_code == 200
+    assert response.headers['X-Sendfile'] == file_app.file_path
+    assert response.get_data() == b''
+
+def test_missing_file(file_app, tmp_path):
+    with file_app.test_request_context():
+        assert send_stored_file(str(tmp_path / 'missing.pdf'), None, 'application/pdf') is None
+
+# The document view route offloads the content-addressed file
+def test_document_view_offload(app, client, admin_headers, monkeypatch):
+    response = client.post('/api/documents', headers=admin_headers, content_type='multipart/form-data', data={
+        'file_number': 'A1', 'inspection_date': '2024-01-01', 'file': (io.BytesIO(DATA), 'a.pdf')})
+    assert response.status_code == 201
+    document = response.get_json()['document']
+
+    response = client.get('/api/documents/{}/view'.format(document['id']), headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.get_data() == DATA[:10]
+
+    monkeypatch.setitem(app.config, 'FILE_OFFLOAD_MODE', 'x-accel-redirect')
+    response = client.get('/api/documents/{}/view'.format(document['id']))
+    assert response.headers['X-Accel-Redirect'] == app.config['FILE_OFFLOAD_PREFIX'].rstrip('/') + '/' + document['filename']
+    assert response.get_data() == b''
@@ -0,0 +1,27 @@
+import sqlite3
+import pytest
+from api.db import bootstrap_schema
+from api.migrations import MIGRATIONS, HOT_QUERIES, get_schema_version, check_query_plans
+
+# Freshly created and migrated database
+@pytest.fixture
+def conn(tmp_path):
+    db_path = str(tmp_path / 'documents.db')
+    bootstrap_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+def test_migrations_applied(conn):
+    assert get_schema_version(conn) == MIGRATIONS[-1][0]
+
+def test_hot_queries_use_indexes(conn):
+    regressions = check_query_plans(conn)
+    assert regressions == [], '\n'.join(
+        '{}: {}'.format(name, '; '.join(details)) for name, details in regressions)
+
+# The check itself must notice a query falling back to a full table scan
+def test_missing_index_is_reported(conn):
+    conn.execute('DROP INDEX idx_documents_lookup')
+    names = [name for name, _ in check_query_plans(conn)]
+    assert 'query_document' in names
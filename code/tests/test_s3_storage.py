@@ -0,0 +1,93 @@
+import os
+import pytest
+from flask import Flask
+from api import storage
+from api.files import send_stored_object
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+BUCKET = 'docnest-test'
+DATA = b'%PDF-1.4\n' + bytes(range(256)) * 1024 + b'\n%%EOF\n'
+
+# Uploads store of the s3 backend against an in-process S3 (moto)
+@pytest.fixture
+def store(monkeypatch):
+    for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SECURITY_TOKEN', 'AWS_SESSION_TOKEN'):
+        monkeypatch.setenv(variable, 'testing')
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        storage.configure('/unused', {
+            'STORAGE_BACKEND': 's3',
+            'STORAGE_S3_BUCKET': BUCKET,
+            'STORAGE_S3_PREFIX': 'prod/',
+            'STORAGE_S3_REGION': 'us-east-1',
+            'STORAGE_S3_PRESIGN': True,
+            'STORAGE_S3_PRESIGN_EXPIRES': 300,
+        })
+        yield storage.get_storage('uploads')
+    storage.configure(None, {'STORAGE_BACKEND': 'local'})
+
+@pytest.fixture
+def stored(store, tmp_path):
+    source = tmp_path / 'upload.pdf'
+    source.write_bytes(DATA)
+    store.put_file('ab/cd/abcd.pdf', str(source))
+    assert not source.exists()
+    return 'ab/cd/abcd.pdf'
+
+def test_put_file_uses_prefixed_key(store, stored):
+    client = boto3.client('s3', region_name='us-east-1')
+    keys = [item['Key'] for item in client.list_objects_v2(Bucket=BUCKET)['Contents']]
+    assert keys == ['prod/uploads/ab/cd/abcd.pdf']
+    assert store.get(stored) == DATA
+
+def test_stream_and_range(store, stored):
+    assert b''.join(store.stream(stored)) == DATA
+    assert store.range(stored, 100, 50) == DATA[100:150]
+
+def test_stat(store, stored):
+    size, etag, last_modified = store.stat(stored)
+    assert size == len(DATA)
+    assert etag and not etag.startswith('"')
+    assert last_modified is not None
+
+def test_missing_objects(store):
+    assert store.get('ab/cd/missing.pdf') is None
+    assert store.stream('ab/cd/missing.pdf') is None
+    assert store.stat('ab/cd/missing.pdf') is None
+    assert not store.exists('ab/cd/missing.pdf')
+
+def test_presigned_url(store, stored):
+    url = store.url(stored, 'application/pdf', 'inline; filename="abcd.pdf"')
+    assert url.startswith('https://')
+    assert 'prod/uploads/ab/cd/abcd.pdf' in url
+    assert 'X-Amz-Signature=' in url and 'X-Amz-Expires=300' in url
+    assert 'response-content-type=application%2Fpdf' in url
+
+    # The URL is valid for the object (moto also answers plain HTTP
+    # requests made with requests)
+    requests = pytest.importorskip('requests')
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers['Content-Type'] == 'application/pdf'
+
+def test_delete(store, stored):
+    store.delete(stored)
+    assert not store.exists(stored)
+    # Deleting a missing object is not an error
+    store.delete(stored)
+
+def test_send_stored_object_range(store, stored):
+    app = Flask(__name__)
+    with app.test_request_context(headers={'Range': 'bytes=10-19'}):
+        response = send_stored_object(store, stored, 'application/pdf')
+        assert response.status_code == 206
+        assert response.content_range.to_header() == 'bytes 10-19/{}'.format(len(DATA))
+        assert b''.join(response.response) == DATA[10:20]
+
+    with app.test_request_context():
+        response = send_stored_object(store, stored, 'application/pdf')
+        assert response.status_code == 200
+        assert b''.join(response.response) == DATA
@@ -0,0 +1,129 @@
+import os
+import hashlib
+import pytest
+from api import uploads
+from api.files import UPLOAD_STAGING_DIR
+from conftest import login
+
+DATA = b'%PDF-1.4\n' + bytes(range(256)) * 64 + b'\n%%EOF\n'
+CHUNK = 4096
+
+def start_upload(client, headers, size=len(DATA)):
+    response = client.post('/api/uploads', headers=headers, json={'filename': 'report.pdf', 'size': size})
+    assert response.status_code == 201
+    return response.get_json()['upload_id']
+
+def put_chunk(client, headers, upload_id, offset, data):
+    return client.put('/api/uploads/{}?offset={}'.format(upload_id, offset), headers=headers, data=data)
+
+def finalize(client, headers, upload_id, **fields):
+    body = {'file_number': 'A1', 'inspection_date': '2024-01-01'}
+    body.update(fields)
+    return client.post('/api/uploads/{}/finalize'.format(upload_id), headers=headers, json=body)
+
+# Upload data in CHUNK sized pieces
+def put_all(client, headers, upload_id, data, start=0):
+    for offset in range(start, len(data), CHUNK):
+        response = put_chunk(client, headers, upload_id, offset, data[offset:offset + CHUNK])
+        assert response.status_code == 200, response.get_json()
+    return response
+
+@pytest.fixture(autouse=True)
+def clear_hashers():
+    uploads._hashers.clear()
+    yield
+    uploads._hashers.clear()
+
+def test_chunked_upload_creates_document(client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    response = put_all(client, admin_headers, upload_id, DATA)
+    assert response.get_json() == {'offset': len(DATA), 'size': len(DATA)}
+
+    response = finalize(client, admin_headers, upload_id, sha256=hashlib.sha256(DATA).hexdigest())
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert body['document']['file_number'] == 'A1'
+
+    response = client.get('/api/documents/{}/view'.format(body['document']['id']))
+    assert response.get_data() == DATA
+
+    # The session is gone once the document exists
+    assert client.get('/api/uploads/' + upload_id, headers=admin_headers).status_code == 404
+
+def test_out_of_order_offset_is_rejected(client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    assert put_chunk(client, admin_headers, upload_id, 0, DATA[:CHUNK]).status_code == 200
+
+    # Skipping ahead and repeating a chunk both report where to resume
+    for offset in (2 * CHUNK, 0):
+        response = put_chunk(client, admin_headers, upload_id, offset, DATA[offset:offset + CHUNK])
+        assert response.status_code == 409
+        assert response.get_json()['offset'] == CHUNK
+
+    response = client.get('/api/uploads/' + upload_id, headers=admin_headers)
+    assert response.get_json()['offset'] == CHUNK
+
+def test_resume_after_hasher_eviction(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(uploads, 'UPLOAD_HASHER_CACHE_SIZE', 1)
+    upload_id = start_upload(client, admin_headers)
+    put_all(client, admin_headers, upload_id, DATA[:2 * CHUNK])
+
+    # Another upload pushes this one's hash state out of the cache
+    other_id = start_upload(client, admin_headers)
+    assert put_chunk(client, admin_headers, other_id, 0, DATA[:CHUNK]).status_code == 200
+    assert upload_id not in uploads._hashers
+
+    offset = client.get('/api/uploads/' + upload_id, headers=admin_headers).get_json()['offset']
+    assert offset == 2 * CHUNK
+    put_all(client, admin_headers, upload_id, DATA, start=offset)
+
+    response = finalize(client, admin_headers, upload_id, sha256=hashlib.sha256(DATA).hexdigest())
+    assert response.status_code == 201
+    assert response.get_json()['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+def test_finalize_rejects_checksum_mismatch(client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    put_all(client, admin_headers, upload_id, DATA)
+
+    response = finalize(client, admin_headers, upload_id, sha256='0' * 64)
+    assert response.status_code == 422
+    assert response.get_json()['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+    # Nothing was created and the upload can still be finalized
+    assert client.get('/api/documents', headers=admin_headers).get_json()['documents'] == []
+    assert finalize(client, admin_headers, upload_id).status_code == 201
+
+def test_finalize_incomplete_upload(client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    put_chunk(client, admin_headers, upload_id, 0, DATA[:CHUNK])
+
+    response = finalize(client, admin_headers, upload_id)
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == CHUNK
+
+def test_chunk_beyond_declared_size(client, admin_headers):
+    upload_id = start_upload(client, admin_headers, size=CHUNK)
+    response = put_chunk(client, admin_headers, upload_id, 0, DATA[:CHUNK + 1])
+    assert response.status_code == 400
+    assert response.get_json()['offset'] == 0
+
+def test_delete_removes_staging_files(app, client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    put_chunk(client, admin_headers, upload_id, 0, DATA[:CHUNK])
+
+    response = client.delete('/api/uploads/' + upload_id, headers=admin_headers)
+    assert response.status_code == 200
+    assert os.listdir(os.path.join(app.root_path, UPLOAD_STAGING_DIR)) == []
+    assert upload_id not in uploads._hashers
+    assert put_chunk(client, admin_headers, upload_id, CHUNK, DATA[CHUNK:2 * CHUNK]).status_code == 404
+
+def test_upload_of_another_user_is_not_found(client, admin_headers):
+    upload_id = start_upload(client, admin_headers)
+    response = client.post('/api/users', headers=admin_headers, json={'username': 'bob', 'password': 'secret'})
+    assert response.status_code == 201
+
+    headers = login(client, 'bob', 'secret')
+    assert client.get('/api/uploads/' + upload_id, headers=headers).status_code == 404
+    assert put_chunk(client, headers, upload_id, 0, DATA[:CHUNK]).status_code == 404
+    assert client.delete('/api/uploads/' + upload_id, headers=headers).status_code == 404